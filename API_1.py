@@ -1,348 +1,411 @@
-import requests 
-import json 
-import os 
-import time 
+import contextvars
+import requests
+import http_pool
+import meta_cache
+import metrics
+import log_system
+import rate_limit
+import retry_policy
+import router
+import json
+import os
+import time
 import re
-from urllib3.exceptions import InsecureRequestWarning
-from datetime import datetime
-from typing import Dict, Any, Optional, List
-
-requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple
 
 # 日志颜色
-LOG_COLORS = {
-    "DEBUG": "\033[90m",     # 灰色
-    "INFO": "\033[94m",      # 蓝色
-    "SUCCESS": "\033[92m",   # 绿色
-    "WARNING": "\033[93m",   # 黄色
-    "ERROR": "\033[91m",     # 红色
-    "END": "\033[0m"         # 重置颜色
-}
+LOG_COLORS = log_system.LOG_COLORS
+
+API_URL = "https://wyapi-{interface}.toubiec.cn/api/music/{endpoint}"
+
+# 本次运行内的搜索结果页，键为 (接口, 关键词, 页码)
+_search_pages: Dict[Tuple[int, str, int], Dict[str, Any]] = {}
+_search_prefetch: Dict[Tuple[int, str, int], Future] = {}
+_search_lock = threading.Lock()
+_prefetch_executor: Optional[ThreadPoolExecutor] = None
 
 def log(level: str, message: str, module: str = "API1"):
     """API1日志函数"""
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    color = LOG_COLORS.get(level.upper(), LOG_COLORS["INFO"])
-    print(f"{color}[{timestamp}] [{module:8}] {message}{LOG_COLORS['END']}")
+    log_system.log(level, message, module)
+
+# ============= 请求与解析 =============
+def check_result(result: Dict[str, Any], action: str) -> Optional[Any]:
+    """检查接口返回，成功返回data字段"""
+    if result.get("code") != 200 or not result.get("data"):
+        log("ERROR", f"{action}失败: {result.get('msg', '未知错误')}")
+        return None
+    return result["data"]
+
+def throttled(host: str, status: Any, retry_after: Any = None):
+    """后端返回限流响应时降低该主机的请求速率"""
+    rate = rate_limit.observe(host, status, retry_after)
+    if rate is not None:
+        log("WARNING", f"{host} 请求过于频繁，速率降至 {rate:.1f} 次/秒")
+
+def request_data(endpoint: str, payload: Dict[str, Any], interface: int, action: str, detail: str,
+                 max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[Any]:
+    """请求接口（带重试），成功返回data字段，失败返回None"""
+    with metrics.measure(metrics.stage_of(endpoint), interface) as span:
+        cached = meta_cache.get(endpoint, interface, payload)
+        if cached is not None:
+            span.outcome = "cached"
+            log("INFO", f"{action} (缓存): {detail}")
+            return cached
+
+        data = fetch_data(endpoint, payload, interface, action, detail, max_retries, timeout, verify_ssl)
+        if data is None:
+            span.outcome = "failed"
+        meta_cache.put(endpoint, interface, payload, data)
+        return data
+
+def fetch_data(endpoint: str, payload: Dict[str, Any], interface: int, action: str, detail: str,
+               max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[Any]:
+    """发出请求（带重试，不使用缓存），成功返回data字段，失败返回None"""
+    url = API_URL.format(interface=interface, endpoint=endpoint)
+    host = retry_policy.host_of(url)
 
-def get_music_url(music_id: str, level_name: str, interface: int, 
-                  max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[str]:
-    """获取音乐下载URL"""
-    url = f"https://wyapi-{interface}.toubiec.cn/api/music/url"
-    payload = {"id": music_id, "level": level_name}
-    
     for attempt in range(max_retries):
+        permit = retry_policy.allow(host)
+        if not permit:
+            log("WARNING", f"{action}跳过: {host} 连续出错，暂停请求")
+            router.transport_failed()
+            return None
         try:
-            log("INFO", f"获取音乐URL (尝试 {attempt+1}/{max_retries}): id={music_id}, 音质={level_name}")
-            
-            response = requests.post(url, data=payload, verify=verify_ssl, timeout=timeout)
-            download_result = response.json()
-            
-            if download_result.get("code") != 200 or not download_result.get("data"):
-                log("ERROR", f"获取下载链接失败: {download_result.get('msg', '未知错误')}")
-                return None
-            
-            music_url = download_result["data"][0]["url"]
-            log("SUCCESS", "获取下载链接成功")
-            return music_url
-            
+            log("INFO", f"{action} (尝试 {attempt+1}/{max_retries}): {detail}")
+
+            rate_limit.acquire(host)
+            started = time.monotonic()
+            try:
+                response = http_pool.post(url, data=payload, verify=verify_ssl, timeout=timeout)
+                throttled(host, response.status_code, response.headers.get("Retry-After"))
+                retry_policy.raise_for_status(response.status_code)
+                result = response.json()
+                throttled(host, result.get("code"))
+                retry_policy.raise_for_code(result.get("code"))
+            except Exception:
+                router.record(interface, False, time.monotonic() - started)
+                raise
+            router.record(interface, True, time.monotonic() - started)
+            retry_policy.record_success(host)
+            rate_limit.record_success(host)
+
+            return check_result(result, action)
+
         except requests.exceptions.Timeout:
             log("WARNING", f"请求超时 (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(1)
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                retry_policy.TransientError) as e:
             log("WARNING", f"网络错误: {e} (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(2)
+        except retry_policy.PermanentError as e:
+            # 主机可以访问，只是请求本身无效
+            retry_policy.record_success(host)
+            log("ERROR", f"{action}失败: {e}")
+            return None
+        except requests.exceptions.RequestException as e:
+            log("ERROR", f"请求错误: {e}")
+            router.transport_failed()
+            return None
         except json.JSONDecodeError as e:
             log("ERROR", f"JSON解析失败: {e}")
+            router.transport_failed()
             return None
         except Exception as e:
             log("ERROR", f"未知错误: {e}")
+            router.transport_failed()
             return None
-    
-    log("ERROR", "获取音乐URL失败，已达最大重试次数")
+        finally:
+            # 探测请求未记录结果就结束时释放，熔断器才能再次放行
+            retry_policy.release_probe(host, permit)
+
+        if not retry_policy.retry_after_failure(host, attempt, max_retries):
+            break
+
+    log("ERROR", f"{action}失败，已达最大重试次数或暂停重试")
+    router.transport_failed()
     return None
 
-def get_music_info(music_id: str, interface: int, 
+def parse_music_url(data: Any) -> Optional[str]:
+    """解析下载链接"""
+    try:
+        music_url = data[0]["url"]
+    except (KeyError, IndexError, TypeError) as e:
+        log("ERROR", f"数据格式错误: {e}")
+        return None
+
+    log("SUCCESS", "获取下载链接成功")
+    return music_url
+
+def parse_music_info(data: Dict[str, Any]) -> Dict[str, Any]:
+    """解析歌曲元数据"""
+    music_info = {
+        "name": data.get("name", "未知歌曲"),
+        "album": data.get("album", "未知专辑"),
+        "singer": data.get("singer", "未知歌手"),
+        "picimg": data.get("picimg", "")
+    }
+
+    if not music_info["picimg"]:
+        log("WARNING", "未获取到封面图片URL")
+
+    log("SUCCESS", f"元数据获取成功: {music_info['name']} - {music_info['singer']}")
+    return music_info
+
+def parse_track_ids(data: Dict[str, Any], kind: str) -> Optional[List[str]]:
+    """解析专辑/歌单中的歌曲ID列表"""
+    try:
+        tracks = data.get("tracks", [])
+        music_id_list = [str(track["id"]) for track in tracks if "id" in track]
+    except (AttributeError, KeyError, TypeError) as e:
+        log("ERROR", f"数据格式错误: {e}")
+        return None
+
+    log("SUCCESS", f"获取到{kind}信息: {len(music_id_list)} 首歌曲")
+    return music_id_list
+
+def write_lrc(music_id: str, music_name: str, folder: str, lyric_data: Dict[str, Any]) -> bool:
+    """将歌词写入文件"""
+    safe_name = re.sub(r'[\\/*?:"<>|]', "", music_name)
+
+    try:
+        # 确保文件夹存在
+        os.makedirs(folder, exist_ok=True)
+
+        filename = os.path.join(folder, f"{safe_name}_{music_id}.lrc")
+
+        with open(filename, 'w', encoding='utf-8') as f:
+            # 原始歌词
+            if lyric_data.get("lrc"):
+                f.write("[原始歌词]\n")
+                f.write(lyric_data["lrc"])
+                f.write("\n\n")
+
+            # 翻译歌词
+            if lyric_data.get("tlyric"):
+                f.write("[翻译歌词]\n")
+                f.write(lyric_data["tlyric"])
+                f.write("\n\n")
+
+            # 罗马音歌词
+            if lyric_data.get("romalrc"):
+                f.write("[罗马音歌词]\n")
+                f.write(lyric_data["romalrc"])
+                f.write("\n\n")
+
+            # KTV歌词
+            if lyric_data.get("klyric"):
+                f.write("[KTV歌词]\n")
+                f.write(lyric_data["klyric"])
+                f.write("\n\n")
+    except IOError as e:
+        log("ERROR", f"文件写入失败: {e}")
+        return False
+
+    log("SUCCESS", "歌词写入成功")
+    return True
+
+def build_search_result(data: Dict[str, Any], page: int, has_next_page: bool) -> List:
+    """构建搜索结果列表并显示"""
+    songs = data.get("songs", [])
+
+    # 构建结果列表
+    music_id_list = []
+    music_id_list.append(has_next_page)  # 第一个元素表示是否有下一页
+    music_id_list.append(data.get("total", 0))  # 第二个元素表示总结果数
+
+    # 显示搜索结果（先输出之前的日志）
+    log_system.flush()
+    print(f"\n{LOG_COLORS['INFO']}搜索结果 (第 {page} 页，共 {data.get('total', 0)} 条):{LOG_COLORS['END']}")
+    print("-" * 80)
+
+    for i, song in enumerate(songs):
+        song_name = song.get("name", "未知歌曲")
+        artists = song.get("artists", "未知歌手")
+        album = song.get("album", "未知专辑")
+        song_id = song.get("id", "")
+
+        music_id_list.append(str(song_id))
+
+        print(f"{i+1:3d}. {song_name[:30]:30} - {artists[:20]:20} - {album[:20]:20} (ID: {song_id})")
+
+    print("-" * 80)
+
+    log("SUCCESS", f"搜索成功: 找到 {len(songs)} 条结果")
+    return music_id_list
+
+def invalidate_music_url(music_id: str, level_name: str, interface: int):
+    """丢弃缓存的下载链接（下载失败时调用）"""
+    meta_cache.invalidate("url", interface, {"id": music_id, "level": level_name})
+
+# ============= 搜索分页缓存 =============
+def _fetch_search_page(key: str, page: int, interface: int, **options) -> Optional[Dict[str, Any]]:
+    """请求一页搜索结果并存入分页缓存"""
+    data = request_data(
+        "search", {"keywords": key, "page": page}, interface,
+        "搜索音乐", f"关键词={key}, 页码={page}", **options
+    )
+    with _search_lock:
+        if data is not None:
+            _search_pages[(interface, key, page)] = data
+        _search_prefetch.pop((interface, key, page), None)
+    return data
+
+def get_search_page(key: str, page: int, interface: int, **options) -> Optional[Dict[str, Any]]:
+    """读取一页搜索结果：优先使用缓存，正在预取时等待预取结果"""
+    cache_key = (interface, key, page)
+    with _search_lock:
+        data = _search_pages.get(cache_key)
+        future = _search_prefetch.get(cache_key)
+
+    if data is not None:
+        log("INFO", f"搜索音乐 (缓存): 关键词={key}, 页码={page}")
+        return data
+    if future is not None:
+        data = future.result()
+        if data is not None:
+            return data
+    return _fetch_search_page(key, page, interface, **options)
+
+def cached_search_page(key: str, page: int, interface: int) -> Optional[Dict[str, Any]]:
+    """读取分页缓存中的搜索结果页，未缓存返回None"""
+    with _search_lock:
+        return _search_pages.get((interface, key, page))
+
+def store_search_page(key: str, page: int, interface: int, data: Dict[str, Any]):
+    """将已获取的搜索结果页存入分页缓存"""
+    with _search_lock:
+        _search_pages[(interface, key, page)] = data
+
+def prefetch_search_page(key: str, page: int, interface: int, **options):
+    """在后台预取一页搜索结果（已缓存或正在预取时不重复请求）"""
+    global _prefetch_executor
+    cache_key = (interface, key, page)
+    with _search_lock:
+        if cache_key in _search_pages or cache_key in _search_prefetch:
+            return
+        if _prefetch_executor is None:
+            _prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="search-prefetch")
+        _search_prefetch[cache_key] = _prefetch_executor.submit(_fetch_search_page, key, page, interface, **options)
+
+def search_has_next(key: str, page: int, interface: int, data: Dict[str, Any]) -> Optional[bool]:
+    """根据总结果数判断是否有下一页，接口未返回总数时返回None"""
+    total = data.get("total") or 0
+    songs = data.get("songs") or []
+    if total <= 0 or not songs:
+        return None
+
+    # 最后一页可能不满，按已缓存各页中最多的歌曲数作为每页数量
+    with _search_lock:
+        sizes = [len(cached.get("songs") or []) for (i, k, _), cached in _search_pages.items()
+                 if i == interface and k == key]
+    page_size = max(sizes + [len(songs)])
+    return page * page_size < total
+
+# ============= 接口函数 =============
+def get_music_url(music_id: str, level_name: str, interface: int,
+                  max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[str]:
+    """获取音乐下载URL"""
+    data = request_data(
+        "url", {"id": music_id, "level": level_name}, interface,
+        "获取音乐URL", f"id={music_id}, 音质={level_name}",
+        max_retries=max_retries, timeout=timeout, verify_ssl=verify_ssl
+    )
+    return parse_music_url(data) if data is not None else None
+
+def get_music_info(music_id: str, interface: int,
                    max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[Dict[str, Any]]:
     """获取音乐信息"""
-    url = f"https://wyapi-{interface}.toubiec.cn/api/music/detail"
-    payload = {"id": music_id}
-    music_info = {}
-    
-    for attempt in range(max_retries):
-        try:
-            log("INFO", f"获取音乐信息 (尝试 {attempt+1}/{max_retries}): id={music_id}")
-            
-            response = requests.post(url, data=payload, verify=verify_ssl, timeout=timeout)
-            download_result = response.json()
-            
-            if download_result.get("code") != 200 or not download_result.get("data"):
-                log("ERROR", f"获取元数据失败: {download_result.get('msg', '未知错误')}")
-                return None
-            
-            data = download_result["data"]
-            music_info["name"] = data.get("name", "未知歌曲")
-            music_info["album"] = data.get("album", "未知专辑")
-            music_info["singer"] = data.get("singer", "未知歌手")
-            music_info["picimg"] = data.get("picimg", "")
-            
-            if not music_info["picimg"]:
-                log("WARNING", "未获取到封面图片URL")
-            
-            log("SUCCESS", f"元数据获取成功: {music_info['name']} - {music_info['singer']}")
-            return music_info
-            
-        except requests.exceptions.Timeout:
-            log("WARNING", f"请求超时 (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(1)
-        except requests.exceptions.RequestException as e:
-            log("WARNING", f"网络错误: {e} (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(2)
-        except json.JSONDecodeError as e:
-            log("ERROR", f"JSON解析失败: {e}")
-            return None
-        except Exception as e:
-            log("ERROR", f"未知错误: {e}")
-            return None
-    
-    log("ERROR", "获取音乐信息失败，已达最大重试次数")
-    return None
+    data = request_data(
+        "detail", {"id": music_id}, interface,
+        "获取音乐信息", f"id={music_id}",
+        max_retries=max_retries, timeout=timeout, verify_ssl=verify_ssl
+    )
+    return parse_music_info(data) if data is not None else None
 
-def get_album_info(album_id: str, interface: int, 
+def get_album_info(album_id: str, interface: int,
                    max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[List[str]]:
     """获取专辑信息"""
-    url = f"https://wyapi-{interface}.toubiec.cn/api/music/album"
-    payload = {"id": album_id}
-    music_id_list = []
-    
-    for attempt in range(max_retries):
-        try:
-            log("INFO", f"获取专辑信息 (尝试 {attempt+1}/{max_retries}): id={album_id}")
-            
-            response = requests.post(url, data=payload, verify=verify_ssl, timeout=timeout)
-            download_result = response.json()
-            
-            if download_result.get("code") != 200 or not download_result.get("data"):
-                log("ERROR", f"获取专辑信息失败: {download_result.get('msg', '未知错误')}")
-                return None
-            
-            tracks = download_result["data"].get("tracks", [])
-            music_id_list = [str(track["id"]) for track in tracks if "id" in track]
-            
-            log("SUCCESS", f"获取到专辑信息: {len(music_id_list)} 首歌曲")
-            return music_id_list
-            
-        except requests.exceptions.Timeout:
-            log("WARNING", f"请求超时 (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(1)
-        except requests.exceptions.RequestException as e:
-            log("WARNING", f"网络错误: {e} (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(2)
-        except json.JSONDecodeError as e:
-            log("ERROR", f"JSON解析失败: {e}")
-            return None
-        except KeyError as e:
-            log("ERROR", f"数据格式错误: {e}")
-            return None
-        except Exception as e:
-            log("ERROR", f"未知错误: {e}")
-            return None
-    
-    log("ERROR", "获取专辑信息失败，已达最大重试次数")
-    return None
+    data = request_data(
+        "album", {"id": album_id}, interface,
+        "获取专辑信息", f"id={album_id}",
+        max_retries=max_retries, timeout=timeout, verify_ssl=verify_ssl
+    )
+    return parse_track_ids(data, "专辑") if data is not None else None
 
-def get_playlist_info(playlist_id: str, interface: int, 
+def get_playlist_info(playlist_id: str, interface: int,
                       max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[List[str]]:
     """获取歌单信息"""
-    url = f"https://wyapi-{interface}.toubiec.cn/api/music/playlist"
-    payload = {"id": playlist_id}
-    music_id_list = []
-    
-    for attempt in range(max_retries):
-        try:
-            log("INFO", f"获取歌单信息 (尝试 {attempt+1}/{max_retries}): id={playlist_id}")
-            
-            response = requests.post(url, data=payload, verify=verify_ssl, timeout=timeout)
-            download_result = response.json()
-            
-            if download_result.get("code") != 200 or not download_result.get("data"):
-                log("ERROR", f"获取歌单信息失败: {download_result.get('msg', '未知错误')}")
-                return None
-            
-            tracks = download_result["data"].get("tracks", [])
-            music_id_list = [str(track["id"]) for track in tracks if "id" in track]
-            
-            log("SUCCESS", f"获取到歌单信息: {len(music_id_list)} 首歌曲")
-            return music_id_list
-            
-        except requests.exceptions.Timeout:
-            log("WARNING", f"请求超时 (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(1)
-        except requests.exceptions.RequestException as e:
-            log("WARNING", f"网络错误: {e} (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(2)
-        except json.JSONDecodeError as e:
-            log("ERROR", f"JSON解析失败: {e}")
-            return None
-        except KeyError as e:
-            log("ERROR", f"数据格式错误: {e}")
-            return None
-        except Exception as e:
-            log("ERROR", f"未知错误: {e}")
-            return None
-    
-    log("ERROR", "获取歌单信息失败，已达最大重试次数")
-    return None
+    data = request_data(
+        "playlist", {"id": playlist_id}, interface,
+        "获取歌单信息", f"id={playlist_id}",
+        max_retries=max_retries, timeout=timeout, verify_ssl=verify_ssl
+    )
+    return parse_track_ids(data, "歌单") if data is not None else None
+
+def get_lyric_data(music_id: str, interface: int,
+                   max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[Dict[str, Any]]:
+    """获取歌词数据（不写文件，可在歌名未知时提前请求）"""
+    return request_data(
+        "lyric", {"id": music_id}, interface,
+        "获取歌词", f"id={music_id}",
+        max_retries=max_retries, timeout=timeout, verify_ssl=verify_ssl
+    )
+
+def get_track(music_id: str, level_name: str, interface: int,
+              max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[Dict[str, Any]]:
+    """获取下载链接、元数据和歌词（三次请求同时发出），转换为与 API_2.get_track 相同的格式"""
+    options = {"max_retries": max_retries, "timeout": timeout, "verify_ssl": verify_ssl}
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        url_future = executor.submit(contextvars.copy_context().run, get_music_url, music_id, level_name, interface,
+                                     **options)
+        info_future = executor.submit(contextvars.copy_context().run, get_music_info, music_id, interface, **options)
+        lrc_future = executor.submit(contextvars.copy_context().run, get_lyric_data, music_id, interface, **options)
+        music_url = url_future.result()
+        music_info = info_future.result()
+        lyric_data = lrc_future.result()
+
+    if not music_url or not music_info:
+        return None
+    return track_info(music_url, music_info, lyric_data, interface)
+
+def track_info(music_url: str, music_info: Dict[str, Any], lyric_data: Optional[Dict[str, Any]],
+               interface: int) -> Dict[str, Any]:
+    """合并为与接口2相同的歌曲信息（文件类型为空时由调用方根据链接判断）"""
+    return {
+        "url": music_url,
+        "type": "",
+        "name": music_info["name"],
+        "album": music_info["album"],
+        "singer": music_info["singer"],
+        "picimg": music_info["picimg"],
+        "lyric": lyric_data,
+        "interface": interface
+    }
 
 def get_music_lrc(music_id: str, music_name: str, interface: int, folder: str,
                   max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> bool:
     """获取音乐歌词"""
-    url = f"https://wyapi-{interface}.toubiec.cn/api/music/lyric"
-    payload = {"id": music_id}
-    
-    for attempt in range(max_retries):
-        try:
-            log("INFO", f"获取歌词 (尝试 {attempt+1}/{max_retries}): id={music_id}")
-            
-            response = requests.post(url, data=payload, verify=verify_ssl, timeout=timeout)
-            download_result = response.json()
-            
-            if download_result.get("code") != 200 or not download_result.get("data"):
-                log("ERROR", f"获取歌词失败: {download_result.get('msg', '未知错误')}")
-                return False
-            
-            lyric_data = download_result["data"]
-            safe_name = re.sub(r'[\\/*?:"<>|]', "", music_name)
-            
-            # 确保文件夹存在
-            os.makedirs(folder, exist_ok=True)
-            
-            filename = os.path.join(folder, f"{safe_name}_{music_id}.lrc")
-            
-            with open(filename, 'w', encoding='utf-8') as f:
-                # 原始歌词
-                if lyric_data.get("lrc"):
-                    f.write("[原始歌词]\n")
-                    f.write(lyric_data["lrc"])
-                    f.write("\n\n")
-                
-                # 翻译歌词
-                if lyric_data.get("tlyric"):
-                    f.write("[翻译歌词]\n")
-                    f.write(lyric_data["tlyric"])
-                    f.write("\n\n")
-                
-                # 罗马音歌词
-                if lyric_data.get("romalrc"):
-                    f.write("[罗马音歌词]\n")
-                    f.write(lyric_data["romalrc"])
-                    f.write("\n\n")
-                
-                # KTV歌词
-                if lyric_data.get("klyric"):
-                    f.write("[KTV歌词]\n")
-                    f.write(lyric_data["klyric"])
-                    f.write("\n\n")
-            
-            log("SUCCESS", "歌词写入成功")
-            return True
-            
-        except requests.exceptions.Timeout:
-            log("WARNING", f"请求超时 (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(1)
-        except requests.exceptions.RequestException as e:
-            log("WARNING", f"网络错误: {e} (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(2)
-        except json.JSONDecodeError as e:
-            log("ERROR", f"JSON解析失败: {e}")
-            return False
-        except IOError as e:
-            log("ERROR", f"文件写入失败: {e}")
-            return False
-        except Exception as e:
-            log("ERROR", f"未知错误: {e}")
-            return False
-    
-    log("ERROR", "获取歌词失败，已达最大重试次数")
-    return False
+    data = get_lyric_data(music_id, interface, max_retries=max_retries, timeout=timeout, verify_ssl=verify_ssl)
+    if data is None:
+        return False
+    return write_lrc(music_id, music_name, folder, data)
 
 def search_music(key: str, page: int, interface: int,
                  max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[List]:
-    """搜索音乐"""
-    url = f"https://wyapi-{interface}.toubiec.cn/api/music/search"
-    payload = {"keywords": key, "page": page}
-    music_id_list = []
-    
-    for attempt in range(max_retries):
-        try:
-            log("INFO", f"搜索音乐 (尝试 {attempt+1}/{max_retries}): 关键词={key}, 页码={page}")
-            
-            response = requests.post(url, data=payload, verify=verify_ssl, timeout=timeout)
-            download_result = response.json()
-            
-            if download_result.get("code") != 200 or not download_result.get("data"):
-                log("ERROR", f"搜索失败: {download_result.get('msg', '未知错误')}")
-                return None
-            
-            data = download_result["data"]
-            songs = data.get("songs", [])
-            
-            # 检查是否有下一页
-            next_page_payload = {"keywords": key, "page": page + 1}
-            response_next = requests.post(url, data=next_page_payload, verify=verify_ssl, timeout=timeout)
-            result_next = response_next.json()
-            
-            has_next_page = False
-            if result_next.get("code") == 200 and result_next.get("data", {}).get("songs"):
-                has_next_page = True
-            
-            # 构建结果列表
-            music_id_list.append(has_next_page)  # 第一个元素表示是否有下一页
-            music_id_list.append(data.get("total", 0))  # 第二个元素表示总结果数
-            
-            # 显示搜索结果
-            print(f"\n{LOG_COLORS['INFO']}搜索结果 (第 {page} 页，共 {data.get('total', 0)} 条):{LOG_COLORS['END']}")
-            print("-" * 80)
-            
-            for i, song in enumerate(songs):
-                song_name = song.get("name", "未知歌曲")
-                artists = song.get("artists", "未知歌手")
-                album = song.get("album", "未知专辑")
-                song_id = song.get("id", "")
-                
-                music_id_list.append(str(song_id))
-                
-                print(f"{i+1:3d}. {song_name[:30]:30} - {artists[:20]:20} - {album[:20]:20} (ID: {song_id})")
-            
-            print("-" * 80)
-            
-            log("SUCCESS", f"搜索成功: 找到 {len(songs)} 条结果")
-            return music_id_list
-            
-        except requests.exceptions.Timeout:
-            log("WARNING", f"请求超时 (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(1)
-        except requests.exceptions.RequestException as e:
-            log("WARNING", f"网络错误: {e} (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(2)
-        except json.JSONDecodeError as e:
-            log("ERROR", f"JSON解析失败: {e}")
-            return None
-        except Exception as e:
-            log("ERROR", f"未知错误: {e}")
-            return None
-    
-    log("ERROR", "搜索音乐失败，已达最大重试次数")
-    return None
\ No newline at end of file
+    """搜索音乐（结果页缓存在本次运行内，并在后台预取下一页）"""
+    options = {"max_retries": max_retries, "timeout": timeout, "verify_ssl": verify_ssl}
+    data = get_search_page(key, page, interface, **options)
+    if data is None:
+        return None
+
+    # 检查是否有下一页：优先根据总结果数判断，没有总数时才请求下一页
+    has_next_page = search_has_next(key, page, interface, data)
+    if has_next_page is None:
+        # 与其他请求一样经过重试、熔断和限流，结果存入分页缓存
+        next_data = get_search_page(key, page + 1, interface, **options)
+        has_next_page = next_data is not None and bool(next_data.get("songs"))
+    elif has_next_page:
+        prefetch_search_page(key, page + 1, interface, **options)
+
+    return build_search_result(data, page, has_next_page)
@@ -1,230 +1,275 @@
-import requests 
-import json 
-import os 
-import time 
+import contextvars
+import requests
+import http_pool
+import meta_cache
+import metrics
+import log_system
+import rate_limit
+import retry_policy
+import router
+import json
+import os
+import time
 import re
-from datetime import datetime
-from typing import Dict, Any, Optional, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple
 
 # 日志颜色
-LOG_COLORS = {
-    "DEBUG": "\033[90m",     # 灰色
-    "INFO": "\033[94m",      # 蓝色
-    "SUCCESS": "\033[92m",   # 绿色
-    "WARNING": "\033[93m",   # 黄色
-    "ERROR": "\033[91m",     # 红色
-    "END": "\033[0m"         # 重置颜色
+LOG_COLORS = log_system.LOG_COLORS
+
+API_HOST = "https://dm.jfjt.cc"
+
+HEADERS = {
+    "referer": "https://dm.jfjt.cc/",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
 }
 
 def log(level: str, message: str, module: str = "API2"):
     """API2日志函数"""
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    color = LOG_COLORS.get(level.upper(), LOG_COLORS["INFO"])
-    print(f"{color}[{timestamp}] [{module:8}] {message}{LOG_COLORS['END']}")
+    log_system.log(level, message, module)
+
+# ============= 请求与解析 =============
+def check_result(result: Dict[str, Any], action: str) -> Optional[Any]:
+    """检查接口返回，成功返回data字段"""
+    if result.get("status") != 200 or not result.get("data"):
+        log("ERROR", f"{action}失败: {result.get('message', '未知错误')}")
+        return None
+    return result["data"]
+
+def cache_params(path: str, payload: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """缓存键使用的请求参数"""
+    return payload if payload else {"path": path}
+
+def throttled(host: str, status: Any, retry_after: Any = None):
+    """后端返回限流响应时降低该主机的请求速率"""
+    rate = rate_limit.observe(host, status, retry_after)
+    if rate is not None:
+        log("WARNING", f"{host} 请求过于频繁，速率降至 {rate:.1f} 次/秒")
+
+def request_data(method: str, path: str, action: str, detail: str, payload: Optional[Dict[str, Any]] = None,
+                 cache_endpoint: Optional[str] = None,
+                 max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[Any]:
+    """请求接口（带重试），成功返回data字段，失败返回None"""
+    with metrics.measure(metrics.stage_of(cache_endpoint or path), 3) as span:
+        if cache_endpoint:
+            cached = meta_cache.get(cache_endpoint, 3, cache_params(path, payload))
+            if cached is not None:
+                span.outcome = "cached"
+                log("INFO", f"{action} (缓存): {detail}")
+                return cached
+
+        data = fetch_data(method, path, action, detail, payload, max_retries, timeout, verify_ssl)
+        if data is None:
+            span.outcome = "failed"
+        if cache_endpoint:
+            meta_cache.put(cache_endpoint, 3, cache_params(path, payload), data)
+        return data
+
+def fetch_data(method: str, path: str, action: str, detail: str, payload: Optional[Dict[str, Any]] = None,
+               max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[Any]:
+    """发出请求（带重试，不使用缓存），成功返回data字段，失败返回None"""
+    url = f"{API_HOST}{path}"
+    host = retry_policy.host_of(url)
 
-def get_music(music_id: str, level_name: str, folder: str,
-              max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[Dict[str, Any]]:
-    """获取音乐信息和URL"""
-    headers = {
-        "referer": "https://dm.jfjt.cc/",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-    }
-    
-    url_payload = {"id": music_id, "level": level_name}
-    info_payload = {"id": music_id, "level": level_name, "type": "json"}
-    
     for attempt in range(max_retries):
+        permit = retry_policy.allow(host)
+        if not permit:
+            log("WARNING", f"{action}跳过: {host} 连续出错，暂停请求")
+            router.transport_failed()
+            return None
         try:
-            log("INFO", f"获取音乐信息 (尝试 {attempt+1}/{max_retries}): id={music_id}, 音质={level_name}")
-            
-            # 获取音乐URL
-            response_url = requests.post(
-                "https://dm.jfjt.cc/Song_V1", 
-                data=url_payload, 
-                headers=headers, 
-                verify=verify_ssl,
-                timeout=timeout
-            )
-            download_result_url = response_url.json()
-            
-            if download_result_url.get("status") != 200 or not download_result_url.get("data"):
-                log("ERROR", f"获取URL失败: {download_result_url.get('message', '未知错误')}")
-                return None
-            
-            # 获取音乐信息
-            response_info = requests.post(
-                "https://dm.jfjt.cc/Song_V1", 
-                data=info_payload, 
-                headers=headers, 
-                verify=verify_ssl,
-                timeout=timeout
-            )
-            download_result_info = response_info.json()
-            
-            if download_result_info.get("status") != 200 or not download_result_info.get("data"):
-                log("ERROR", f"获取元数据失败: {download_result_info.get('message', '未知错误')}")
-                return None
-            
-            # 解析数据
-            url_data = download_result_url["data"]
-            info_data = download_result_info["data"]
-            
-            music_info = {
-                "url": url_data.get("url", ""),
-                "type": url_data.get("type", ""),
-                "quality_name": url_data.get("quality_name", ""),
-                "size": url_data.get("size", 0),
-                "album": info_data.get("al_name", "未知专辑"),
-                "singer": info_data.get("ar_name", "未知歌手"),
-                "name": info_data.get("name", "未知歌曲"),
-                "picimg": info_data.get("pic", "")
-            }
-            
-            log("SUCCESS", f"音乐获取成功: {music_info['name']} - {music_info['singer']}")
-            
-            # 保存歌词
+            log("INFO", f"{action} (尝试 {attempt+1}/{max_retries}): {detail}")
+
+            rate_limit.acquire(host)
+            started = time.monotonic()
             try:
-                safe_name = re.sub(r'[\\/*?:"<>|]', "", music_info.get("name"))
-                os.makedirs(folder, exist_ok=True)
-                filename = os.path.join(folder, f"{safe_name}_{music_id}.lrc")
-                
-                with open(filename, 'w', encoding='utf-8') as f:
-                    # 原始歌词
-                    if info_data.get("lyric"):
-                        f.write("[原始歌词]\n")
-                        f.write(info_data["lyric"])
-                        f.write("\n\n")
-                    
-                    # 翻译歌词
-                    if info_data.get("tlyric"):
-                        f.write("[翻译歌词]\n")
-                        f.write(info_data["tlyric"])
-                        f.write("\n\n")
-                
-                log("SUCCESS", "歌词写入成功")
-                
-            except Exception as lrc_error:
-                log("WARNING", f"歌词保存失败: {lrc_error}")
-            
-            return music_info
-            
+                response = http_pool.request(
+                    method,
+                    url,
+                    data=payload,
+                    headers=HEADERS,
+                    verify=verify_ssl,
+                    timeout=timeout
+                )
+                throttled(host, response.status_code, response.headers.get("Retry-After"))
+                retry_policy.raise_for_status(response.status_code)
+                result = response.json()
+                throttled(host, result.get("status"))
+                retry_policy.raise_for_code(result.get("status"))
+            except Exception:
+                router.record(3, False, time.monotonic() - started)
+                raise
+            router.record(3, True, time.monotonic() - started)
+            retry_policy.record_success(host)
+            rate_limit.record_success(host)
+
+            return check_result(result, action)
+
         except requests.exceptions.Timeout:
             log("WARNING", f"请求超时 (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(1)
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                retry_policy.TransientError) as e:
             log("WARNING", f"网络错误: {e} (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(2)
+        except retry_policy.PermanentError as e:
+            # 主机可以访问，只是请求本身无效
+            retry_policy.record_success(host)
+            log("ERROR", f"{action}失败: {e}")
+            return None
+        except requests.exceptions.RequestException as e:
+            log("ERROR", f"请求错误: {e}")
+            router.transport_failed()
+            return None
         except json.JSONDecodeError as e:
             log("ERROR", f"JSON解析失败: {e}")
-            return None
-        except KeyError as e:
-            log("ERROR", f"数据格式错误: {e}")
+            router.transport_failed()
             return None
         except Exception as e:
             log("ERROR", f"未知错误: {e}")
+            router.transport_failed()
             return None
-    
-    log("ERROR", "获取音乐信息失败，已达最大重试次数")
+        finally:
+            # 探测请求未记录结果就结束时释放，熔断器才能再次放行
+            retry_policy.release_probe(host, permit)
+
+        if not retry_policy.retry_after_failure(host, attempt, max_retries):
+            break
+
+    log("ERROR", f"{action}失败，已达最大重试次数或暂停重试")
+    router.transport_failed()
     return None
 
-def get_playlist_info(playlist_id: str, 
+def parse_music(url_data: Dict[str, Any], info_data: Dict[str, Any]) -> Dict[str, Any]:
+    """合并下载链接与元数据"""
+    music_info = {
+        "url": url_data.get("url", ""),
+        "type": url_data.get("type", ""),
+        "quality_name": url_data.get("quality_name", ""),
+        "size": url_data.get("size", 0),
+        "album": info_data.get("al_name", "未知专辑"),
+        "singer": info_data.get("ar_name", "未知歌手"),
+        "name": info_data.get("name", "未知歌曲"),
+        "picimg": info_data.get("pic", "")
+    }
+
+    log("SUCCESS", f"音乐获取成功: {music_info['name']} - {music_info['singer']}")
+    return music_info
+
+def write_lrc(music_id: str, music_name: str, folder: str, info_data: Dict[str, Any]):
+    """保存歌词，失败只记录警告"""
+    try:
+        safe_name = re.sub(r'[\\/*?:"<>|]', "", music_name)
+        os.makedirs(folder, exist_ok=True)
+        filename = os.path.join(folder, f"{safe_name}_{music_id}.lrc")
+
+        with open(filename, 'w', encoding='utf-8') as f:
+            # 原始歌词
+            if info_data.get("lyric"):
+                f.write("[原始歌词]\n")
+                f.write(info_data["lyric"])
+                f.write("\n\n")
+
+            # 翻译歌词
+            if info_data.get("tlyric"):
+                f.write("[翻译歌词]\n")
+                f.write(info_data["tlyric"])
+                f.write("\n\n")
+
+        log("SUCCESS", "歌词写入成功")
+
+    except Exception as lrc_error:
+        log("WARNING", f"歌词保存失败: {lrc_error}")
+
+def lyric_data(info_data: Dict[str, Any]) -> Dict[str, Any]:
+    """歌词转换为接口1的格式（lrc, tlyric），可直接交给 API_1.write_lrc"""
+    return {"lrc": info_data.get("lyric", ""), "tlyric": info_data.get("tlyric", "")}
+
+def parse_track_ids(data: Dict[str, Any], kind: str) -> Optional[List[str]]:
+    """解析歌单/专辑中的歌曲ID列表"""
+    try:
+        if kind == "歌单":
+            tracks = data.get("playlist", {}).get("tracks", [])
+        else:
+            tracks = data.get("album", {}).get("songs", [])
+        music_id_list = [str(track.get("id", "")) for track in tracks if track.get("id")]
+    except (AttributeError, KeyError, TypeError) as e:
+        log("ERROR", f"数据格式错误: {e}")
+        return None
+
+    log("SUCCESS", f"{kind}信息获取成功: {len(music_id_list)} 首歌曲")
+    return music_id_list
+
+def invalidate_music_url(music_id: str, level_name: str):
+    """丢弃缓存的下载链接（下载失败时调用）"""
+    meta_cache.invalidate("song_url", 3, {"id": music_id, "level": level_name})
+
+# ============= 接口函数 =============
+def fetch_song(music_id: str, level_name: str,
+               max_retries: int = 3, timeout: int = 30,
+               verify_ssl: bool = False) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """请求下载链接和元数据，返回 (链接数据, 元数据)"""
+    detail = f"id={music_id}, 音质={level_name}"
+
+    options = {"max_retries": max_retries, "timeout": timeout, "verify_ssl": verify_ssl}
+
+    # 获取音乐URL和音乐信息，两次请求互不依赖，同时发出
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        url_future = executor.submit(
+            contextvars.copy_context().run, request_data, "POST", "/Song_V1", "获取URL", detail,
+            payload={"id": music_id, "level": level_name}, cache_endpoint="song_url", **options
+        )
+        info_future = executor.submit(
+            contextvars.copy_context().run, request_data, "POST", "/Song_V1", "获取元数据", detail,
+            payload={"id": music_id, "level": level_name, "type": "json"}, cache_endpoint="song_info", **options
+        )
+        url_data = url_future.result()
+        info_data = info_future.result()
+
+    if url_data is None or info_data is None:
+        return None
+    return url_data, info_data
+
+def get_music(music_id: str, level_name: str, folder: str,
+              max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[Dict[str, Any]]:
+    """获取音乐信息和URL"""
+    song = fetch_song(music_id, level_name, max_retries=max_retries, timeout=timeout, verify_ssl=verify_ssl)
+    if song is None:
+        return None
+
+    url_data, info_data = song
+    music_info = parse_music(url_data, info_data)
+
+    # 保存歌词
+    write_lrc(music_id, music_info["name"], folder, info_data)
+
+    return music_info
+
+def get_track(music_id: str, level_name: str,
+              max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[Dict[str, Any]]:
+    """获取下载链接、元数据和歌词（歌词转换为接口1的格式，不写文件）"""
+    song = fetch_song(music_id, level_name, max_retries=max_retries, timeout=timeout, verify_ssl=verify_ssl)
+    if song is None:
+        return None
+
+    url_data, info_data = song
+    track = parse_music(url_data, info_data)
+    track["lyric"] = lyric_data(info_data)
+    track["interface"] = 3
+    return track
+
+def get_playlist_info(playlist_id: str,
                       max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[List[str]]:
     """获取歌单信息"""
-    headers = {
-        "referer": "https://dm.jfjt.cc/",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-    }
-    
-    url = f"https://dm.jfjt.cc/Playlist?id={playlist_id}"
-    music_id_list = []
-    
-    for attempt in range(max_retries):
-        try:
-            log("INFO", f"获取歌单信息 (尝试 {attempt+1}/{max_retries}): id={playlist_id}")
-            
-            response = requests.get(url, headers=headers, verify=verify_ssl, timeout=timeout)
-            download_result = response.json()
-            
-            if download_result.get("status") != 200 or not download_result.get("data"):
-                log("ERROR", f"获取歌单失败: {download_result.get('message', '未知错误')}")
-                return None
-            
-            playlist_data = download_result["data"].get("playlist", {})
-            tracks = playlist_data.get("tracks", [])
-            music_id_list = [str(track.get("id", "")) for track in tracks if track.get("id")]
-            
-            log("SUCCESS", f"歌单信息获取成功: {len(music_id_list)} 首歌曲")
-            return music_id_list
-            
-        except requests.exceptions.Timeout:
-            log("WARNING", f"请求超时 (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(1)
-        except requests.exceptions.RequestException as e:
-            log("WARNING", f"网络错误: {e} (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(2)
-        except json.JSONDecodeError as e:
-            log("ERROR", f"JSON解析失败: {e}")
-            return None
-        except KeyError as e:
-            log("ERROR", f"数据格式错误: {e}")
-            return None
-        except Exception as e:
-            log("ERROR", f"未知错误: {e}")
-            return None
-    
-    log("ERROR", "获取歌单信息失败，已达最大重试次数")
-    return None
+    data = request_data(
+        "GET", f"/Playlist?id={playlist_id}", "获取歌单信息", f"id={playlist_id}", cache_endpoint="playlist",
+        max_retries=max_retries, timeout=timeout, verify_ssl=verify_ssl
+    )
+    return parse_track_ids(data, "歌单") if data is not None else None
 
-def get_album_info(album_id: str, 
+def get_album_info(album_id: str,
                    max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[List[str]]:
     """获取专辑信息"""
-    headers = {
-        "referer": "https://dm.jfjt.cc/",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-    }
-    
-    url = f"https://dm.jfjt.cc/Album?id={album_id}"
-    music_id_list = []
-    
-    for attempt in range(max_retries):
-        try:
-            log("INFO", f"获取专辑信息 (尝试 {attempt+1}/{max_retries}): id={album_id}")
-            
-            response = requests.get(url, headers=headers, verify=verify_ssl, timeout=timeout)
-            download_result = response.json()
-            
-            if download_result.get("status") != 200 or not download_result.get("data"):
-                log("ERROR", f"获取专辑失败: {download_result.get('message', '未知错误')}")
-                return None
-            
-            album_data = download_result["data"].get("album", {})
-            songs = album_data.get("songs", [])
-            music_id_list = [str(song.get("id", "")) for song in songs if song.get("id")]
-            
-            log("SUCCESS", f"专辑信息获取成功: {len(music_id_list)} 首歌曲")
-            return music_id_list
-            
-        except requests.exceptions.Timeout:
-            log("WARNING", f"请求超时 (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(1)
-        except requests.exceptions.RequestException as e:
-            log("WARNING", f"网络错误: {e} (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(2)
-        except json.JSONDecodeError as e:
-            log("ERROR", f"JSON解析失败: {e}")
-            return None
-        except KeyError as e:
-            log("ERROR", f"数据格式错误: {e}")
-            return None
-        except Exception as e:
-            log("ERROR", f"未知错误: {e}")
-            return None
-    
-    log("ERROR", "获取专辑信息失败，已达最大重试次数")
-    return None
\ No newline at end of file
+    data = request_data(
+        "GET", f"/Album?id={album_id}", "获取专辑信息", f"id={album_id}", cache_endpoint="album",
+        max_retries=max_retries, timeout=timeout, verify_ssl=verify_ssl
+    )
+    return parse_track_ids(data, "专辑") if data is not None else None
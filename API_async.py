@@ -0,0 +1,658 @@
+import asyncio
+import json
+import os
+import time
+import aiohttp
+import API_1
+import API_2
+import cover_cache
+import http_pool
+import meta_cache
+import metrics
+import log_system
+import progress
+import part_file
+import rate_limit
+import retry_policy
+import router
+import stream_tag
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Callable
+
+# 日志颜色
+LOG_COLORS = log_system.LOG_COLORS
+
+# ============= 连接配置 =============
+# 全部主机的最大连接数，以及单个主机的最大连接数
+CONNECTION_LIMIT = 256
+CONNECTION_LIMIT_PER_HOST = 64
+
+CHUNK_SIZE = 64 * 1024
+
+_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+def log(level: str, message: str, module: str = "ASYNC"):
+    """异步引擎日志函数"""
+    log_system.log(level, message, module)
+
+async def get_session() -> aiohttp.ClientSession:
+    """获取当前事件循环共享的会话（保持长连接）"""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=CONNECTION_LIMIT,
+            limit_per_host=CONNECTION_LIMIT_PER_HOST,
+            ttl_dns_cache=300
+        )
+        session = aiohttp.ClientSession(connector=connector)
+        _sessions[loop] = session
+    return session
+
+async def close_session():
+    """关闭当前事件循环的会话"""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+def throttled(host: str, status: Any, api_log: Callable, retry_after: Any = None):
+    """后端返回限流响应时降低该主机的请求速率"""
+    rate = rate_limit.observe(host, status, retry_after)
+    if rate is not None:
+        api_log("WARNING", f"{host} 请求过于频繁，速率降至 {rate:.1f} 次/秒")
+
+async def request_data(method: str, url: str, check: Callable[[Dict[str, Any], str], Optional[Any]],
+                       action: str, detail: str, api_log: Callable = API_1.log, interface: Optional[int] = None,
+                       status_key: str = "code", max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False,
+                       **kwargs) -> Optional[Any]:
+    """异步请求接口（带重试，规则同 API_1.request_data），成功返回data字段，失败返回None
+
+    传入 interface 时记录接口的延迟和错误；status_key 为返回结果中状态码的字段名。
+    """
+    session = await get_session()
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    host = retry_policy.host_of(url)
+
+    for attempt in range(max_retries):
+        permit = retry_policy.allow(host)
+        if not permit:
+            api_log("WARNING", f"{action}跳过: {host} 连续出错，暂停请求")
+            router.transport_failed()
+            return None
+        try:
+            api_log("INFO", f"{action} (尝试 {attempt+1}/{max_retries}): {detail}")
+
+            await rate_limit.acquire_async(host)
+            started = time.monotonic()
+            try:
+                async with session.request(method, url, ssl=verify_ssl, timeout=client_timeout, **kwargs) as response:
+                    throttled(host, response.status, api_log, response.headers.get("Retry-After"))
+                    retry_policy.raise_for_status(response.status)
+                    result = json.loads(await response.text())
+                throttled(host, result.get(status_key), api_log)
+                retry_policy.raise_for_code(result.get(status_key))
+            except Exception:
+                if interface is not None:
+                    router.record(interface, False, time.monotonic() - started)
+                raise
+            if interface is not None:
+                router.record(interface, True, time.monotonic() - started)
+            retry_policy.record_success(host)
+            rate_limit.record_success(host)
+            return check(result, action)
+
+        except asyncio.TimeoutError:
+            api_log("WARNING", f"请求超时 (尝试 {attempt+1}/{max_retries})")
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, retry_policy.TransientError) as e:
+            api_log("WARNING", f"网络错误: {e} (尝试 {attempt+1}/{max_retries})")
+        except retry_policy.PermanentError as e:
+            # 主机可以访问，只是请求本身无效
+            retry_policy.record_success(host)
+            api_log("ERROR", f"{action}失败: {e}")
+            return None
+        except aiohttp.ClientError as e:
+            api_log("ERROR", f"请求错误: {e}")
+            router.transport_failed()
+            return None
+        except json.JSONDecodeError as e:
+            api_log("ERROR", f"JSON解析失败: {e}")
+            router.transport_failed()
+            return None
+        except Exception as e:
+            api_log("ERROR", f"未知错误: {e}")
+            router.transport_failed()
+            return None
+        finally:
+            # 探测请求未记录结果就结束时释放，熔断器才能再次放行
+            retry_policy.release_probe(host, permit)
+
+        if not await retry_policy.retry_after_failure_async(host, attempt, max_retries):
+            break
+
+    api_log("ERROR", f"{action}失败，已达最大重试次数或暂停重试")
+    router.transport_failed()
+    return None
+
+# ============= 接口1 =============
+async def _api1_data(endpoint: str, payload: Dict[str, Any], interface: int, action: str, detail: str,
+                     **kwargs) -> Optional[Any]:
+    """异步请求接口1"""
+    with metrics.measure(metrics.stage_of(endpoint), interface) as span:
+        cached = await asyncio.to_thread(meta_cache.get, endpoint, interface, payload)
+        if cached is not None:
+            span.outcome = "cached"
+            API_1.log("INFO", f"{action} (缓存): {detail}")
+            return cached
+
+        url = API_1.API_URL.format(interface=interface, endpoint=endpoint)
+        data = await request_data("POST", url, API_1.check_result, action, detail, interface=interface,
+                                  data=payload, **kwargs)
+        if data is None:
+            span.outcome = "failed"
+        await asyncio.to_thread(meta_cache.put, endpoint, interface, payload, data)
+        return data
+
+async def get_music_url(music_id: str, level_name: str, interface: int,
+                        max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[str]:
+    """获取音乐下载URL"""
+    data = await _api1_data(
+        "url", {"id": music_id, "level": level_name}, interface,
+        "获取音乐URL", f"id={music_id}, 音质={level_name}",
+        max_retries=max_retries, timeout=timeout, verify_ssl=verify_ssl
+    )
+    return API_1.parse_music_url(data) if data is not None else None
+
+async def get_music_info(music_id: str, interface: int,
+                         max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[Dict[str, Any]]:
+    """获取音乐信息"""
+    data = await _api1_data(
+        "detail", {"id": music_id}, interface,
+        "获取音乐信息", f"id={music_id}",
+        max_retries=max_retries, timeout=timeout, verify_ssl=verify_ssl
+    )
+    return API_1.parse_music_info(data) if data is not None else None
+
+async def get_album_info(album_id: str, interface: int,
+                         max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[List[str]]:
+    """获取专辑信息"""
+    data = await _api1_data(
+        "album", {"id": album_id}, interface,
+        "获取专辑信息", f"id={album_id}",
+        max_retries=max_retries, timeout=timeout, verify_ssl=verify_ssl
+    )
+    return API_1.parse_track_ids(data, "专辑") if data is not None else None
+
+async def get_playlist_info(playlist_id: str, interface: int,
+                            max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[List[str]]:
+    """获取歌单信息"""
+    data = await _api1_data(
+        "playlist", {"id": playlist_id}, interface,
+        "获取歌单信息", f"id={playlist_id}",
+        max_retries=max_retries, timeout=timeout, verify_ssl=verify_ssl
+    )
+    return API_1.parse_track_ids(data, "歌单") if data is not None else None
+
+async def get_lyric_data(music_id: str, interface: int,
+                         max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[Dict[str, Any]]:
+    """获取歌词数据（不写文件，可在歌名未知时提前请求）"""
+    return await _api1_data(
+        "lyric", {"id": music_id}, interface,
+        "获取歌词", f"id={music_id}",
+        max_retries=max_retries, timeout=timeout, verify_ssl=verify_ssl
+    )
+
+async def get_music_lrc(music_id: str, music_name: str, interface: int, folder: str,
+                        max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> bool:
+    """获取音乐歌词"""
+    data = await get_lyric_data(music_id, interface, max_retries=max_retries, timeout=timeout, verify_ssl=verify_ssl)
+    if data is None:
+        return False
+    return await asyncio.to_thread(API_1.write_lrc, music_id, music_name, folder, data)
+
+async def search_music(key: str, page: int, interface: int,
+                       max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[List]:
+    """搜索音乐（与 API_1.search_music 共用分页缓存，未缓存时当前页与下一页并发请求）"""
+    options = {"max_retries": max_retries, "timeout": timeout, "verify_ssl": verify_ssl}
+
+    async def fetch_page(target: int) -> Optional[Dict[str, Any]]:
+        cached = API_1.cached_search_page(key, target, interface)
+        if cached is not None:
+            API_1.log("INFO", f"搜索音乐 (缓存): 关键词={key}, 页码={target}")
+            return cached
+        data = await _api1_data(
+            "search", {"keywords": key, "page": target}, interface,
+            "搜索音乐", f"关键词={key}, 页码={target}", **options
+        )
+        if data is not None:
+            API_1.store_search_page(key, target, interface, data)
+        return data
+
+    data, next_data = await asyncio.gather(fetch_page(page), fetch_page(page + 1))
+    if data is None:
+        return None
+
+    has_next_page = API_1.search_has_next(key, page, interface, data)
+    if has_next_page is None:
+        has_next_page = next_data is not None and bool(next_data.get("songs"))
+    return API_1.build_search_result(data, page, has_next_page)
+
+# ============= 接口2 =============
+async def _api2_data(method: str, path: str, action: str, detail: str, cache_endpoint: Optional[str] = None,
+                     data: Optional[Dict[str, Any]] = None, **kwargs) -> Optional[Any]:
+    """异步请求接口2"""
+    params = API_2.cache_params(path, data)
+    with metrics.measure(metrics.stage_of(cache_endpoint or path), 3) as span:
+        if cache_endpoint:
+            cached = await asyncio.to_thread(meta_cache.get, cache_endpoint, 3, params)
+            if cached is not None:
+                span.outcome = "cached"
+                API_2.log("INFO", f"{action} (缓存): {detail}")
+                return cached
+
+        result = await request_data(method, f"{API_2.API_HOST}{path}", API_2.check_result, action, detail,
+                                    api_log=API_2.log, interface=3, status_key="status", headers=API_2.HEADERS, data=data, **kwargs)
+        if result is None:
+            span.outcome = "failed"
+        if cache_endpoint:
+            await asyncio.to_thread(meta_cache.put, cache_endpoint, 3, params, result)
+        return result
+
+async def fetch_song(music_id: str, level_name: str,
+                     max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[tuple]:
+    """请求下载链接和元数据，返回 (链接数据, 元数据)"""
+    detail = f"id={music_id}, 音质={level_name}"
+    options = {"max_retries": max_retries, "timeout": timeout, "verify_ssl": verify_ssl}
+
+    # 两次请求互不依赖，同时发出
+    url_data, info_data = await asyncio.gather(
+        _api2_data("POST", "/Song_V1", "获取URL", detail, cache_endpoint="song_url",
+                   data={"id": music_id, "level": level_name}, **options),
+        _api2_data("POST", "/Song_V1", "获取元数据", detail, cache_endpoint="song_info",
+                   data={"id": music_id, "level": level_name, "type": "json"}, **options)
+    )
+    if url_data is None or info_data is None:
+        return None
+    return url_data, info_data
+
+async def get_music(music_id: str, level_name: str, folder: str,
+                    max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[Dict[str, Any]]:
+    """获取音乐信息和URL"""
+    song = await fetch_song(music_id, level_name, max_retries=max_retries, timeout=timeout, verify_ssl=verify_ssl)
+    if song is None:
+        return None
+
+    url_data, info_data = song
+    music_info = API_2.parse_music(url_data, info_data)
+    await asyncio.to_thread(API_2.write_lrc, music_id, music_info["name"], folder, info_data)
+    return music_info
+
+# ============= 文件下载 =============
+# 写文件、预分配和保存下载状态都可能被慢速磁盘阻塞，全部放到线程中执行，
+# 事件循环只负责网络传输；收到的数据攒满 chunk_size 再交给线程写入，减少线程切换。
+
+def _create_part(filepath: str, size: int, allocate: bool, head: bytes = b""):
+    """新建 .part 文件：预先分配文件大小，写入文件头（在线程中执行）"""
+    with open(part_file.part_path(filepath), 'wb') as f:
+        part_file.preallocate(f, size, allocate=allocate)
+        f.write(head)
+
+def _open_at(path: str, position: int):
+    """打开文件并定位到 position（在线程中执行）"""
+    f = open(path, 'r+b', buffering=0)
+    f.seek(position)
+    return f
+
+def _write_and_close(f: Any, data: bytes):
+    """写入剩余数据后关闭文件（在线程中执行）"""
+    try:
+        if data:
+            f.write(data)
+    finally:
+        f.close()
+
+def _finish_writer(writer: part_file.PartWriter, data: bytes):
+    """写入剩余数据后关闭 PartWriter（在线程中执行）"""
+    try:
+        if data:
+            writer.write(data)
+    finally:
+        writer.close()
+
+async def download_segmented(session: aiohttp.ClientSession, url: str, filepath: str, state: Dict[str, Any],
+                             task: progress.Task, max_retries: int = 3, timeout: int = 30,
+                             chunk_size: int = 256 * 1024, preallocate: bool = True) -> Optional[bool]:
+    """多段并发下载到 .part 文件，各段进度记录在状态文件中，中断后可从记录处继续
+
+    返回True表示成功，False表示失败（保留已下载部分），None表示服务器不支持Range（需改为单连接下载）
+    """
+    client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+    part = part_file.part_path(filepath)
+    # 边下载边写标签时，.part 中的位置比下载内容中的位置多出新旧文件头的长度差
+    delta = state.get("delta", 0)
+    no_range = False
+    host = retry_policy.host_of(url)
+    task.update(downloaded=state["size"] - sum(end - pos + 1 for pos, end in state["ranges"] if pos <= end),
+                total=state["size"])
+
+    # 新建时预先分配文件大小，各段按偏移写入
+    if not await asyncio.to_thread(os.path.exists, part):
+        await asyncio.to_thread(_create_part, filepath, state["size"] + delta, preallocate)
+
+    async def fetch(segment: List[int]) -> bool:
+        nonlocal no_range
+        end = segment[1]
+        for attempt in range(max_retries):
+            pos = received_from = segment[0]
+            if pos > end:
+                return True
+            permit = retry_policy.allow(host)
+            if not permit:
+                return False
+            try:
+                async with session.get(url, headers=part_file.range_headers(state, pos, end), ssl=False,
+                                       timeout=client_timeout) as response:
+                    if response.status == 200:
+                        # 不支持Range或文件已变化
+                        no_range = True
+                        retry_policy.record_success(host)
+                        return False
+                    if not part_file.accepts_range(response.status, response.headers, state, pos):
+                        log("WARNING", f"分段下载失败，状态码: {response.status} (尝试 {attempt+1}/{max_retries})")
+                        if retry_policy.is_permanent_status(response.status):
+                            retry_policy.record_success(host)
+                            return False
+                    else:
+                        unsaved = 0
+                        buffer = bytearray()
+                        f = await asyncio.to_thread(_open_at, part, pos + delta)
+                        try:
+                            async for chunk in response.content.iter_chunked(chunk_size):
+                                buffer += chunk
+                                task.advance(len(chunk))
+                                if len(buffer) < chunk_size:
+                                    continue
+                                await asyncio.to_thread(f.write, bytes(buffer))
+                                pos += len(buffer)
+                                unsaved += len(buffer)
+                                buffer.clear()
+                                if unsaved >= part_file.STATE_SAVE_INTERVAL:
+                                    # 只记录已写入文件的位置
+                                    segment[0] = pos
+                                    await asyncio.to_thread(part_file.save_state, filepath, state)
+                                    unsaved = 0
+                        finally:
+                            # 连接中断时也写入已收到的数据
+                            await asyncio.to_thread(_write_and_close, f, bytes(buffer))
+                            pos += len(buffer)
+                        segment[0] = pos
+                        await asyncio.to_thread(part_file.save_state, filepath, state)
+                        if pos > end:
+                            retry_policy.record_success(host)
+                            return True
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # 已写入的部分保留，重试时从断点继续
+                segment[0] = pos
+                await asyncio.to_thread(part_file.save_state, filepath, state)
+                log("WARNING", f"分段下载出错: {e} (尝试 {attempt+1}/{max_retries})")
+            finally:
+                retry_policy.release_probe(host, permit)
+
+            if no_range:
+                return False
+            progressed = pos > received_from
+            if not await retry_policy.retry_after_failure_async(host, attempt, max_retries, progressed):
+                return False
+        return False
+
+    results = await asyncio.gather(*(fetch(segment) for segment in state["ranges"]))
+    if no_range:
+        return None
+    return all(results)
+
+async def fetch_cover(url: str, max_retries: int = 3, timeout: int = 30,
+                      interface: Optional[int] = None) -> Optional[bytes]:
+    """下载封面图片到内存（同一URL只下载一次），失败返回None"""
+    host = retry_policy.host_of(url)
+
+    async def load() -> Optional[bytes]:
+        session = await get_session()
+        for attempt in range(max_retries):
+            permit = retry_policy.allow(host)
+            if not permit:
+                break
+            try:
+                async with session.get(url, ssl=False, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    data = await response.read()
+                    if response.status == 200 and data:
+                        retry_policy.record_success(host)
+                        metrics.count("bytes_total", len(data), kind="cover")
+                        return data
+                    log("WARNING", f"封面下载失败，状态码: {response.status} (尝试 {attempt+1}/{max_retries})")
+                    if not retry_policy.is_transient_status(response.status):
+                        retry_policy.record_success(host)
+                        break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                log("WARNING", f"封面下载出错: {e} (尝试 {attempt+1}/{max_retries})")
+            finally:
+                retry_policy.release_probe(host, permit)
+            if not await retry_policy.retry_after_failure_async(host, attempt, max_retries):
+                break
+        log("WARNING", f"封面下载失败: {url[:80]}")
+        return None
+
+    return await cover_cache.fetch_async(url, lambda: metrics.call_async("cover", interface, load()))
+
+async def _stream_to_part(response: aiohttp.ClientResponse, filepath: str, state: Optional[Dict[str, Any]],
+                          tagger: Optional[stream_tag.StreamTagger], task: progress.Task,
+                          downloaded: int, chunk_size: int, preallocate: bool) -> int:
+    """将响应内容从 downloaded 处写入 .part 文件，返回已下载的总字节数"""
+    task.update(downloaded=downloaded)
+    writer = await asyncio.to_thread(part_file.PartWriter, filepath, state, tagger, downloaded, chunk_size, preallocate)
+    buffer = bytearray()
+    try:
+        async for chunk in response.content.iter_chunked(chunk_size):
+            downloaded += len(chunk)
+            task.advance(len(chunk))
+            buffer += chunk
+            if len(buffer) >= chunk_size:
+                await asyncio.to_thread(writer.write, bytes(buffer))
+                buffer.clear()
+    finally:
+        # 连接中断时也写入已收到的数据
+        await asyncio.to_thread(_finish_writer, writer, bytes(buffer))
+    return downloaded
+
+async def _start_segmented(response: aiohttp.ClientResponse, filepath: str, state: Dict[str, Any],
+                           tagger: Optional[stream_tag.StreamTagger], segments: int, preallocate: bool):
+    """初始化分段下载（同 main._start_segmented）"""
+    head = b""
+    consumed = 0
+    if tagger:
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            consumed += len(chunk)
+            # 生成文件头时可能要等待封面下载完成，在线程中执行
+            head += await asyncio.to_thread(tagger.feed, chunk)
+            if tagger.resolved:
+                break
+        if not tagger.resolved:
+            head += tagger.flush()
+        tagger.save_to(state)
+
+    total_size = state["size"]
+    state["ranges"] = [
+        [consumed + start, consumed + end]
+        for start, end in (http_pool.split_ranges(total_size - consumed, segments) if consumed < total_size else [])
+    ]
+    await asyncio.to_thread(part_file.save_state, filepath, state)
+
+    # 预先分配文件大小，各段按偏移写入
+    await asyncio.to_thread(_create_part, filepath, total_size + state.get("delta", 0), preallocate, head)
+
+async def download(url: str, filename: str, folder: str, max_retries: int = 3, timeout: int = 30,
+                   segments: int = 1, segment_threshold: int = 0, chunk_size: int = 256 * 1024,
+                   preallocate: bool = True, tagger: Optional[stream_tag.StreamTagger] = None) -> Optional[str]:
+    """异步下载文件（续传、分段和边下载边写标签的规则同 main.download）"""
+    session = await get_session()
+    # 大文件传输时间较长，超时只限制连接和两次读取之间的间隔
+    client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+    allow_segments = segments > 1 and segment_threshold > 0
+    filepath = os.path.join(folder, filename)
+    host = retry_policy.host_of(url)
+
+    task = progress.start(filename)
+    try:
+        for attempt in range(max_retries):
+            permit = retry_policy.allow(host)
+            if not permit:
+                log("WARNING", f"{host} 连续出错，暂停下载")
+                break
+            received_from = task.downloaded
+            try:
+                await asyncio.to_thread(os.makedirs, folder, exist_ok=True)
+
+                log("INFO", f"开始下载 ({attempt+1}/{max_retries}): {filename}")
+
+                start_time = datetime.now()
+                state = await asyncio.to_thread(part_file.load_state, filepath)
+                total_size = downloaded = 0
+
+                if tagger:
+                    tagger.reset()
+                    if state:
+                        tagger.resume(state)
+
+                if state and state.get("ranges"):
+                    log("INFO", "发现未完成的分段下载，继续下载...")
+                else:
+                    # 已有部分内容时只发一次带校验的续传请求
+                    offset = await asyncio.to_thread(part_file.resume_offset, filepath, state) if state else 0
+                    headers = part_file.range_headers(state, offset) if offset > 0 else {}
+
+                    async with session.get(url, headers=headers, ssl=False, timeout=client_timeout) as response:
+                        if response.status == 416 and offset and offset == state["size"]:
+                            # 上次已下载完整，只差重命名
+                            total_size = downloaded = offset
+                        elif offset and part_file.accepts_range(response.status, response.headers, state, offset):
+                            log("INFO", f"发现部分下载的文件，从 {offset/1024/1024:.1f}MB 处继续下载...")
+                            total_size = state["size"]
+                            task.update(total=total_size)
+                            downloaded = await _stream_to_part(response, filepath, state, tagger, task, offset,
+                                                               chunk_size, preallocate)
+                        elif response.status == 200:
+                            if offset:
+                                log("INFO", "文件已变化或服务器不支持续传，重新下载")
+                            await asyncio.to_thread(part_file.clear, filepath)
+                            if tagger:
+                                tagger.reset()
+                            total_size = response.content_length or 0
+
+                            # 大小未知时无法校验，不保存续传状态
+                            state = part_file.new_state(response.headers, total_size) if total_size > 0 else None
+
+                            if (state and allow_segments and total_size >= segment_threshold
+                                    and response.headers.get("Accept-Ranges", "").lower() == "bytes"):
+                                # 大文件分段下载，这个响应只用来读取文件头
+                                await _start_segmented(response, filepath, state, tagger, segments, preallocate)
+                                log("INFO", f"分段下载: {filename} ({total_size/1024/1024:.1f}MB, {segments} 段)")
+                            else:
+                                if state:
+                                    await asyncio.to_thread(part_file.save_state, filepath, state)
+                                task.update(total=total_size)
+                                downloaded = await _stream_to_part(response, filepath, state, tagger, task, 0,
+                                                                   chunk_size, preallocate)
+                        else:
+                            log("WARNING", f"下载失败，状态码: {response.status} (尝试 {attempt+1}/{max_retries})")
+                            if response.status == 416:
+                                # 记录的续传位置无效，清除后重新下载
+                                await asyncio.to_thread(part_file.clear, filepath)
+                                retry_policy.record_success(host)
+                                continue
+                            if retry_policy.is_permanent_status(response.status):
+                                # 链接失效等错误，重试也不会成功
+                                retry_policy.record_success(host)
+                                break
+                            if not await retry_policy.retry_after_failure_async(host, attempt, max_retries):
+                                break
+                            continue
+
+                if state and state.get("ranges"):
+                    # 各段请求分别经过熔断器，交还探测名额
+                    retry_policy.release_probe(host, permit, failed=False)
+                    result = await download_segmented(session, url, filepath, state, task, max_retries, timeout,
+                                                      chunk_size, preallocate)
+                    if result is None:
+                        log("WARNING", "服务器不支持分段下载或文件已变化，改为单连接下载")
+                        await asyncio.to_thread(part_file.clear, filepath)
+                        allow_segments = False
+                        continue
+                    if not result:
+                        log("WARNING", f"分段下载失败 (尝试 {attempt+1}/{max_retries})")
+                        progressed = task.downloaded > received_from
+                        if not await retry_policy.retry_after_failure_async(host, attempt, max_retries, progressed):
+                            break
+                        continue
+                    total_size = downloaded = state["size"]
+
+                # 连接提前断开时保留 .part，下一次尝试从断点继续
+                if total_size > 0 and downloaded != total_size:
+                    log("WARNING", f"下载不完整: {downloaded}/{total_size} 字节 (尝试 {attempt+1}/{max_retries})")
+                    if downloaded > total_size:
+                        await asyncio.to_thread(part_file.clear, filepath)
+                    progressed = task.downloaded > received_from
+                    if not await retry_policy.retry_after_failure_async(host, attempt, max_retries, progressed):
+                        break
+                    continue
+
+                await asyncio.to_thread(part_file.finalize, filepath)
+                retry_policy.record_success(host)
+                elapsed = (datetime.now() - start_time).total_seconds()
+                log("SUCCESS", f"下载完成: {filename} ({downloaded/1024/1024:.1f}MB, {elapsed:.1f}s)")
+                return filepath
+
+            except asyncio.TimeoutError:
+                log("WARNING", f"下载超时 (尝试 {attempt+1}/{max_retries})")
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError) as e:
+                log("WARNING", f"网络错误: {e} (尝试 {attempt+1}/{max_retries})")
+            except aiohttp.ClientError as e:
+                log("ERROR", f"请求错误: {e}")
+                break
+            except Exception as e:
+                log("ERROR", f"下载错误: {e}")
+                break
+            finally:
+                retry_policy.release_probe(host, permit)
+
+            # 超时和连接中断可以重试，已下载的部分保留
+            progressed = task.downloaded > received_from
+            if not await retry_policy.retry_after_failure_async(host, attempt, max_retries, progressed):
+                break
+
+        log("ERROR", f"下载失败: {filename}")
+        return None
+    finally:
+        progress.finish(task)
+        metrics.count("bytes_total", task.transferred, kind="audio")
+
+# ============= 统一格式 =============
+async def get_track(music_id: str, level_name: str, interface: int,
+                    max_retries: int = 3, timeout: int = 30, verify_ssl: bool = False) -> Optional[Dict[str, Any]]:
+    """获取下载链接、元数据和歌词（格式同 API_1.get_track / API_2.get_track）"""
+    options = {"max_retries": max_retries, "timeout": timeout, "verify_ssl": verify_ssl}
+    if interface == 3:
+        song = await fetch_song(music_id, level_name, **options)
+        if song is None:
+            return None
+        url_data, info_data = song
+        track = API_2.parse_music(url_data, info_data)
+        track["lyric"] = API_2.lyric_data(info_data)
+        track["interface"] = 3
+        return track
+
+    music_url, music_info, lyric_data = await asyncio.gather(
+        get_music_url(music_id, level_name, interface, **options),
+        get_music_info(music_id, interface, **options),
+        get_lyric_data(music_id, interface, **options)
+    )
+    if not music_url or not music_info:
+        return None
+    return API_1.track_info(music_url, music_info, lyric_data, interface)
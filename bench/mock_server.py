@@ -0,0 +1,299 @@
+import argparse
+import json
+import random
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+# 离线测试用的本地接口服务器，模拟 API_1（/api/music/*）和 API_2（/Song_V1、/Playlist、/Album）的接口，
+# 并提供合成的音频文件和封面。可以设置延迟、带宽、错误率以及是否支持 Range 请求。
+#
+# 单独运行（其他程序通过 point_to 的地址访问）:
+#   python bench/mock_server.py --port 18800 --latency 0.05 --bandwidth 20
+# 在测试脚本中使用:
+#   server = MockServer(config); server.start(); point_to(server.url) ... server.stop()
+
+DEFAULT_CONFIG = {
+    "latency": 0.02,        # 每个请求的响应延迟（秒）
+    "bandwidth": 0.0,       # 每个连接的带宽（MB/s），0 表示不限制
+    "error_rate": 0.0,      # 返回 503 的请求比例
+    "range": True,          # 音频和封面是否支持 Range 请求
+    "audio_size": 4.0,      # 合成音频大小（MB）
+    "cover_size": 64,       # 合成封面大小（KB）
+    "tracks": 20,           # 每个歌单/专辑的歌曲数
+    "search_total": 50      # 搜索结果总数
+}
+
+# 每次写入的数据块大小，限速时按块等待
+WRITE_CHUNK = 64 * 1024
+SEARCH_PAGE_SIZE = 10
+
+def make_flac(size: int) -> bytes:
+    """合成 FLAC 文件：有效的 STREAMINFO 头（mutagen 可以写标签）加随机数据"""
+    streaminfo = (struct.pack(">HH", 4096, 4096) + b"\x00" * 6
+                  + bytes([0x0A, 0xC4, 0x42, 0xF0]) + b"\x00" * 20)
+    header = b"fLaC" + bytes([0x80]) + len(streaminfo).to_bytes(3, "big") + streaminfo
+    return header + random.Random(size).randbytes(max(0, size - len(header) - 4))
+
+def make_png(size: int) -> bytes:
+    """合成封面（PNG 文件头加随机数据）"""
+    return b"\x89PNG\r\n\x1a\n" + random.Random(size).randbytes(max(0, size - 8))
+
+def collection_tracks(collection_id: str, count: int) -> list:
+    """歌单/专辑中的歌曲ID（由歌单/专辑ID确定，便于重复测试）"""
+    base = int(collection_id) * 1000 if collection_id.isdigit() else 1000
+    return [base + offset for offset in range(1, count + 1)]
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "MockServer"
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+    # ============= 响应 =============
+    def send_json(self, obj: Any):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_empty(self, status: int):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def send_payload(self, data: bytes, content_type: str, audio: bool):
+        """发送文件内容，支持单个 Range 并按带宽限速"""
+        config = self.server.config
+        start, end = 0, len(data) - 1
+        status = 200
+        requested = self.headers.get("Range")
+        if requested and config["range"]:
+            first, _, last = requested.partition("=")[2].partition("-")
+            start = int(first or 0)
+            end = min(int(last), len(data) - 1) if last else len(data) - 1
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", f'"{len(data)}"')
+        if config["range"]:
+            self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.end_headers()
+
+        bandwidth = config["bandwidth"] * 1024 * 1024
+        view = memoryview(data)[start:end + 1]
+        started = time.monotonic()
+        sent = 0
+        for offset in range(0, len(view), WRITE_CHUNK):
+            chunk = view[offset:offset + WRITE_CHUNK]
+            try:
+                self.wfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端提前关闭连接（如读完文件头后改为分段下载），不是错误
+                self.close_connection = True
+                return
+            sent += len(chunk)
+            if audio:
+                self.server.count("audio_bytes", len(chunk))
+            if bandwidth > 0:
+                wait = sent / bandwidth - (time.monotonic() - started)
+                if wait > 0:
+                    time.sleep(wait)
+
+    # ============= 请求分发 =============
+    def begin(self) -> bool:
+        """模拟延迟和随机错误，返回是否继续处理"""
+        self.server.count("requests")
+        config = self.server.config
+        if config["latency"] > 0:
+            time.sleep(config["latency"])
+        if config["error_rate"] > 0 and self.server.random() < config["error_rate"]:
+            self.server.count("errors")
+            self.send_empty(503)
+            return False
+        return True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode("utf-8")).items()}
+        if not self.begin():
+            return
+        path = urlsplit(self.path).path
+        if "/api/music/" in path:
+            self.send_json(self.server.api1(path.rsplit("/", 1)[-1], form, self.base_url()))
+        elif path == "/Song_V1":
+            self.send_json(self.server.song_v1(form, self.base_url()))
+        else:
+            self.send_empty(404)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.startswith("/audio/"):
+            if self.begin():
+                self.send_payload(self.server.audio, "audio/flac", audio=True)
+        elif url.path.startswith("/cover/"):
+            if self.begin():
+                self.send_payload(self.server.cover, "image/png", audio=False)
+        elif url.path in ("/Playlist", "/Album"):
+            if self.begin():
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                self.send_json(self.server.collection_v2(url.path, query.get("id", "")))
+        else:
+            self.send_empty(404)
+
+    def base_url(self) -> str:
+        return f"http://{self.headers.get('Host') or self.server.host}"
+
+class MockServer(ThreadingHTTPServer):
+    """模拟接口服务器，在后台线程中运行"""
+    daemon_threads = True
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), MockHandler)
+        self.config = {**DEFAULT_CONFIG, **(config or {})}
+        self.host = f"{host}:{self.server_address[1]}"
+        self.url = f"http://{self.host}"
+        self.audio = make_flac(int(self.config["audio_size"] * 1024 * 1024))
+        self.cover = make_png(int(self.config["cover_size"] * 1024))
+        self.stats = {"requests": 0, "errors": 0, "audio_bytes": 0}
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request: Any, client_address: Any):
+        # 客户端在读取下一个请求时断开连接（连接池关闭空闲连接）属于正常情况，不输出异常
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+    def count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def random(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {key: 0 for key in self.stats}
+
+    # ============= 接口数据 =============
+    def api1(self, endpoint: str, form: Dict[str, str], base: str) -> Dict[str, Any]:
+        """API_1 接口: url, detail, lyric, album, playlist, search"""
+        music_id = form.get("id", "")
+        if endpoint == "url":
+            return {"code": 200, "data": [{"id": music_id, "url": f"{base}/audio/{music_id}.flac",
+                                           "level": form.get("level", ""), "size": len(self.audio)}]}
+        if endpoint == "detail":
+            album_id = int(music_id) // 1000 if music_id.isdigit() else 0
+            return {"code": 200, "data": {"name": f"Track {music_id}", "album": f"Album {album_id}",
+                                          "singer": "Mock Artist", "picimg": f"{base}/cover/{album_id}.png"}}
+        if endpoint == "lyric":
+            return {"code": 200, "data": {"lrc": f"[00:00.00]Track {music_id}\n[00:05.00]la la la", "tlyric": ""}}
+        if endpoint in ("album", "playlist"):
+            tracks = collection_tracks(music_id, self.config["tracks"])
+            return {"code": 200, "data": {"tracks": [{"id": track_id} for track_id in tracks]}}
+        if endpoint == "search":
+            page = int(form.get("page") or 1)
+            total = self.config["search_total"]
+            first = (page - 1) * SEARCH_PAGE_SIZE
+            songs = [{"id": 900000 + index, "name": f"{form.get('keywords', '')} {index}",
+                      "artists": "Mock Artist", "album": "Mock Album"}
+                     for index in range(first, min(first + SEARCH_PAGE_SIZE, total))]
+            return {"code": 200, "data": {"total": total, "songs": songs}}
+        return {"code": 404, "data": None}
+
+    def song_v1(self, form: Dict[str, str], base: str) -> Dict[str, Any]:
+        """API_2 接口 /Song_V1：带 type=json 时返回元数据，否则返回下载链接"""
+        music_id = form.get("id", "")
+        if form.get("type") == "json":
+            album_id = int(music_id) // 1000 if music_id.isdigit() else 0
+            return {"status": 200, "data": {"name": f"Track {music_id}", "al_name": f"Album {album_id}",
+                                            "ar_name": "Mock Artist", "pic": f"{base}/cover/{album_id}.png",
+                                            "lyric": f"[00:00.00]Track {music_id}", "tlyric": ""}}
+        return {"status": 200, "data": {"url": f"{base}/audio/{music_id}.flac", "type": "flac",
+                                        "quality_name": form.get("level", ""), "size": len(self.audio)}}
+
+    def collection_v2(self, path: str, collection_id: str) -> Dict[str, Any]:
+        """API_2 接口 /Playlist、/Album"""
+        tracks = [{"id": track_id} for track_id in collection_tracks(collection_id, self.config["tracks"])]
+        if path == "/Playlist":
+            return {"status": 200, "data": {"playlist": {"tracks": tracks}}}
+        return {"status": 200, "data": {"album": {"songs": tracks}}}
+
+def point_to(url: str):
+    """让 API_1、API_2（以及异步引擎）请求模拟服务器"""
+    import API_1
+    import API_2
+
+    API_1.API_URL = f"{url}/api/music/{{endpoint}}"
+    API_2.API_HOST = url
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    """模拟服务器参数（基准测试脚本共用）"""
+    parser.add_argument("--latency", type=float, default=DEFAULT_CONFIG["latency"], help="响应延迟（秒）")
+    parser.add_argument("--bandwidth", type=float, default=DEFAULT_CONFIG["bandwidth"],
+                        help="每个连接的带宽（MB/s），0 表示不限制")
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_CONFIG["error_rate"], help="返回 503 的请求比例")
+    parser.add_argument("--no-range", action="store_true", help="不支持 Range 请求（无法续传和分段下载）")
+    parser.add_argument("--audio-size", type=float, default=DEFAULT_CONFIG["audio_size"], help="音频大小（MB）")
+    parser.add_argument("--tracks", type=int, default=DEFAULT_CONFIG["tracks"], help="每个歌单/专辑的歌曲数")
+
+def config_from_args(args: argparse.Namespace) -> Dict[str, Any]:
+    return {
+        "latency": args.latency,
+        "bandwidth": args.bandwidth,
+        "error_rate": args.error_rate,
+        "range": not args.no_range,
+        "audio_size": args.audio_size,
+        "tracks": args.tracks
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="本地模拟接口服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18800)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockServer(config_from_args(args), args.host, args.port)
+    print(f"模拟服务器已启动: {server.url}")
+    print(f"  API_1.API_URL  = {server.url}/api/music/{{endpoint}}")
+    print(f"  API_2.API_HOST = {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
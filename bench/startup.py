@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+import selectors
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+# 启动耗时基准测试，每次都启动新进程测量：
+#   import         python -c "import main" 的总耗时（对照: 空解释器 python -c pass）
+#   first_prompt   不带参数启动到出现主菜单输入提示
+#   first_request  执行 download 命令到发出第一个网络请求（通过本地代理端口检测，不访问外网）
+#
+# 用法:
+#   python bench/startup.py [--runs 10] [--json]
+#   python bench/startup.py --command dist/main     # 测量 PyInstaller 打包后的程序（不测 import）
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROMPT_MARKER = "输入选择".encode("utf-8")
+TIMEOUT = 30.0
+
+def child_env(proxy_port: Optional[int] = None) -> Dict[str, str]:
+    """子进程环境：UTF-8 输出，可选把全部请求指向本地代理端口"""
+    env = dict(os.environ, PYTHONIOENCODING="utf-8", PYTHONPATH=REPO)
+    for key in ("HTTP_PROXY", "HTTPS_PROXY", "ALL_PROXY", "NO_PROXY"):
+        env.pop(key, None)
+        env.pop(key.lower(), None)
+    if proxy_port is not None:
+        env["HTTP_PROXY"] = env["HTTPS_PROXY"] = f"http://127.0.0.1:{proxy_port}"
+    return env
+
+def time_process(args: List[str], cwd: str) -> float:
+    """运行到结束的耗时（秒）"""
+    started = time.perf_counter()
+    subprocess.run(args, cwd=cwd, env=child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                   timeout=TIMEOUT, check=True)
+    return time.perf_counter() - started
+
+def time_first_prompt(command: List[str], cwd: str) -> float:
+    """启动到标准输出出现主菜单输入提示的耗时（秒）"""
+    started = time.perf_counter()
+    proc = subprocess.Popen(command, cwd=cwd, env=child_env(), stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        selector = selectors.DefaultSelector()
+        selector.register(proc.stdout, selectors.EVENT_READ)
+        output = b""
+        while time.perf_counter() - started < TIMEOUT:
+            if not selector.select(timeout=0.5):
+                continue
+            data = os.read(proc.stdout.fileno(), 65536)
+            if not data:
+                break
+            output += data
+            if PROMPT_MARKER in output:
+                return time.perf_counter() - started
+        raise RuntimeError("未检测到主菜单提示")
+    finally:
+        proc.kill()
+        proc.wait()
+
+def time_first_request(command: List[str], cwd: str) -> float:
+    """启动到第一个网络请求到达本地代理端口的耗时（秒）"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(8)
+    server.settimeout(TIMEOUT)
+    arrived: List[float] = []
+
+    def accept():
+        try:
+            conn, _ = server.accept()
+            arrived.append(time.perf_counter())
+            conn.close()
+        except OSError:
+            pass
+
+    listener = threading.Thread(target=accept, daemon=True)
+    listener.start()
+    started = time.perf_counter()
+    proc = subprocess.Popen(command + ["download", "--ids", "1", "--set", "max_retries=1"], cwd=cwd,
+                            env=child_env(server.getsockname()[1]), stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        listener.join(TIMEOUT)
+        if not arrived:
+            raise RuntimeError("未检测到网络请求")
+        return arrived[0] - started
+    finally:
+        proc.kill()
+        proc.wait()
+        server.close()
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """耗时统计（毫秒）"""
+    values = sorted(sample * 1000 for sample in samples)
+    return {
+        "min": round(values[0], 1),
+        "median": round(statistics.median(values), 1),
+        "max": round(values[-1], 1)
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="测量启动耗时（每项启动 --runs 次新进程）")
+    parser.add_argument("--runs", type=int, default=10, help="每项测量次数 (默认 10)")
+    parser.add_argument("--python", default=sys.executable, help="使用的 Python 解释器")
+    parser.add_argument("--command", help="直接运行的程序（如打包后的可执行文件），替代 python main.py")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    command = [args.command] if args.command else [args.python, os.path.join(REPO, "main.py")]
+    benches = {}
+    if not args.command:
+        benches["interpreter"] = lambda cwd: time_process([args.python, "-c", "pass"], cwd)
+        benches["import"] = lambda cwd: time_process([args.python, "-c", "import main"], cwd)
+    benches["first_prompt"] = lambda cwd: time_first_prompt(command, cwd)
+    benches["first_request"] = lambda cwd: time_first_request(command, cwd)
+
+    results = {}
+    # 设置文件和缓存在第一次运行时创建，之后的运行测量的是日常启动
+    with tempfile.TemporaryDirectory() as cwd:
+        for name, bench in benches.items():
+            results[name] = summarize([bench(cwd) for _ in range(args.runs)])
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False))
+    else:
+        print(f"{'项目':16}{'最小(ms)':>10}{'中位数(ms)':>12}{'最大(ms)':>10}")
+        for name, stats in results.items():
+            print(f"{name:16}{stats['min']:>10}{stats['median']:>12}{stats['max']:>10}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
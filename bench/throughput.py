@@ -0,0 +1,157 @@
+import argparse
+import contextlib
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import mock_server
+
+# 下载吞吐量基准测试，全部请求发往本地模拟服务器（见 mock_server.py），不访问外网。
+# 依次测量四种流程，每种流程使用新的下载文件夹：
+#   single     逐首下载（与单曲下载菜单相同）
+#   batch      并发下载歌曲ID列表（批量下载）
+#   playlist   获取歌单后并发下载
+#   album      获取专辑后并发下载
+# 输出每种流程的 歌曲/分钟、MB/s（音频传输量）和每首歌曲耗时的 p50/p99。
+#
+# 用法:
+#   python bench/throughput.py [--tracks 20] [--latency 0.02] [--bandwidth 0] [--error-rate 0]
+#   python bench/throughput.py --set use_async=true --set concurrency=8 --json
+#   python bench/throughput.py --flows batch playlist --set interface=3
+
+FLOWS = ("single", "batch", "playlist", "album")
+
+# 各流程使用不同的ID，避免互相命中缓存
+FLOW_IDS = {"single": 1, "batch": 2, "playlist": 3, "album": 4}
+
+def percentile(values: List[float], ratio: float) -> float:
+    """最近秩百分位数"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(ratio * len(ordered)) - 1)]
+
+def timed_tracks(main_module) -> List[float]:
+    """记录每首歌曲的处理耗时（包装线程和异步模式的单曲下载函数）"""
+    durations: List[float] = []
+    download_track = main_module.download_track
+    download_track_async = main_module.download_track_async
+
+    def timed(music_id: str, settings: Dict[str, Any]) -> bool:
+        started = time.perf_counter()
+        try:
+            return download_track(music_id, settings)
+        finally:
+            durations.append(time.perf_counter() - started)
+
+    async def timed_async(music_id: str, settings: Dict[str, Any]) -> bool:
+        started = time.perf_counter()
+        try:
+            return await download_track_async(music_id, settings)
+        finally:
+            durations.append(time.perf_counter() - started)
+
+    main_module.download_track = timed
+    main_module.download_track_async = timed_async
+    return durations
+
+def run_flow(main_module, flow: str, tracks: int, settings: Dict[str, Any]) -> Dict[str, List[str]]:
+    """运行一种下载流程，返回成功和失败的歌曲ID"""
+    base = FLOW_IDS[flow] * 1000
+    music_ids = [str(base + offset) for offset in range(1, tracks + 1)]
+    if flow == "single":
+        result = {"success": [], "failed": []}
+        for music_id in music_ids:
+            ok = main_module.download_track(music_id, settings)
+            result["success" if ok else "failed"].append(music_id)
+        return result
+    if flow == "batch":
+        return main_module.run_tracks(music_ids, settings, "批量下载")
+
+    music_ids = main_module.fetch_collection(flow, str(FLOW_IDS[flow]), settings)
+    if music_ids is None:
+        raise RuntimeError(f"获取{flow}失败")
+    return main_module.run_tracks(music_ids, settings, f"{flow}下载", f"{flow}:{FLOW_IDS[flow]}")
+
+def bench_flow(main_module, server: mock_server.MockServer, flow: str, tracks: int,
+               make_settings: Callable[[str], Dict[str, Any]], durations: List[float]) -> Dict[str, Any]:
+    """在新的下载文件夹中运行一种流程并统计结果"""
+    with tempfile.TemporaryDirectory(prefix=f"bench-{flow}-") as folder:
+        settings = make_settings(folder)
+        durations.clear()
+        server.reset_stats()
+        started = time.perf_counter()
+        result = run_flow(main_module, flow, tracks, settings)
+        elapsed = time.perf_counter() - started
+
+    megabytes = server.stats["audio_bytes"] / 1024 / 1024
+    stats = {
+        "tracks": len(result["success"]) + len(result["failed"]),
+        "failed": len(result["failed"]),
+        "elapsed": round(elapsed, 2),
+        "tracks_per_min": round(len(result["success"]) / elapsed * 60, 1),
+        "mb_per_s": round(megabytes / elapsed, 1),
+        "requests": server.stats["requests"],
+        "errors": server.stats["errors"]
+    }
+    if durations:
+        stats["p50_ms"] = round(statistics.median(durations) * 1000)
+        stats["p99_ms"] = round(percentile(durations, 0.99) * 1000)
+    return stats
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="下载吞吐量基准测试（使用本地模拟服务器）")
+    parser.add_argument("--flows", nargs="+", choices=FLOWS, default=list(FLOWS), help="测量的流程 (默认全部)")
+    parser.add_argument("--set", action="append", default=[], dest="overrides", metavar="KEY=VALUE",
+                        help="修改下载设置（同 main.py --set），可重复使用")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    parser.add_argument("--verbose", action="store_true", help="显示下载日志")
+    mock_server.add_config_arguments(parser)
+    args = parser.parse_args()
+
+    import log_system
+    import main as main_module
+
+    changes = main_module.parse_overrides(parser, args.overrides)
+    log_system.configure(level="INFO" if args.verbose else "ERROR", to_file=False, json_file="")
+
+    server = mock_server.MockServer(mock_server.config_from_args(args)).start()
+    mock_server.point_to(server.url)
+    durations = timed_tracks(main_module)
+
+    def make_settings(folder: str) -> Dict[str, Any]:
+        settings = main_module.validate_settings({**main_module.DEFAULT_SETTINGS, **changes, "folder": folder})
+        main_module.apply_settings(settings)
+        return settings
+
+    results = {}
+    # 元数据缓存等文件写入临时目录，日志和进度条输出到标准错误
+    with tempfile.TemporaryDirectory(prefix="bench-") as cwd, contextlib.redirect_stdout(sys.stderr):
+        previous = os.getcwd()
+        os.chdir(cwd)
+        try:
+            for flow in args.flows:
+                results[flow] = bench_flow(main_module, server, flow, args.tracks, make_settings, durations)
+        finally:
+            log_system.flush()
+            os.chdir(previous)
+            server.stop()
+
+    if args.json:
+        print(json.dumps({"config": server.config, "overrides": changes, "results": results}, ensure_ascii=False))
+    else:
+        print(f"{'流程':10}{'歌曲':>6}{'失败':>6}{'耗时(s)':>10}{'歌曲/分钟':>12}{'MB/s':>8}{'p50(ms)':>10}{'p99(ms)':>10}")
+        for flow, stats in results.items():
+            print(f"{flow:10}{stats['tracks']:>6}{stats['failed']:>6}{stats['elapsed']:>10}"
+                  f"{stats['tracks_per_min']:>12}{stats['mb_per_s']:>8}"
+                  f"{stats.get('p50_ms', '-'):>10}{stats.get('p99_ms', '-'):>10}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
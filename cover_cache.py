@@ -0,0 +1,96 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Optional
+
+# 封面图片保存在内存中，按URL索引；同一专辑的歌曲共用一份
+# 缓存总大小上限，超出后按最近最少使用淘汰
+MAX_BYTES = 32 * 1024 * 1024
+
+_covers: "OrderedDict[str, bytes]" = OrderedDict()
+_total_bytes = 0
+_lock = threading.Lock()
+
+# 正在下载的封面，其他线程/协程等待同一次下载的结果
+_pending: Dict[str, Future] = {}
+_pending_async: Dict[str, asyncio.Future] = {}
+
+def get(url: str) -> Optional[bytes]:
+    """读取缓存的封面，未缓存返回None"""
+    with _lock:
+        data = _covers.get(url)
+        if data is not None:
+            _covers.move_to_end(url)
+        return data
+
+def put(url: str, data: bytes):
+    """缓存封面"""
+    global _total_bytes
+    with _lock:
+        old = _covers.pop(url, None)
+        if old is not None:
+            _total_bytes -= len(old)
+        _covers[url] = data
+        _total_bytes += len(data)
+        _evict()
+
+def _evict():
+    """淘汰最久未使用的封面直到不超过容量（调用方需持有锁）"""
+    global _total_bytes
+    while _total_bytes > MAX_BYTES and _covers:
+        _, data = _covers.popitem(last=False)
+        _total_bytes -= len(data)
+
+def fetch(url: str, loader: Callable[[], Optional[bytes]]) -> Optional[bytes]:
+    """获取封面：优先使用缓存，同一URL正在下载时等待其结果，否则调用loader下载"""
+    if not url:
+        return None
+
+    with _lock:
+        data = _covers.get(url)
+        if data is not None:
+            _covers.move_to_end(url)
+            return data
+        future = _pending.get(url)
+        is_owner = future is None
+        if is_owner:
+            future = _pending[url] = Future()
+
+    if not is_owner:
+        return future.result()
+
+    data = None
+    try:
+        data = loader()
+        if data:
+            put(url, data)
+    finally:
+        with _lock:
+            _pending.pop(url, None)
+        future.set_result(data)
+    return data
+
+async def fetch_async(url: str, loader: Callable[[], Awaitable[Optional[bytes]]]) -> Optional[bytes]:
+    """fetch 的异步版本"""
+    if not url:
+        return None
+
+    data = get(url)
+    if data is not None:
+        return data
+
+    future = _pending_async.get(url)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    future = _pending_async[url] = asyncio.get_running_loop().create_future()
+    data = None
+    try:
+        data = await loader()
+        if data:
+            put(url, data)
+    finally:
+        _pending_async.pop(url, None)
+        future.set_result(data)
+    return data
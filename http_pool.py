@@ -0,0 +1,121 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from urllib3.exceptions import InsecureRequestWarning, ProtocolError, ReadTimeoutError
+from typing import Dict, Iterator, List, Optional, Tuple
+
+requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+
+# ============= 连接池配置 =============
+# 未单独配置的主机使用默认连接池大小
+DEFAULT_POOL_SIZE = 10
+
+# 按主机单独指定连接池大小 {主机名: 连接数}
+HOST_POOL_SIZES: Dict[str, int] = {}
+
+_session: Optional[requests.Session] = None
+_mounted: Dict[str, int] = {}
+_lock = threading.Lock()
+
+def _pool_size(host: str) -> int:
+    """获取主机对应的连接池大小"""
+    return HOST_POOL_SIZES.get(host, DEFAULT_POOL_SIZE)
+
+def get_session() -> requests.Session:
+    """获取进程共享的会话（保持长连接）"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = requests.Session()
+    return _session
+
+def _ensure_adapter(url: str) -> requests.Session:
+    """为URL所在主机挂载独立的连接池"""
+    session = get_session()
+    parts = urlsplit(url)
+    host = parts.hostname or ""
+    prefix = f"{parts.scheme}://{parts.netloc}/"
+    size = _pool_size(host)
+
+    if _mounted.get(prefix) != size:
+        with _lock:
+            if _mounted.get(prefix) != size:
+                old_adapter = session.adapters.get(prefix)
+                session.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=size))
+                _mounted[prefix] = size
+                if old_adapter is not None:
+                    old_adapter.close()
+
+    return session
+
+def configure(pool_size: Optional[int] = None, host_sizes: Optional[Dict[str, int]] = None):
+    """调整连接池大小，已挂载的主机在下次请求时按新大小重建"""
+    global DEFAULT_POOL_SIZE
+    if pool_size:
+        DEFAULT_POOL_SIZE = max(1, int(pool_size))
+    if host_sizes:
+        HOST_POOL_SIZES.update({host: max(1, int(size)) for host, size in host_sizes.items()})
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """通过共享连接池发送请求"""
+    return _ensure_adapter(url).request(method, url, **kwargs)
+
+def get(url: str, **kwargs) -> requests.Response:
+    """GET请求"""
+    return request("GET", url, **kwargs)
+
+def post(url: str, **kwargs) -> requests.Response:
+    """POST请求"""
+    return request("POST", url, **kwargs)
+
+def iter_content(response: requests.Response, chunk_size: int) -> Iterator[memoryview]:
+    """按 chunk_size 读取响应内容（需 stream=True）
+
+    未压缩的响应用 readinto 直接读进同一个缓冲区，不为每块新建 bytes；
+    返回的内容在下一次迭代时会被覆盖，需在此之前写入。
+    """
+    encoding = response.headers.get("Content-Encoding", "identity").lower()
+    if encoding != "identity":
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            yield memoryview(chunk)
+        return
+
+    view = memoryview(bytearray(chunk_size))
+    while True:
+        filled = 0
+        error = None
+        try:
+            # 读满缓冲区或连接结束
+            while filled < chunk_size:
+                size = response.raw.readinto(view[filled:])
+                if not size:
+                    break
+                filled += size
+        # 与 requests 的 iter_content 一致，转换为 requests 的异常
+        except ProtocolError as e:
+            error = requests.exceptions.ChunkedEncodingError(e)
+        except ReadTimeoutError as e:
+            error = requests.exceptions.ConnectionError(e)
+        # 连接中断前已读到的部分也要交给调用方写入
+        if filled:
+            yield view[:filled]
+        if error is not None:
+            raise error
+        if filled < chunk_size:
+            return
+
+def split_ranges(total_size: int, segments: int) -> List[Tuple[int, int]]:
+    """将文件按字节拆分为若干段 [(起始, 结束)]，结束位置包含在内（用于Range请求）"""
+    size = -(-total_size // segments)
+    return [(start, min(start + size, total_size) - 1) for start in range(0, total_size, size)]
+
+def close():
+    """关闭共享会话及其全部连接"""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+        _mounted.clear()
@@ -0,0 +1,279 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple
+
+# 下载任务队列保存在下载文件夹内：每次批量下载（歌单、专辑、批量、搜索、同步）是一个任务，
+# 任务中每首歌曲的状态在变化时立即写入，程序崩溃或中断后可从中断处继续。
+# 多个进程可以同时使用同一个队列，每个进程只处理自己认领的任务。
+JOBS_NAME = ".jobs.db"
+
+# 歌曲状态: 等待 -> 已获取链接 -> 下载中 -> 已写标签 -> 完成 / 失败
+STATES = ("pending", "resolved", "downloading", "tagged", "done", "failed")
+
+# 每首歌曲最多尝试的次数（继续任务时，未超过次数的失败歌曲会重试）
+MAX_ATTEMPTS = 3
+
+# 运行中的进程每隔 HEARTBEAT_INTERVAL 秒更新心跳，超过 STALE_SECONDS 秒未更新视为进程已退出（同一台机器上直接检查进程是否存在）
+HEARTBEAT_INTERVAL = 10.0
+STALE_SECONDS = 60.0
+
+# 已完成的任务保留天数
+KEEP_FINISHED_DAYS = 30
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+_conns: Dict[str, sqlite3.Connection] = {}
+_lock = threading.Lock()
+# 本进程认领的任务 {(文件夹, 任务ID)}，由心跳线程定期续期
+_owned: set = set()
+_heartbeat_thread: Optional[threading.Thread] = None
+
+def _connect(folder: str) -> sqlite3.Connection:
+    """打开文件夹对应的任务队列（调用方需持有锁）"""
+    key = os.path.abspath(folder)
+    conn = _conns.get(key)
+    if conn is None:
+        os.makedirs(folder, exist_ok=True)
+        # 其他进程写入时最多等待30秒
+        conn = sqlite3.connect(os.path.join(folder, JOBS_NAME), timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # 每次提交都写入磁盘，断电后也不会丢失已记录的状态
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " title TEXT NOT NULL,"
+            " source TEXT,"
+            " status TEXT NOT NULL,"
+            " owner TEXT,"
+            " heartbeat REAL,"
+            " created REAL NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " job_id INTEGER NOT NULL,"
+            " position INTEGER NOT NULL,"
+            " music_id TEXT NOT NULL,"
+            " state TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL,"
+            " updated REAL NOT NULL,"
+            " PRIMARY KEY (job_id, music_id))"
+        )
+        conn.execute(
+            "DELETE FROM tasks WHERE job_id IN (SELECT job_id FROM jobs WHERE status != 'active' AND updated < ?)",
+            (time.time() - KEEP_FINISHED_DAYS * 86400,)
+        )
+        conn.execute("DELETE FROM jobs WHERE status != 'active' AND updated < ?", (time.time() - KEEP_FINISHED_DAYS * 86400,))
+        conn.commit()
+        _conns[key] = conn
+    return conn
+
+def _pid_exists(pid: int) -> Optional[bool]:
+    """本机上该进程是否存在，无法判断时返回None"""
+    if os.name == "nt":
+        return _pid_exists_nt(pid)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return None
+    return True
+
+def _pid_exists_nt(pid: int) -> Optional[bool]:
+    """Windows 上 os.kill(pid, 0) 会向进程发送 CTRL_C_EVENT，改为打开进程查询退出码"""
+    import ctypes
+    from ctypes import wintypes
+
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    STILL_ACTIVE = 259
+    ERROR_ACCESS_DENIED = 5
+    ERROR_INVALID_PARAMETER = 87
+
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    kernel32.OpenProcess.argtypes = [wintypes.DWORD, wintypes.BOOL, wintypes.DWORD]
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    kernel32.GetExitCodeProcess.argtypes = [wintypes.HANDLE, ctypes.POINTER(wintypes.DWORD)]
+    kernel32.GetExitCodeProcess.restype = wintypes.BOOL
+    kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        error = ctypes.get_last_error()
+        if error == ERROR_INVALID_PARAMETER:
+            return False
+        # 没有权限说明进程存在
+        return True if error == ERROR_ACCESS_DENIED else None
+    try:
+        code = wintypes.DWORD()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+            return None
+        return code.value == STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
+
+def _owner_alive(owner: Optional[str], heartbeat: Optional[float]) -> bool:
+    """认领任务的进程是否仍在运行：同一台机器上直接检查进程，其他机器看心跳是否过期"""
+    if not owner or owner == OWNER:
+        return False
+    hostname, _, pid = owner.rpartition(":")
+    if hostname == socket.gethostname() and pid.isdigit() and _pid_exists(int(pid)) is False:
+        return False
+    return heartbeat is not None and heartbeat >= time.time() - STALE_SECONDS
+
+def _claim(conn: sqlite3.Connection, folder: str, job_id: int) -> bool:
+    """认领未被其他运行中进程占用的任务（调用方需持有锁）"""
+    row = conn.execute("SELECT owner, heartbeat FROM jobs WHERE job_id = ? AND status = 'active'", (job_id,)).fetchone()
+    if row is None or _owner_alive(*row):
+        return False
+    now = time.time()
+    # 只在 owner 未被其他进程改动时认领，避免两个进程同时认领同一任务
+    cursor = conn.execute(
+        "UPDATE jobs SET owner = ?, heartbeat = ?, updated = ? WHERE job_id = ? AND status = 'active' AND owner IS ?",
+        (OWNER, now, now, job_id, row[0])
+    )
+    conn.commit()
+    if cursor.rowcount != 1:
+        return False
+    _owned.add((folder, job_id))
+    _ensure_heartbeat()
+    return True
+
+def _ensure_heartbeat():
+    global _heartbeat_thread
+    if _heartbeat_thread is None:
+        _heartbeat_thread = threading.Thread(target=_heartbeat_loop, name="job-heartbeat", daemon=True)
+        _heartbeat_thread.start()
+
+def _heartbeat_loop():
+    """后台线程：为本进程认领的任务续期"""
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        with _lock:
+            for folder, job_id in list(_owned):
+                try:
+                    conn = _connect(folder)
+                    conn.execute("UPDATE jobs SET heartbeat = ? WHERE job_id = ? AND owner = ?",
+                                 (time.time(), job_id, OWNER))
+                    conn.commit()
+                except sqlite3.Error:
+                    pass
+
+def open_job(folder: str, title: str, music_ids: List[str], source: Optional[str] = None) -> Tuple[Optional[int], bool]:
+    """创建并认领任务，返回 (任务ID, 是否继续了未完成的任务)
+
+    source 相同的未完成任务会被继续（新增的歌曲追加到末尾）；
+    该任务正被其他运行中的进程处理时返回 (None, False)，避免两个进程写入同一批文件。
+    """
+    now = time.time()
+    with _lock:
+        conn = _connect(folder)
+        if source:
+            rows = conn.execute(
+                "SELECT job_id FROM jobs WHERE source = ? AND status = 'active' ORDER BY job_id DESC", (source,)
+            ).fetchall()
+            for (job_id,) in rows:
+                if _claim(conn, folder, job_id):
+                    _add_tracks(conn, job_id, music_ids, now)
+                    return job_id, True
+            if rows:
+                return None, False
+
+        cursor = conn.execute(
+            "INSERT INTO jobs (title, source, status, owner, heartbeat, created, updated) VALUES (?, ?, 'active', ?, ?, ?, ?)",
+            (title, source, OWNER, now, now, now)
+        )
+        job_id = cursor.lastrowid
+        _add_tracks(conn, job_id, music_ids, now)
+        _owned.add((folder, job_id))
+        _ensure_heartbeat()
+        return job_id, False
+
+def _add_tracks(conn: sqlite3.Connection, job_id: int, music_ids: List[str], now: float):
+    """追加任务中还没有的歌曲（调用方需持有锁）"""
+    start = conn.execute("SELECT COALESCE(MAX(position), 0) FROM tasks WHERE job_id = ?", (job_id,)).fetchone()[0]
+    conn.executemany(
+        "INSERT OR IGNORE INTO tasks (job_id, position, music_id, state, attempts, updated) VALUES (?, ?, ?, 'pending', 0, ?)",
+        [(job_id, start + offset, str(music_id), now) for offset, music_id in enumerate(music_ids, 1)]
+    )
+    conn.commit()
+
+def claim_job(folder: str, job_id: int) -> bool:
+    """认领指定的未完成任务，已完成或正被其他进程运行时返回False"""
+    with _lock:
+        return _claim(_connect(folder), folder, job_id)
+
+def release_job(folder: str, job_id: int, finished: bool):
+    """运行结束（finished 为True）或中断时释放任务，中断的任务之后可以继续"""
+    with _lock:
+        _owned.discard((folder, job_id))
+        conn = _connect(folder)
+        conn.execute(
+            "UPDATE jobs SET owner = NULL, heartbeat = NULL, status = ?, updated = ? WHERE job_id = ? AND owner = ?",
+            ("finished" if finished else "active", time.time(), job_id, OWNER)
+        )
+        conn.commit()
+
+def cancel_job(folder: str, job_id: int):
+    """放弃未完成的任务"""
+    with _lock:
+        conn = _connect(folder)
+        conn.execute("UPDATE jobs SET status = 'cancelled', updated = ? WHERE job_id = ? AND status = 'active'",
+                     (time.time(), job_id))
+        conn.commit()
+
+def pending_tracks(folder: str, job_id: int) -> List[Tuple[int, str]]:
+    """需要处理的歌曲 [(序号, 歌曲ID)]：未完成的，以及失败但未达到最大尝试次数的"""
+    with _lock:
+        rows = _connect(folder).execute(
+            "SELECT position, music_id FROM tasks "
+            "WHERE job_id = ? AND state != 'done' AND NOT (state = 'failed' AND attempts >= ?) ORDER BY position",
+            (job_id, MAX_ATTEMPTS)
+        ).fetchall()
+    return [(row[0], row[1]) for row in rows]
+
+def start_track(folder: str, job_id: int, music_id: str):
+    """开始处理一首歌曲，记录尝试次数"""
+    with _lock:
+        conn = _connect(folder)
+        conn.execute(
+            "UPDATE tasks SET state = 'pending', attempts = attempts + 1, updated = ? WHERE job_id = ? AND music_id = ?",
+            (time.time(), job_id, music_id)
+        )
+        conn.commit()
+
+def set_state(folder: str, job_id: int, music_id: str, state: str):
+    """记录歌曲状态（见 STATES）"""
+    with _lock:
+        conn = _connect(folder)
+        conn.execute("UPDATE tasks SET state = ?, updated = ? WHERE job_id = ? AND music_id = ?",
+                     (state, time.time(), job_id, music_id))
+        conn.commit()
+
+def job_tracks(folder: str, job_id: int) -> List[Tuple[str, str]]:
+    """任务中全部歌曲 [(歌曲ID, 状态)]，按加入顺序"""
+    with _lock:
+        rows = _connect(folder).execute(
+            "SELECT music_id, state FROM tasks WHERE job_id = ? ORDER BY position", (job_id,)
+        ).fetchall()
+    return [(row[0], row[1]) for row in rows]
+
+def unfinished_jobs(folder: str) -> List[Dict[str, Any]]:
+    """未完成、且没有被运行中的进程占用的任务"""
+    if not os.path.exists(os.path.join(folder, JOBS_NAME)):
+        return []
+    with _lock:
+        rows = _connect(folder).execute(
+            "SELECT j.job_id, j.title, j.source, j.created, COUNT(t.music_id), "
+            " COALESCE(SUM(CASE WHEN t.state = 'done' THEN 1 ELSE 0 END), 0), j.owner, j.heartbeat "
+            "FROM jobs j LEFT JOIN tasks t ON t.job_id = j.job_id "
+            "WHERE j.status = 'active' GROUP BY j.job_id ORDER BY j.job_id"
+        ).fetchall()
+    return [
+        {"job_id": row[0], "title": row[1], "source": row[2], "created": row[3], "total": row[4], "done": row[5]}
+        for row in rows if not _owner_alive(row[6], row[7])
+    ]
@@ -0,0 +1,199 @@
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple
+
+# 清单文件保存在下载文件夹内
+MANIFEST_NAME = ".manifest.db"
+
+# 同步时归档被移除歌曲的子文件夹
+ARCHIVE_FOLDER = "_archive"
+
+# 下载文件名格式: {歌曲名}_{歌曲ID}.{扩展名}
+FILENAME_PATTERN = re.compile(r"_(\d+)\.(mp3|flac)$", re.IGNORECASE)
+
+_conns: Dict[str, sqlite3.Connection] = {}
+_lock = threading.Lock()
+
+def _connect(folder: str) -> sqlite3.Connection:
+    """打开文件夹对应的清单（调用方需持有锁），每个进程第一次打开时与文件夹中的文件对照"""
+    key = os.path.abspath(folder)
+    conn = _conns.get(key)
+    if conn is None:
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, MANIFEST_NAME)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            " music_id TEXT PRIMARY KEY,"
+            " path TEXT NOT NULL,"
+            " level TEXT,"
+            " size INTEGER NOT NULL,"
+            # 早期版本记录的文件SHA1，已不再计算（需要把整个文件再读一遍），保留该列以兼容旧清单
+            " checksum TEXT,"
+            " tagged INTEGER,"
+            " updated REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS collections ("
+            " kind TEXT NOT NULL,"
+            " collection_id TEXT NOT NULL,"
+            " track_ids TEXT NOT NULL,"
+            " updated REAL NOT NULL,"
+            " PRIMARY KEY (kind, collection_id))"
+        )
+        conn.commit()
+        _conns[key] = conn
+        # 程序不运行时文件夹中的文件可能被添加或删除
+        _reconcile(conn, folder)
+    return conn
+
+def _reconcile(conn: sqlite3.Connection, folder: str) -> Tuple[int, int]:
+    """扫描文件夹：登记清单中没有的文件，删除文件已不存在的记录，返回 (新增数, 删除数)"""
+    names = set()
+    found: Dict[str, tuple] = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            names.add(entry.name)
+            match = FILENAME_PATTERN.search(entry.name)
+            if match:
+                found[match.group(1)] = (entry.name, entry.stat().st_size)
+
+    known = dict(conn.execute("SELECT music_id, path FROM tracks").fetchall())
+    missing = {music_id for music_id, path in known.items() if path not in names}
+    now = time.time()
+    # 扫描得到的文件无法得知音质和标签状态，记为未知
+    added = [
+        (music_id, name, None, size, None, None, now)
+        for music_id, (name, size) in found.items()
+        if music_id not in known or music_id in missing
+    ]
+    conn.executemany("DELETE FROM tracks WHERE music_id = ?", [(music_id,) for music_id in missing])
+    conn.executemany(
+        "INSERT OR REPLACE INTO tracks (music_id, path, level, size, checksum, tagged, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        added
+    )
+    conn.commit()
+    return len(added), len(missing)
+
+def rebuild(folder: str) -> int:
+    """清空清单并重新扫描文件夹（已记录的音质和标签状态会丢失），返回登记的文件数"""
+    with _lock:
+        conn = _connect(folder)
+        conn.execute("DELETE FROM tracks")
+        return _reconcile(conn, folder)[0]
+
+def lookup(folder: str, music_id: str) -> Optional[Dict[str, Any]]:
+    """查询清单中的歌曲记录"""
+    with _lock:
+        row = _connect(folder).execute(
+            "SELECT path, level, size, tagged FROM tracks WHERE music_id = ?", (str(music_id),)
+        ).fetchone()
+    if row is None:
+        return None
+    return {"path": row[0], "level": row[1], "size": row[2], "tagged": row[3]}
+
+def is_downloaded(folder: str, music_id: str, level: str) -> bool:
+    """判断歌曲是否已下载完成（只检查清单和文件大小，不发网络请求）"""
+    entry = lookup(folder, music_id)
+    if entry is None:
+        return False
+
+    # 音质不同或上次写入标签失败时需要重新下载
+    if entry["level"] is not None and entry["level"] != level:
+        return False
+    if entry["tagged"] == 0:
+        return False
+
+    try:
+        size = os.stat(os.path.join(folder, entry["path"])).st_size
+    except OSError:
+        forget(folder, music_id)
+        return False
+
+    if size != entry["size"]:
+        forget(folder, music_id)
+        return False
+    return True
+
+def record(folder: str, music_id: str, filepath: str, level: str, tagged: bool):
+    """登记下载完成的歌曲"""
+    size = os.path.getsize(filepath)
+    with _lock:
+        conn = _connect(folder)
+        conn.execute(
+            "INSERT OR REPLACE INTO tracks (music_id, path, level, size, checksum, tagged, updated) VALUES (?, ?, ?, ?, NULL, ?, ?)",
+            (str(music_id), os.path.basename(filepath), level, size, int(tagged), time.time())
+        )
+        conn.commit()
+
+def forget(folder: str, music_id: str):
+    """从清单中删除歌曲"""
+    with _lock:
+        conn = _connect(folder)
+        conn.execute("DELETE FROM tracks WHERE music_id = ?", (str(music_id),))
+        conn.commit()
+
+def remove_track(folder: str, music_id: str, archive: bool = True) -> int:
+    """删除或归档歌曲的音频和歌词文件，并从清单中删除，返回处理的文件数"""
+    entry = lookup(folder, music_id)
+    if entry is None:
+        return 0
+
+    stem = os.path.splitext(entry["path"])[0]
+    archive_dir = os.path.join(folder, ARCHIVE_FOLDER)
+    handled = 0
+    for name in (entry["path"], f"{stem}.lrc"):
+        path = os.path.join(folder, name)
+        if not os.path.exists(path):
+            continue
+        if archive:
+            os.makedirs(archive_dir, exist_ok=True)
+            shutil.move(path, os.path.join(archive_dir, name))
+        else:
+            os.remove(path)
+        handled += 1
+
+    forget(folder, music_id)
+    return handled
+
+# ============= 歌单/专辑快照 =============
+def get_snapshot(folder: str, kind: str, collection_id: str) -> Optional[List[str]]:
+    """读取上次同步时记录的歌曲ID列表，从未同步过返回None"""
+    with _lock:
+        row = _connect(folder).execute(
+            "SELECT track_ids FROM collections WHERE kind = ? AND collection_id = ?", (kind, str(collection_id))
+        ).fetchone()
+    return json.loads(row[0]) if row else None
+
+def save_snapshot(folder: str, kind: str, collection_id: str, track_ids: List[str]):
+    """记录本次同步的歌曲ID列表"""
+    with _lock:
+        conn = _connect(folder)
+        conn.execute(
+            "INSERT OR REPLACE INTO collections (kind, collection_id, track_ids, updated) VALUES (?, ?, ?, ?)",
+            (kind, str(collection_id), json.dumps(track_ids), time.time())
+        )
+        conn.commit()
+
+def is_referenced(folder: str, music_id: str, kind: str, collection_id: str) -> bool:
+    """判断歌曲是否还属于同一文件夹中的其他歌单/专辑"""
+    with _lock:
+        rows = _connect(folder).execute(
+            "SELECT track_ids FROM collections WHERE NOT (kind = ? AND collection_id = ?)", (kind, str(collection_id))
+        ).fetchall()
+    return any(str(music_id) in json.loads(row[0]) for row in rows)
+
+def close():
+    """关闭全部清单"""
+    with _lock:
+        for conn in _conns.values():
+            conn.close()
+        _conns.clear()
@@ -0,0 +1,178 @@
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import progress
+
+# 全部模块共用的日志系统：调用方只做级别过滤并把记录放入队列，
+# 格式化、控制台输出和写文件都在后台线程中完成，不阻塞下载
+
+# 日志颜色
+LOG_COLORS = {
+    "DEBUG": "\033[90m",     # 灰色
+    "INFO": "\033[94m",      # 蓝色
+    "SUCCESS": "\033[92m",   # 绿色
+    "WARNING": "\033[93m",   # 黄色
+    "ERROR": "\033[91m",     # 红色
+    "END": "\033[0m"         # 重置颜色
+}
+
+LEVEL_PRIORITY = {"DEBUG": 0, "INFO": 1, "SUCCESS": 1, "WARNING": 2, "ERROR": 3}
+
+# 并发下载时当前任务处理的歌曲序号（线程和协程通用），标注在日志前
+track_tag = contextvars.ContextVar("track_tag", default=None)
+
+_config: Dict[str, Any] = {
+    "level": "INFO",
+    "to_file": False,
+    "log_file": "music_downloader.log",
+    "max_file_size": 10 * 1024 * 1024,
+    "backup_count": 3,
+    "json_file": ""
+}
+# 低于该优先级的日志在调用方直接丢弃
+_threshold = LEVEL_PRIORITY["INFO"]
+
+_queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+_thread: Optional[threading.Thread] = None
+_thread_lock = threading.Lock()
+# 文件输出 [(处理器, 是否为 JSON Lines)]，由后台线程独占，重新配置时在队列中按顺序切换
+_handlers: List[Tuple[logging.Handler, bool]] = []
+# 子进程（如写标签进程池）中不直接输出，日志收集在这里，由主进程取回后输出
+_captured: Optional[List[tuple]] = None
+
+def configure(**options: Any):
+    """设置日志级别和输出（level, to_file, log_file, max_file_size, backup_count, json_file）"""
+    global _threshold
+    _config.update(options)
+    _threshold = LEVEL_PRIORITY.get(str(_config["level"]).upper(), LEVEL_PRIORITY["INFO"])
+    # 日志文件在后台线程启动后（第一次记录日志时）才打开
+    _queue.put(_open_handlers)
+
+def is_enabled(level: str) -> bool:
+    """该级别的日志是否会输出"""
+    return LEVEL_PRIORITY.get(level, 1) >= _threshold
+
+def log(level: str, message: str, module: str = "MAIN"):
+    """记录日志（低于配置级别的直接丢弃，其余交给后台线程输出）"""
+    if LEVEL_PRIORITY.get(level, 1) < _threshold:
+        return
+    if _captured is not None:
+        _captured.append((time.time(), level, module, None, message))
+        return
+    _queue.put((time.time(), level, module, track_tag.get(), message))
+    if _thread is None:
+        _ensure_thread()
+
+def start_capture():
+    """之后的日志只收集不输出（在子进程中调用），用 take_captured 取回"""
+    global _captured
+    _captured = []
+
+def take_captured() -> List[tuple]:
+    """取回并清空收集到的日志"""
+    global _captured
+    if _captured is None:
+        return []
+    records = _captured
+    _captured = []
+    return records
+
+def replay(records: List[tuple]):
+    """输出子进程收集的日志（保留原时间，标注当前任务的歌曲序号）"""
+    tag = track_tag.get()
+    for created, level, module, _, message in records:
+        if LEVEL_PRIORITY.get(level, 1) >= _threshold:
+            _queue.put((created, level, module, tag, message))
+    if records and _thread is None:
+        _ensure_thread()
+
+def flush(timeout: float = 5.0):
+    """等待已记录的日志全部输出（提示输入前调用，避免日志出现在提示之后）"""
+    if _thread is None or _thread is threading.current_thread():
+        return
+    done = threading.Event()
+    _queue.put(done)
+    done.wait(timeout)
+
+def _ensure_thread():
+    global _thread
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_writer_loop, name="log-writer", daemon=True)
+            _thread.start()
+            atexit.register(flush)
+
+def _open_handlers():
+    """按当前配置重新打开日志文件（在后台线程中执行）"""
+    import logging.handlers
+
+    for handler, _ in _handlers:
+        handler.close()
+    _handlers.clear()
+
+    outputs = []
+    if _config["to_file"] and _config["log_file"]:
+        outputs.append((_config["log_file"], False))
+    if _config["json_file"]:
+        outputs.append((_config["json_file"], True))
+    for path, json_lines in outputs:
+        try:
+            handler = logging.handlers.RotatingFileHandler(
+                path,
+                maxBytes=_config["max_file_size"],
+                backupCount=_config["backup_count"],
+                encoding='utf-8'
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            _handlers.append((handler, json_lines))
+        except Exception as e:
+            print(f"无法创建日志文件: {e}")
+
+def _write(record: tuple):
+    """输出一条日志到控制台和日志文件"""
+    created, level, module, tag, message = record
+    moment = datetime.fromtimestamp(created)
+    text = f"[{tag}] {message}" if tag else message
+    color = LOG_COLORS.get(level.upper(), LOG_COLORS["INFO"])
+
+    with progress.print_lock:
+        # 先擦除进度条，日志打印后由进度线程重新绘制
+        progress.clear()
+        print(f"{color}[{moment:%H:%M:%S}] [{module:8}] {text}{LOG_COLORS['END']}", flush=True)
+
+    for handler, json_lines in _handlers:
+        if json_lines:
+            line = json.dumps({
+                "time": moment.isoformat(timespec="milliseconds"),
+                "level": level.upper(),
+                "module": module,
+                "track": tag,
+                "message": message
+            }, ensure_ascii=False)
+        else:
+            line = f"{moment:%Y-%m-%d %H:%M:%S} [{level.upper()}] [{module}] {text}"
+        handler.emit(logging.makeLogRecord({"msg": line}))
+
+def _writer_loop():
+    """后台线程：依次处理队列中的日志、配置变更和 flush 请求"""
+    while True:
+        item = _queue.get()
+        try:
+            if isinstance(item, threading.Event):
+                for handler, _ in _handlers:
+                    handler.flush()
+                item.set()
+            elif callable(item):
+                item()
+            else:
+                _write(item)
+        except Exception:
+            # 输出失败不能让日志线程退出
+            pass
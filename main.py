@@ -1,15 +1,27 @@
-import API_1
-import API_2
+import meta_cache
+import library
+import progress
+import part_file
+import log_system
+import job_queue
+import metrics
+import rate_limit
+import retry_policy
+import router
+import tagging
+import argparse
+import contextlib
+import contextvars
+import multiprocessing
 import os
 import json
 import re
-import requests
 import sys
-from mutagen.mp3 import MP3
-from mutagen.id3 import ID3, TIT2, TPE1, TALB, APIC
-from mutagen.flac import FLAC, Picture
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 
 # ============= 日志系统配置 =============
 LOG_CONFIG = {
@@ -17,94 +29,32 @@ LOG_CONFIG = {
     "to_file": True,
     "log_file": "music_downloader.log",
     "max_file_size": 10 * 1024 * 1024,  # 10MB
-    "backup_count": 3
+    "backup_count": 3,
+    "json_file": ""  # JSON Lines 格式的日志文件（便于导入分析），空字符串表示不输出
 }
 
-LOG_COLORS = {
-    "DEBUG": "\033[90m",     # 灰色
-    "INFO": "\033[94m",      # 蓝色
-    "SUCCESS": "\033[92m",   # 绿色
-    "WARNING": "\033[93m",   # 黄色
-    "ERROR": "\033[91m",     # 红色
-    "END": "\033[0m"         # 重置颜色
-}
+LOG_COLORS = log_system.LOG_COLORS
 
 # 全局日志函数
 def setup_logger():
-    """设置日志系统"""
-    import logging
-    import logging.handlers
-    
-    logger = logging.getLogger('MusicDownloader')
-    logger.setLevel(getattr(logging, LOG_CONFIG['level']))
-    
-    # 清除现有处理器
-    if logger.handlers:
-        logger.handlers.clear()
-    
-    # 控制台处理器
-    console_handler = logging.StreamHandler()
-    console_formatter = logging.Formatter('%(message)s')
-    console_handler.setFormatter(console_formatter)
-    logger.addHandler(console_handler)
-    
-    # 文件处理器（如果启用）
-    if LOG_CONFIG['to_file']:
-        try:
-            file_handler = logging.handlers.RotatingFileHandler(
-                LOG_CONFIG['log_file'],
-                maxBytes=LOG_CONFIG['max_file_size'],
-                backupCount=LOG_CONFIG['backup_count'],
-                encoding='utf-8'
-            )
-            file_formatter = logging.Formatter(
-                '%(asctime)s [%(levelname)s] %(message)s',
-                datefmt='%Y-%m-%d %H:%M:%S'
-            )
-            file_handler.setFormatter(file_formatter)
-            logger.addHandler(file_handler)
-        except Exception as e:
-            print(f"无法创建日志文件: {e}")
-    
-    return logger
+    """设置日志系统（全部模块共用，见 log_system；日志文件在第一次记录日志时才打开）"""
+    log_system.configure(**LOG_CONFIG)
 
-# 创建日志器
-logger = setup_logger()
+# 并发下载时记录当前任务处理的歌曲序号（线程和协程通用）
+_track_tag = log_system.track_tag
 
 def log(level: str, message: str, module: str = "MAIN"):
     """自定义日志函数"""
-    # 过滤级别
-    level_priority = {"DEBUG": 0, "INFO": 1, "SUCCESS": 1, "WARNING": 2, "ERROR": 3}
-    config_priority = level_priority.get(LOG_CONFIG['level'].upper(), 1)
-    msg_priority = level_priority.get(level.upper(), 1)
-    
-    if msg_priority < config_priority:
-        return
-    
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    color = LOG_COLORS.get(level.upper(), LOG_COLORS["INFO"])
-    
-    # 构建日志消息
-    log_msg = f"[{timestamp}] [{module:8}] {message}"
-    
-    # 输出到控制台（带颜色）
-    if level.upper() == "SUCCESS":
-        level_display = "SUCCESS"
-    else:
-        level_display = level.upper()
-    
-    colored_msg = f"{color}[{timestamp}] [{module:8}] {message}{LOG_COLORS['END']}"
-    print(colored_msg)
-    
-    # 输出到日志文件（无颜色）
-    if LOG_CONFIG['to_file']:
-        if level.upper() == "SUCCESS":
-            logger.info(f"[{module}] {message}")
-        else:
-            getattr(logger, level.lower(), logger.info)(f"[{module}] {message}")
+    log_system.log(level, message, module)
+
+def prompt(text: str) -> str:
+    """等待已记录的日志输出完后再提示输入"""
+    log_system.flush()
+    return input(text)
 
 def print_header(text: str):
     """打印标题"""
+    log_system.flush()
     border = "=" * 60
     print(f"\n{LOG_COLORS['INFO']}{border}")
     print(f"{text.center(60)}")
@@ -121,7 +71,23 @@ DEFAULT_SETTINGS = {
     "folder": "Music",
     "max_retries": 3,
     "timeout": 30,
-    "verify_ssl": False
+    "verify_ssl": False,
+    "concurrency": 4,
+    "use_async": False,
+    "cache_enabled": True,
+    "skip_existing": True,
+    "sync_removed": "keep",
+    "segments": 4,
+    "segment_threshold_mb": 32,
+    "stream_tagging": True,
+    "tag_workers": 2,
+    "tag_queue": 8,
+    "chunk_size_kb": 256,
+    "preallocate": True,
+    "auto_route": True,
+    "rate_limit": rate_limit.DEFAULT_RATE,
+    "rate_burst": rate_limit.DEFAULT_BURST,
+    "export_metrics": False
 }
 
 VALID_SETTINGS = {
@@ -152,6 +118,79 @@ VALID_SETTINGS = {
     "verify_ssl": {
         "type": bool,
         "description": "是否验证SSL证书"
+    },
+    "concurrency": {
+        "type": int,
+        "range": [1, 256],  # 连续值范围 [最小值, 最大值]
+        "description": "同时下载的歌曲数量"
+    },
+    "use_async": {
+        "type": bool,
+        "description": "是否使用异步引擎（单线程事件循环，适合大量并发，需要aiohttp）"
+    },
+    "cache_enabled": {
+        "type": bool,
+        "description": "是否缓存歌曲信息、歌词和专辑/歌单列表（metadata_cache.db）"
+    },
+    "skip_existing": {
+        "type": bool,
+        "description": "是否跳过下载文件夹中已有的歌曲（按文件夹内的 .manifest.db 清单判断）"
+    },
+    "sync_removed": {
+        "type": str,
+        "range": ["keep", "archive", "delete"],  # 离散值列表
+        "description": "同步时如何处理已从歌单/专辑移除的歌曲: keep=保留, archive=移到_archive, delete=删除"
+    },
+    "segments": {
+        "type": int,
+        "range": [1, 16],  # 连续值范围 [最小值, 最大值]
+        "description": "大文件分段下载的并发连接数"
+    },
+    "segment_threshold_mb": {
+        "type": int,
+        "range": [0, 4096],  # 连续值范围 [最小值, 最大值]
+        "description": "超过该大小(MB)的文件分段下载，0=不分段"
+    },
+    "stream_tagging": {
+        "type": bool,
+        "description": "是否边下载边写标签（下载前写好标签和封面，音频文件只写入一次）"
+    },
+    "tag_workers": {
+        "type": int,
+        "range": [0, 16],  # 连续值范围 [最小值, 最大值]
+        "description": "下载完成后写标签的进程数，0=在下载线程中写标签"
+    },
+    "tag_queue": {
+        "type": int,
+        "range": [1, 64],  # 连续值范围 [最小值, 最大值]
+        "description": "等待写标签的文件数上限，写标签跟不上时下载线程等待"
+    },
+    "chunk_size_kb": {
+        "type": int,
+        "range": [16, 8192],  # 连续值范围 [最小值, 最大值]
+        "description": "下载时每次读取和写入的块大小(KB)"
+    },
+    "preallocate": {
+        "type": bool,
+        "description": "是否在下载前按文件大小预分配磁盘空间"
+    },
+    "auto_route": {
+        "type": bool,
+        "description": "是否自动选择延迟低、出错少的接口（优先使用设置的接口），接口失败时自动切换"
+    },
+    "rate_limit": {
+        "type": int,
+        "range": [0, 100],  # 连续值范围 [最小值, 最大值]
+        "description": "每个接口服务器每秒最多请求次数，0=不限制（服务器限流时自动降低）"
+    },
+    "rate_burst": {
+        "type": int,
+        "range": [1, 100],  # 连续值范围 [最小值, 最大值]
+        "description": "空闲后允许连续发出的请求数"
+    },
+    "export_metrics": {
+        "type": bool,
+        "description": "是否导出各阶段耗时统计（metrics.prom 为 Prometheus 文本格式，metrics.json 为汇总）"
     }
 }
 
@@ -215,10 +254,8 @@ def validate_settings(settings: Dict[str, Any]) -> Dict[str, Any]:
     
     return validated
 
-def load_settings() -> Dict[str, Any]:
+def load_settings(settings_file: str = "settings.json") -> Dict[str, Any]:
     """加载设置文件"""
-    settings_file = "settings.json"
-    
     if os.path.exists(settings_file):
         try:
             with open(settings_file, 'r', encoding='utf-8') as f:
@@ -265,347 +302,897 @@ def save_settings(settings: Dict[str, Any]):
         log("ERROR", f"保存设置失败: {e}")
         return settings
 
+def apply_settings(settings: Dict[str, Any]):
+    """将设置应用到各子系统"""
+    meta_cache.configure(enabled=settings["cache_enabled"])
+    rate_limit.configure(rate=settings["rate_limit"], burst=settings["rate_burst"])
+    metrics.configure(enabled=settings["export_metrics"])
+    tagging.configure(workers=settings["tag_workers"], queue_size=settings["tag_queue"])
+
+def export_metrics():
+    """写入统计文件（开启 export_metrics 时）"""
+    try:
+        if metrics.export():
+            log("DEBUG", f"统计已写入: {metrics.METRICS_CONFIG['prometheus_file']}, {metrics.METRICS_CONFIG['json_file']}")
+    except OSError as e:
+        log("WARNING", f"写入统计文件失败: {e}")
+
 # ============= 下载函数 =============
-def API_1_download(music_id: str, settings: Dict[str, Any]) -> bool:
-    """使用API1下载音乐"""
-    log("INFO", f"开始处理歌曲 (接口1): {music_id}")
-    
-    # 获取音乐URL
-    music_url = API_1.get_music_url(
-        music_id, 
-        level_name[settings["level_name"]-1], 
-        settings["interface"],
-        max_retries=settings["max_retries"],
-        timeout=settings["timeout"],
-        verify_ssl=settings["verify_ssl"]
-    )
-    
-    if not music_url:
-        log("ERROR", f"获取下载链接失败: {music_id}")
-        return False
-    
-    # 确定文件类型
+def api_options(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """接口调用的通用参数"""
+    return {
+        "max_retries": settings["max_retries"],
+        "timeout": settings["timeout"],
+        "verify_ssl": settings["verify_ssl"]
+    }
+
+def download_options(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """音频文件下载参数（分段、读写块大小、预分配）"""
+    return {
+        "segments": settings["segments"],
+        "segment_threshold": settings["segment_threshold_mb"] * 1024 * 1024,
+        "chunk_size": settings["chunk_size_kb"] * 1024,
+        "preallocate": settings["preallocate"]
+    }
+
+def detect_file_type(music_url: str) -> str:
+    """根据下载链接确定文件类型"""
     if "mp3" in music_url:
-        file_type = "mp3"
-    elif "flac" in music_url:
-        file_type = "flac"
-    else:
-        file_type = "unknown"
-        log("WARNING", f"未知文件类型，URL: {music_url[:100]}...")
-    
-    # 获取音乐信息
-    music_info = API_1.get_music_info(
-        music_id, 
-        settings["interface"],
-        max_retries=settings["max_retries"],
-        timeout=settings["timeout"],
-        verify_ssl=settings["verify_ssl"]
-    )
+        return "mp3"
+    if "flac" in music_url:
+        return "flac"
+    log("WARNING", f"未知文件类型，URL: {music_url[:100]}...")
+    return "unknown"
+
+def submit_in_context(executor: ThreadPoolExecutor, fn, *args, **kwargs):
+    """在当前上下文的副本中提交任务，保留日志中的歌曲序号"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+def route(settings: Dict[str, Any], operation: str) -> List[int]:
+    """执行该操作依次尝试的接口（开启自动路由时按健康程度排序，否则只用设置中的接口）"""
+    return router.ranked(operation, settings["interface"], settings["auto_route"])
+
+def should_failover(interfaces: List[int], interface: int, action: str, attempt: router.Attempt) -> bool:
+    """接口失败时判断是否切换到下一个接口
     
-    if not music_info:
-        log("ERROR", f"获取歌曲信息失败: {music_id}")
+    只有超时、连接失败等传输层错误才切换；接口正常返回“不可用”时换接口通常也一样，直接放弃。
+    """
+    if not attempt.transport_error:
+        log("WARNING", f"接口{interface}{action}失败（接口返回不可用），不再切换接口")
         return False
+    position = interfaces.index(interface)
+    if position + 1 < len(interfaces):
+        log("WARNING", f"接口{interface}{action}失败，切换到接口{interfaces[position + 1]}")
+    return True
+
+def resolve_track(music_id: str, settings: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """获取下载链接、元数据和歌词，当前接口失败时自动切换（返回格式见 API_2.get_track）"""
+    import API_1
+    import API_2
     
-    # 处理文件名
-    safe_name = re.sub(r'[\\/*?:"<>|]', "", music_info["name"])
-    filename = f"{safe_name}_{music_id}.{file_type}"
+    options = api_options(settings)
+    interfaces = route(settings, "track")
+    for interface in interfaces:
+        log("INFO", f"开始处理歌曲 (接口{interface}): {music_id}")
+        with router.attempt() as attempt:
+            if interface != 3:
+                track = API_1.get_track(music_id, level_name[settings["level_name"]-1], interface, **options)
+            else:
+                track = API_2.get_track(music_id, level_name[settings["level_name"]-1], **options)
+        if track:
+            return track
+        if not should_failover(interfaces, interface, "获取歌曲", attempt):
+            break
+    
+    log("ERROR", f"获取下载链接或歌曲信息失败: {music_id}")
+    return None
+
+def prepare_track(music_id: str, track: Dict[str, Any]) -> str:
+    """确定文件类型，返回文件名"""
+    if not track["type"]:
+        track["type"] = detect_file_type(track["url"])
+    safe_name = re.sub(r'[\\/*?:"<>|]', "", track["name"])
+    filename = f"{safe_name}_{music_id}.{track['type']}"
     log("DEBUG", f"文件名: {filename}")
+    return filename
+
+def invalidate_track_url(music_id: str, settings: Dict[str, Any], track: Dict[str, Any]):
+    """丢弃缓存的下载链接（下载失败时链接可能已失效）"""
+    import API_1
+    import API_2
     
-    # 下载音频文件
-    filepath = download(
-        music_url, 
-        filename, 
-        settings["folder"],
-        max_retries=settings["max_retries"],
-        timeout=settings["timeout"]
-    )
+    if track["interface"] != 3:
+        API_1.invalidate_music_url(music_id, level_name[settings["level_name"]-1], track["interface"])
+    else:
+        API_2.invalidate_music_url(music_id, level_name[settings["level_name"]-1])
+
+def download_resolved(music_id: str, settings: Dict[str, Any], track: Dict[str, Any]) -> bool:
+    """下载已获取到链接的歌曲，写入元数据和歌词"""
+    import API_1
+    import stream_tag
+    
+    filename = prepare_track(music_id, track)
+    mark_track("downloading")
+    
+    # 封面与音频同时下载（保存在内存中，同一专辑只下载一次）
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        cover_future = submit_in_context(
+            executor, fetch_cover, track["picimg"], settings["max_retries"], settings["timeout"], track["interface"]
+        )
+        
+        # 边下载边写标签时，收到音频文件头后才等待封面（通常已下载完）
+        tagger = None
+        if settings["stream_tagging"]:
+            tagger = stream_tag.StreamTagger(track["type"], track, cover_future)
+        
+        # 下载音频文件
+        filepath = metrics.call(
+            "audio",
+            track["interface"],
+            download,
+            track["url"], 
+            filename, 
+            settings["folder"],
+            max_retries=settings["max_retries"],
+            timeout=settings["timeout"],
+            tagger=tagger,
+            **download_options(settings)
+        )
+        cover = cover_future.result()
     
     if not filepath:
+        invalidate_track_url(music_id, settings, track)
         return False
     
-    # 下载封面图片
-    pngname = f"{safe_name}_{music_id}.png"
-    pngpath = download(
-        music_info["picimg"], 
-        pngname, 
-        settings["folder"],
-        max_retries=settings["max_retries"],
-        timeout=settings["timeout"]
-    )
-    
     # 写入元数据
-    if write_metadata(file_type, filepath, pngpath, music_info):
-        log("SUCCESS", f"歌曲处理完成: {music_info['name']}")
-    else:
-        log("ERROR", f"写入元数据失败: {music_info['name']}")
+    if not finish_track(music_id, settings, track["type"], filepath, cover, track, bool(tagger and tagger.applied)):
         return False
+    mark_track("tagged")
     
-    # 下载歌词
-    API_1.get_music_lrc(
-        music_id, 
-        music_info["name"], 
-        settings["interface"], 
-        settings["folder"],
-        max_retries=settings["max_retries"],
-        timeout=settings["timeout"],
-        verify_ssl=settings["verify_ssl"]
-    )
+    # 写入歌词
+    if track["lyric"] is not None:
+        API_1.write_lrc(music_id, track["name"], settings["folder"], track["lyric"])
     
     return True
 
-def API_2_download(music_id: str, settings: Dict[str, Any]) -> bool:
-    """使用API2下载音乐"""
-    log("INFO", f"开始处理歌曲 (接口2): {music_id}")
-    
-    # 获取音乐信息（API2整合了信息获取）
-    music_info = API_2.get_music(
-        music_id, 
-        level_name[settings["level_name"]-1], 
-        settings["folder"],
-        max_retries=settings["max_retries"],
-        timeout=settings["timeout"],
-        verify_ssl=settings["verify_ssl"]
-    )
+def fetch_cover(url: str, max_retries: int = 3, timeout: int = 30, interface: Optional[int] = None) -> Optional[bytes]:
+    """下载封面图片到内存（同一URL只下载一次），失败返回None"""
+    import cover_cache
+    import http_pool
+    import requests
     
-    if not music_info:
-        log("ERROR", f"获取歌曲信息失败: {music_id}")
-        return False
+    host = retry_policy.host_of(url)
     
-    # 处理文件名
-    safe_name = re.sub(r'[\\/*?:"<>|]', "", music_info["name"])
-    filename = f"{safe_name}_{music_id}.{music_info['type']}"
-    log("DEBUG", f"文件名: {filename}")
+    def load() -> Optional[bytes]:
+        for attempt in range(max_retries):
+            permit = retry_policy.allow(host)
+            if not permit:
+                break
+            try:
+                response = http_pool.get(url, verify=False, timeout=timeout)
+                if response.status_code == 200 and response.content:
+                    retry_policy.record_success(host)
+                    metrics.count("bytes_total", len(response.content), kind="cover")
+                    return response.content
+                log("WARNING", f"封面下载失败，状态码: {response.status_code} (尝试 {attempt+1}/{max_retries})")
+                if not retry_policy.is_transient_status(response.status_code):
+                    retry_policy.record_success(host)
+                    break
+            except requests.exceptions.RequestException as e:
+                log("WARNING", f"封面下载出错: {e} (尝试 {attempt+1}/{max_retries})")
+            finally:
+                retry_policy.release_probe(host, permit)
+            if not retry_policy.retry_after_failure(host, attempt, max_retries):
+                break
+        log("WARNING", f"封面下载失败: {url[:80]}")
+        return None
     
-    # 下载音频文件
-    filepath = download(
-        music_info["url"], 
-        filename, 
-        settings["folder"],
-        max_retries=settings["max_retries"],
-        timeout=settings["timeout"]
-    )
+    return cover_cache.fetch(url, lambda: metrics.call("cover", interface, load))
+
+def finish_track(music_id: str, settings: Dict[str, Any], filetype: str, filepath: str,
+                 cover: Optional[bytes], music_info: Dict[str, Any], pretagged: bool = False) -> bool:
+    """写入元数据并登记到下载清单（pretagged 表示下载时已写入标签）"""
+    if pretagged:
+        log("DEBUG", f"下载时已写入元数据: {os.path.basename(filepath)}")
+        tagged = True
+    else:
+        tagged = metrics.call("metadata", music_info.get("interface"), tagging.tag, filetype, filepath, cover, music_info)
     
-    if not filepath:
+    try:
+        library.record(settings["folder"], music_id, filepath, level_name[settings["level_name"]-1], tagged)
+    except Exception as e:
+        log("WARNING", f"更新下载清单失败: {e}")
+    
+    if tagged:
+        log("SUCCESS", f"歌曲处理完成: {music_info['name']}")
+    else:
+        log("ERROR", f"写入元数据失败: {music_info['name']}")
+    return tagged
+
+def download_segmented(url: str, filepath: str, state: Dict[str, Any], task: progress.Task,
+                       max_retries: int = 3, timeout: int = 30, chunk_size: int = 256 * 1024,
+                       preallocate: bool = True) -> Optional[bool]:
+    """多段并发下载到 .part 文件，各段进度记录在状态文件中，中断后可从记录处继续
+    
+    返回True表示成功，False表示失败（保留已下载部分），None表示服务器不支持Range（需改为单连接下载）
+    """
+    import http_pool
+    import requests
+    
+    part = part_file.part_path(filepath)
+    total_size = state["size"]
+    ranges = state["ranges"]  # [[下一个待写入位置, 结束位置], ...]
+    # 边下载边写标签时，.part 中的位置比下载内容中的位置多出新旧文件头的长度差
+    delta = state.get("delta", 0)
+    
+    # 新建时预先分配文件大小，各段按偏移写入
+    if not os.path.exists(part):
+        with open(part, 'wb') as f:
+            part_file.preallocate(f, total_size + delta, allocate=preallocate)
+    
+    lock = threading.Lock()
+    host = retry_policy.host_of(url)
+    task.update(downloaded=total_size - sum(end - pos + 1 for pos, end in ranges if pos <= end), total=total_size)
+    no_range = threading.Event()
+    
+    def save_position(segment: List[int], pos: int):
+        # 只记录已写入文件的位置
+        with lock:
+            segment[0] = pos
+            part_file.save_state(filepath, state)
+    
+    def fetch(segment: List[int]) -> bool:
+        end = segment[1]
+        for attempt in range(max_retries):
+            pos = received_from = segment[0]
+            if pos > end:
+                return True
+            permit = retry_policy.allow(host)
+            if not permit:
+                return False
+            try:
+                response = http_pool.get(
+                    url,
+                    headers=part_file.range_headers(state, pos, end),
+                    stream=True,
+                    verify=False,
+                    timeout=timeout
+                )
+                with response:
+                    if response.status_code == 200:
+                        # 不支持Range或文件已变化
+                        no_range.set()
+                        retry_policy.record_success(host)
+                        return False
+                    if not part_file.accepts_range(response.status_code, response.headers, state, pos):
+                        log("WARNING", f"分段下载失败，状态码: {response.status_code} (尝试 {attempt+1}/{max_retries})")
+                        if retry_policy.is_permanent_status(response.status_code):
+                            retry_policy.record_success(host)
+                            return False
+                    else:
+                        unsaved = 0
+                        # 每段使用独立的缓冲区，整块直接写入文件
+                        with open(part, 'r+b', buffering=0) as f:
+                            f.seek(pos + delta)
+                            for chunk in http_pool.iter_content(response, chunk_size):
+                                f.write(chunk)
+                                pos += len(chunk)
+                                unsaved += len(chunk)
+                                task.advance(len(chunk))
+                                if unsaved >= part_file.STATE_SAVE_INTERVAL:
+                                    f.flush()
+                                    save_position(segment, pos)
+                                    unsaved = 0
+                        save_position(segment, pos)
+                        if pos > end:
+                            retry_policy.record_success(host)
+                            return True
+            except requests.exceptions.RequestException as e:
+                # 已写入的部分保留，重试时从断点继续
+                save_position(segment, pos)
+                log("WARNING", f"分段下载出错: {e} (尝试 {attempt+1}/{max_retries})")
+            finally:
+                retry_policy.release_probe(host, permit)
+            
+            if no_range.is_set():
+                return False
+            progressed = pos > received_from
+            if not retry_policy.retry_after_failure(host, attempt, max_retries, progressed):
+                return False
         return False
     
-    # 下载封面图片
-    pngname = f"{safe_name}_{music_id}.png"
-    pngpath = download(
-        music_info["picimg"], 
-        pngname, 
-        settings["folder"],
-        max_retries=settings["max_retries"],
-        timeout=settings["timeout"]
-    )
+    pending = [segment for segment in ranges if segment[0] <= segment[1]]
+    if pending:
+        with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+            # 每段使用独立的上下文副本，保留日志中的歌曲序号
+            futures = [executor.submit(contextvars.copy_context().run, fetch, segment) for segment in pending]
+            results = [future.result() for future in futures]
+    else:
+        results = [True]
     
-    # 写入元数据
-    if write_metadata(music_info["type"], filepath, pngpath, music_info):
-        log("SUCCESS", f"歌曲处理完成: {music_info['name']}")
-        return True
+    if no_range.is_set():
+        return None
+    return all(results)
+
+def _stream_to_part(response, filepath: str, state: Optional[Dict[str, Any]], tagger: Optional["stream_tag.StreamTagger"],
+                    task: progress.Task, downloaded: int, chunk_size: int, preallocate: bool) -> int:
+    """将响应内容从 downloaded 处写入 .part 文件，返回已下载的总字节数"""
+    import http_pool
     
-    return False
+    task.update(downloaded=downloaded)
+    with part_file.PartWriter(filepath, state, tagger, downloaded, chunk_size, preallocate) as writer:
+        for chunk in http_pool.iter_content(response, chunk_size):
+            downloaded += len(chunk)
+            task.advance(len(chunk))
+            writer.write(chunk)
+    return downloaded
 
-def download(url: str, filename: str, folder: str, max_retries: int = 3, timeout: int = 30) -> Optional[str]:
-    """下载文件"""
-    for attempt in range(max_retries):
-        try:
-            # 确保文件夹存在
-            if not os.path.exists(folder):
-                os.makedirs(folder, exist_ok=True)
-                log("DEBUG", f"创建文件夹: {folder}")
-            
-            log("INFO", f"开始下载 ({attempt+1}/{max_retries}): {filename}")
-            log("DEBUG", f"下载URL: {url[:80]}...")
-            
-            # 发送请求
-            response = requests.get(
-                url, 
-                stream=True, 
-                verify=False,
-                timeout=timeout
-            )
-            
-            filepath = os.path.join(folder, filename)
-            
-            if response.status_code == 200:
-                total_size = int(response.headers.get('content-length', 0))
-                downloaded = 0
+def _start_segmented(response, filepath: str, state: Dict[str, Any], tagger: Optional["stream_tag.StreamTagger"],
+                     segments: int, preallocate: bool):
+    """初始化分段下载：边下载边写标签时先从完整响应中读出原始文件头并写入新的文件头，其余部分分段下载"""
+    import http_pool
+    
+    head = b""
+    consumed = 0
+    if tagger:
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            consumed += len(chunk)
+            head += tagger.feed(chunk)
+            if tagger.resolved:
+                break
+        if not tagger.resolved:
+            head += tagger.flush()
+        tagger.save_to(state)
+    
+    total_size = state["size"]
+    state["ranges"] = [
+        [consumed + start, consumed + end]
+        for start, end in (http_pool.split_ranges(total_size - consumed, segments) if consumed < total_size else [])
+    ]
+    part_file.save_state(filepath, state)
+    
+    # 预先分配文件大小，各段按偏移写入
+    with open(part_file.part_path(filepath), 'wb') as f:
+        part_file.preallocate(f, total_size + state.get("delta", 0), allocate=preallocate)
+        f.write(head)
+
+def download(url: str, filename: str, folder: str, max_retries: int = 3, timeout: int = 30,
+             segments: int = 1, segment_threshold: int = 0, chunk_size: int = 256 * 1024, preallocate: bool = True,
+             tagger: Optional["stream_tag.StreamTagger"] = None) -> Optional[str]:
+    """下载文件
+    
+    内容先写入 .part 文件，校验大小后原子重命名；中断后用 Range + If-Range 从已有字节续传。
+    超过 segment_threshold 字节且服务器支持Range时分段并发下载。
+    传入 tagger 时边下载边写标签，完成后 tagger.applied 表示标签是否已写入。
+    每次读取 chunk_size 字节并合并写入；preallocate 为True时按文件大小预分配磁盘空间。
+    """
+    import http_pool
+    import requests
+    
+    allow_segments = segments > 1 and segment_threshold > 0
+    filepath = os.path.join(folder, filename)
+    host = retry_policy.host_of(url)
+    
+    # 进度由后台线程统一绘制，这里只累加字节数
+    task = progress.start(filename)
+    try:
+        for attempt in range(max_retries):
+            permit = retry_policy.allow(host)
+            if not permit:
+                log("WARNING", f"{host} 连续出错，暂停下载")
+                break
+            received_from = task.downloaded
+            try:
+                # 确保文件夹存在
+                if not os.path.exists(folder):
+                    os.makedirs(folder, exist_ok=True)
+                    log("DEBUG", f"创建文件夹: {folder}")
+                
+                log("INFO", f"开始下载 ({attempt+1}/{max_retries}): {filename}")
+                log("DEBUG", f"下载URL: {url[:80]}...")
+                
                 start_time = datetime.now()
+                state = part_file.load_state(filepath)
+                total_size = downloaded = 0
                 
-                # 检查文件是否已存在（部分下载）
-                if os.path.exists(filepath):
-                    existing_size = os.path.getsize(filepath)
-                    if 0 < existing_size < total_size:
-                        log("INFO", f"发现部分下载的文件，继续下载...")
-                        downloaded = existing_size
-                        headers = {'Range': f'bytes={existing_size}-'}
-                        response = requests.get(url, headers=headers, stream=True, verify=False, timeout=timeout)
-                        mode = 'ab'
-                    else:
-                        mode = 'wb'
-                else:
-                    mode = 'wb'
+                if tagger:
+                    tagger.reset()
+                    if state:
+                        tagger.resume(state)
                 
-                with open(filepath, mode) as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            f.flush()
-                            downloaded += len(chunk)
+                if state and state.get("ranges"):
+                    log("INFO", "发现未完成的分段下载，继续下载...")
+                else:
+                    # 已有部分内容时只发一次带校验的续传请求
+                    offset = part_file.resume_offset(filepath, state) if state else 0
+                    headers = part_file.range_headers(state, offset) if offset > 0 else {}
+                    
+                    response = http_pool.get(
+                        url, 
+                        headers=headers,
+                        stream=True, 
+                        verify=False,
+                        timeout=timeout
+                    )
+                    
+                    with response:
+                        if response.status_code == 416 and offset and offset == state["size"]:
+                            # 上次已下载完整，只差重命名
+                            total_size = downloaded = offset
+                        elif offset and part_file.accepts_range(response.status_code, response.headers, state, offset):
+                            log("INFO", f"发现部分下载的文件，从 {offset/1024/1024:.1f}MB 处继续下载...")
+                            total_size = state["size"]
+                            task.update(total=total_size)
+                            downloaded = _stream_to_part(response, filepath, state, tagger, task, offset,
+                                                         chunk_size, preallocate)
+                        elif response.status_code == 200:
+                            if offset:
+                                log("INFO", "文件已变化或服务器不支持续传，重新下载")
+                            part_file.clear(filepath)
+                            if tagger:
+                                tagger.reset()
+                            total_size = int(response.headers.get('content-length', 0))
+                            
+                            # 大小未知时无法校验，不保存续传状态
+                            state = part_file.new_state(response.headers, total_size) if total_size > 0 else None
                             
-                            # 显示进度
-                            if total_size > 0:
-                                progress = downloaded / total_size * 100
-                                elapsed = (datetime.now() - start_time).total_seconds()
-                                
-                                # 计算速度
-                                if elapsed > 0:
-                                    speed = downloaded / elapsed / 1024  # KB/s
-                                    speed_text = f"{speed:.1f}KB/s"
-                                else:
-                                    speed_text = "计算中..."
-                                
-                                # 进度条
-                                bar_length = 40
-                                filled = int(bar_length * downloaded // total_size)
-                                bar = '█' * filled + '▒' * (bar_length - filled)
-                                
-                                # 进度信息
-                                size_mb = downloaded / 1024 / 1024
-                                total_mb = total_size / 1024 / 1024
-                                
-                                print(f"\r{LOG_COLORS['INFO']}[下载] [{bar}] {progress:6.1f}% ({size_mb:.1f}/{total_mb:.1f}MB) @ {speed_text}{LOG_COLORS['END']}", end="")
+                            if (state and allow_segments and total_size >= segment_threshold
+                                    and response.headers.get('accept-ranges', '').lower() == 'bytes'):
+                                # 大文件分段下载，这个响应只用来读取文件头
+                                _start_segmented(response, filepath, state, tagger, segments, preallocate)
+                                log("INFO", f"分段下载: {filename} ({total_size/1024/1024:.1f}MB, {segments} 段)")
+                            else:
+                                if state:
+                                    part_file.save_state(filepath, state)
+                                task.update(total=total_size)
+                                downloaded = _stream_to_part(response, filepath, state, tagger, task, 0,
+                                                             chunk_size, preallocate)
+                        else:
+                            log("WARNING", f"下载失败，状态码: {response.status_code} (尝试 {attempt+1}/{max_retries})")
+                            if response.status_code == 416:
+                                # 记录的续传位置无效，清除后重新下载
+                                part_file.clear(filepath)
+                                retry_policy.record_success(host)
+                                continue
+                            if retry_policy.is_permanent_status(response.status_code):
+                                # 链接失效等错误，重试也不会成功
+                                retry_policy.record_success(host)
+                                break
+                            if not retry_policy.retry_after_failure(host, attempt, max_retries):
+                                break
+                            continue
+                
+                if state and state.get("ranges"):
+                    # 各段请求分别经过熔断器，交还探测名额
+                    retry_policy.release_probe(host, permit, failed=False)
+                    result = download_segmented(url, filepath, state, task, max_retries, timeout,
+                                                chunk_size, preallocate)
+                    if result is None:
+                        log("WARNING", "服务器不支持分段下载或文件已变化，改为单连接下载")
+                        part_file.clear(filepath)
+                        allow_segments = False
+                        continue
+                    if not result:
+                        log("WARNING", f"分段下载失败 (尝试 {attempt+1}/{max_retries})")
+                        progressed = task.downloaded > received_from
+                        if not retry_policy.retry_after_failure(host, attempt, max_retries, progressed):
+                            break
+                        continue
+                    total_size = downloaded = state["size"]
                 
+                # 连接提前断开时保留 .part，下一次尝试从断点继续
+                if total_size > 0 and downloaded != total_size:
+                    log("WARNING", f"下载不完整: {downloaded}/{total_size} 字节 (尝试 {attempt+1}/{max_retries})")
+                    if downloaded > total_size:
+                        part_file.clear(filepath)
+                    progressed = task.downloaded > received_from
+                    if not retry_policy.retry_after_failure(host, attempt, max_retries, progressed):
+                        break
+                    continue
+                
+                part_file.finalize(filepath)
+                retry_policy.record_success(host)
                 elapsed = (datetime.now() - start_time).total_seconds()
                 log("SUCCESS", f"下载完成: {filename} ({downloaded/1024/1024:.1f}MB, {elapsed:.1f}s)")
                 return filepath
-                
-            else:
-                log("WARNING", f"下载失败，状态码: {response.status_code} (尝试 {attempt+1}/{max_retries})")
-                if attempt < max_retries - 1:
-                    import time
-                    time.sleep(1)
-                
-        except requests.exceptions.Timeout:
-            log("WARNING", f"下载超时 (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                import time
-                time.sleep(2)
-        except requests.exceptions.RequestException as e:
-            log("WARNING", f"网络错误: {e} (尝试 {attempt+1}/{max_retries})")
-            if attempt < max_retries - 1:
-                import time
-                time.sleep(2)
-        except Exception as e:
-            log("ERROR", f"下载错误: {e}")
+                    
+            except requests.exceptions.Timeout:
+                log("WARNING", f"下载超时 (尝试 {attempt+1}/{max_retries})")
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                log("WARNING", f"网络错误: {e} (尝试 {attempt+1}/{max_retries})")
+            except requests.exceptions.RequestException as e:
+                log("ERROR", f"请求错误: {e}")
+                break
+            except Exception as e:
+                log("ERROR", f"下载错误: {e}")
+                break
+            finally:
+                retry_policy.release_probe(host, permit)
+            
+            # 超时和连接中断可以重试，已下载的部分保留
+            progressed = task.downloaded > received_from
+            if not retry_policy.retry_after_failure(host, attempt, max_retries, progressed):
+                break
+        
+        log("ERROR", f"下载失败: {filename}")
+        return None
+    finally:
+        progress.finish(task)
+        metrics.count("bytes_total", task.transferred, kind="audio")
+
+# ============= 异步下载 =============
+async def resolve_track_async(music_id: str, settings: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """resolve_track 的异步版本"""
+    import API_async
+    
+    interfaces = route(settings, "track")
+    for interface in interfaces:
+        log("INFO", f"开始处理歌曲 (接口{interface}): {music_id}")
+        with router.attempt() as attempt:
+            track = await API_async.get_track(
+                music_id, level_name[settings["level_name"]-1], interface, **api_options(settings)
+            )
+        if track:
+            return track
+        if not should_failover(interfaces, interface, "获取歌曲", attempt):
             break
     
-    log("ERROR", f"下载失败: {filename}")
+    log("ERROR", f"获取下载链接或歌曲信息失败: {music_id}")
     return None
 
-def write_metadata(filetype: str, filepath: str, pngpath: Optional[str], music_info: Dict[str, Any]) -> bool:
-    """写入音频文件元数据"""
+async def download_resolved_async(music_id: str, settings: Dict[str, Any], track: Dict[str, Any]) -> bool:
+    """download_resolved 的异步版本"""
+    import API_1
+    import API_async
+    import asyncio
+    import stream_tag
+    
+    filename = prepare_track(music_id, track)
+    await asyncio.to_thread(mark_track, "downloading")
+    
+    # 封面与音频同时下载；边下载边写标签时，写文件头的线程收到音频文件头后才等待封面
+    cover_future = asyncio.run_coroutine_threadsafe(
+        API_async.fetch_cover(track["picimg"], settings["max_retries"], settings["timeout"], track["interface"]),
+        asyncio.get_running_loop()
+    )
+    tagger = None
+    if settings["stream_tagging"]:
+        tagger = stream_tag.StreamTagger(track["type"], track, cover_future)
+    filepath = await metrics.call_async("audio", track["interface"], API_async.download(
+        track["url"], filename, settings["folder"],
+        max_retries=settings["max_retries"], timeout=settings["timeout"], tagger=tagger, **download_options(settings)
+    ))
+    cover = await asyncio.wrap_future(cover_future)
+    if not filepath:
+        await asyncio.to_thread(invalidate_track_url, music_id, settings, track)
+        return False
+    
+    # 写标签（在线程中等待写标签进程或直接写）和写清单都是阻塞操作，放到线程中执行以免阻塞事件循环
+    if not await asyncio.to_thread(finish_track, music_id, settings, track["type"], filepath, cover, track,
+                                   bool(tagger and tagger.applied)):
+        return False
+    await asyncio.to_thread(mark_track, "tagged")
+    
+    if track["lyric"] is not None:
+        await asyncio.to_thread(API_1.write_lrc, music_id, track["name"], settings["folder"], track["lyric"])
+    return True
+
+# ============= 并发下载 =============
+# 当前线程/协程正在处理的任务歌曲 (文件夹, 任务ID, 歌曲ID)
+_job_track: contextvars.ContextVar = contextvars.ContextVar("job_track", default=None)
+
+def begin_track(job: Optional[Tuple[str, int]], music_id: str):
+    """开始处理任务中的一首歌曲（记录尝试次数），之后的 mark_track 记录到这首歌曲"""
+    if job is None:
+        _job_track.set(None)
+        return
+    _job_track.set((*job, music_id))
+    job_queue.start_track(*job, music_id)
+
+async def begin_track_async(job: Optional[Tuple[str, int]], music_id: str):
+    """begin_track 的异步版本：在当前协程中记录歌曲，写任务队列在线程中执行"""
+    import asyncio
+    
+    _job_track.set(None if job is None else (*job, music_id))
+    if job is not None:
+        await asyncio.to_thread(job_queue.start_track, *job, music_id)
+
+def mark_track(state: str):
+    """记录当前歌曲的处理阶段到任务队列（不在任务中时忽略）"""
+    current = _job_track.get()
+    if current is None:
+        return
     try:
-        if not os.path.exists(filepath):
-            log("ERROR", f"音频文件不存在: {filepath}")
-            return False
-        
-        log("INFO", f"写入元数据: {os.path.basename(filepath)}")
-        
-        if filetype.lower() == 'mp3':
-            try:
-                audio = MP3(filepath, ID3=ID3)
-                
-                if audio.tags is None:
-                    audio.tags = ID3()
-                    log("DEBUG", "创建新的ID3标签")
-                
-                # 写入文本标签
-                audio.tags.add(TIT2(encoding=3, text=music_info.get('name', '未知歌曲')))
-                audio.tags.add(TPE1(encoding=3, text=music_info.get('singer', '未知歌手')))
-                audio.tags.add(TALB(encoding=3, text=music_info.get('album', '未知专辑')))
-                log("DEBUG", f"添加文本标签: {music_info.get('name', '未知歌曲')}")
-                
-                # 写入封面图片
-                if pngpath and os.path.exists(pngpath):
-                    try:
-                        with open(pngpath, 'rb') as img:
-                            audio.tags.add(APIC(
-                                encoding=3,
-                                mime='image/png',
-                                type=3,
-                                desc='Cover',
-                                data=img.read()
-                            ))
-                        log("DEBUG", "添加封面图片")
-                    except Exception as img_error:
-                        log("WARNING", f"添加封面图片失败: {img_error}")
-                
-                audio.save()
-                log("SUCCESS", "MP3元数据写入成功")
-                
-            except Exception as mp3_error:
-                log("ERROR", f"处理MP3文件失败: {mp3_error}")
-                return False
-                
-        elif filetype.lower() == 'flac':
-            try:
-                audio = FLAC(filepath)
-                
-                # 写入文本标签
-                audio['title'] = [music_info.get('name', '未知歌曲')]
-                audio['artist'] = [music_info.get('singer', '未知歌手')]
-                audio['album'] = [music_info.get('album', '未知专辑')]
-                log("DEBUG", f"添加文本标签: {music_info.get('name', '未知歌曲')}")
-                
-                # 写入封面图片
-                if pngpath and os.path.exists(pngpath):
-                    try:
-                        picture = Picture()
-                        picture.type = 3
-                        picture.mime = 'image/png'
-                        
-                        with open(pngpath, 'rb') as f:
-                            picture.data = f.read()
-                        
-                        audio.clear_pictures()
-                        audio.add_picture(picture)
-                        log("DEBUG", "添加封面图片")
-                    except Exception as img_error:
-                        log("WARNING", f"添加封面图片失败: {img_error}")
-                
-                audio.save()
-                log("SUCCESS", "FLAC元数据写入成功")
-                
-            except Exception as flac_error:
-                log("ERROR", f"处理FLAC文件失败: {flac_error}")
-                return False
-        else:
-            log("WARNING", f"不支持的文件类型: {filetype}")
-            return False
-        
-        # 清理临时图片文件
-        if pngpath and os.path.exists(pngpath):
-            try:
-                os.remove(pngpath)
-                log("DEBUG", f"清理临时文件: {os.path.basename(pngpath)}")
-            except Exception as cleanup_error:
-                log("WARNING", f"清理临时文件失败: {cleanup_error}")
-        
+        job_queue.set_state(*current, state)
+    except Exception as e:
+        log("WARNING", f"更新任务状态失败: {e}")
+
+def is_known_track(music_id: str, settings: Dict[str, Any]) -> bool:
+    """下载前查询清单，已下载的歌曲直接跳过（不发网络请求）"""
+    if not settings["skip_existing"]:
+        return False
+    try:
+        known = library.is_downloaded(settings["folder"], music_id, level_name[settings["level_name"]-1])
+    except Exception as e:
+        log("WARNING", f"读取下载清单失败: {e}")
+        return False
+    if known:
+        log("SUCCESS", f"歌曲已存在，跳过: {music_id}")
+    return known
+
+def download_track(music_id: str, settings: Dict[str, Any]) -> bool:
+    """下载单首歌曲（接口由路由选择）"""
+    if is_known_track(music_id, settings):
         return True
-        
+    track = resolve_track(music_id, settings)
+    if not track:
+        return False
+    mark_track("resolved")
+    return download_resolved(music_id, settings, track)
+
+async def download_track_async(music_id: str, settings: Dict[str, Any]) -> bool:
+    """异步下载单首歌曲（接口由路由选择），下载清单和任务队列的读写在线程中执行"""
+    import asyncio
+    
+    if await asyncio.to_thread(is_known_track, music_id, settings):
+        return True
+    track = await resolve_track_async(music_id, settings)
+    if not track:
+        return False
+    await asyncio.to_thread(mark_track, "resolved")
+    return await download_resolved_async(music_id, settings, track)
+
+def process_track(job: Optional[Tuple[str, int]], index: int, total: int, music_id: str,
+                  settings: Dict[str, Any]) -> bool:
+    """在线程中处理任务的一首歌曲，出错时返回False"""
+    _track_tag.set(f"{index}/{total}")
+    try:
+        begin_track(job, music_id)
+        return download_track(music_id, settings)
     except Exception as e:
-        log("ERROR", f"写入元数据时出错: {e}")
+        log("ERROR", f"处理歌曲出错: {music_id}: {e}")
         return False
+    finally:
+        _track_tag.set(None)
 
-# ============= 主程序 =============
-def main():
-    """主程序入口"""
-    print_header("音乐下载器 v1.0")
+def configure_pool(settings: Dict[str, Any], workers: int):
+    """每首歌曲同时占用接口和CDN连接（分段下载时每段一个连接），连接池需容纳全部并发任务"""
+    import http_pool
     
-    # 加载设置
+    http_pool.configure(pool_size=max(http_pool.DEFAULT_POOL_SIZE, workers * (2 + settings["segments"])))
+
+def _run_tracks_threaded(tracks: List[Tuple[int, str]], total: int, settings: Dict[str, Any], workers: int,
+                         job: Optional[Tuple[str, int]], on_done):
+    """线程池模式：每首歌曲占用一个线程"""
+    configure_pool(settings, workers)
+    
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {
+            executor.submit(process_track, job, index, total, music_id, settings): (index, music_id)
+            for index, music_id in tracks
+        }
+        for future in as_completed(futures):
+            on_done(*futures[future], future.result())
+    except KeyboardInterrupt:
+        # 取消尚未开始的歌曲，正在下载的歌曲会自然结束
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
+
+async def _run_tracks_async(tracks: List[Tuple[int, str]], total: int, settings: Dict[str, Any], workers: int,
+                            job: Optional[Tuple[str, int]], on_done):
+    """异步模式：单个事件循环内最多同时处理 workers 首歌曲"""
+    import API_async
+    import asyncio
+    
+    semaphore = asyncio.Semaphore(workers)
     
+    async def worker(index: int, music_id: str):
+        async with semaphore:
+            _track_tag.set(f"{index}/{total}")
+            try:
+                await begin_track_async(job, music_id)
+                ok = await download_track_async(music_id, settings)
+            except Exception as e:
+                log("ERROR", f"处理歌曲出错: {music_id}: {e}")
+                ok = False
+            finally:
+                _track_tag.set(None)
+        # on_done 写任务队列（每次提交都写入磁盘），不在事件循环中执行
+        await asyncio.to_thread(on_done, index, music_id, ok)
+    
+    try:
+        await asyncio.gather(*(worker(index, music_id) for index, music_id in tracks))
+    finally:
+        await API_async.close_session()
+
+def run_tracks(music_ids: List[str], settings: Dict[str, Any], title: str = "下载",
+               source: Optional[str] = None) -> Dict[str, List[str]]:
+    """并发下载多首歌曲（线程池或异步引擎），返回成功和失败的歌曲ID
+
+    下载进度记录在任务队列中，中断后再次下载同一 source（如同一歌单）时只处理未完成的歌曲
+    """
+    folder = settings["folder"]
+    try:
+        job_id, resumed = job_queue.open_job(folder, title, music_ids, source)
+    except Exception as e:
+        log("WARNING", f"任务队列不可用，本次下载中断后无法继续: {e}")
+        return _run_job(None, list(enumerate(music_ids, 1)), len(music_ids), settings, title)
+    
+    if job_id is None:
+        log("ERROR", f"同一{title}任务正在其他进程中运行")
+        return {"success": [], "failed": list(music_ids)}
+    if resumed:
+        log("INFO", f"继续上次未完成的{title}任务 (任务 {job_id})")
+    return run_job(job_id, settings, title)
+
+def run_job(job_id: int, settings: Dict[str, Any], title: str) -> Dict[str, List[str]]:
+    """运行本进程已认领的任务，跳过已完成的歌曲；中断时释放任务以便之后继续"""
+    folder = settings["folder"]
+    finished = False
+    try:
+        tracks = job_queue.job_tracks(folder, job_id)
+        pending = job_queue.pending_tracks(folder, job_id)
+        if len(pending) < len(tracks):
+            log("INFO", f"{title}任务中 {len(tracks) - len(pending)} 首歌曲已处理，跳过")
+        _run_job((folder, job_id), pending, len(tracks), settings, title)
+        finished = True
+    finally:
+        job_queue.release_job(folder, job_id, finished)
+    
+    result = {"success": [], "failed": []}
+    for music_id, state in job_queue.job_tracks(folder, job_id):
+        result["success" if state == "done" else "failed"].append(music_id)
+    return result
+
+def resume_job(job: Dict[str, Any], settings: Dict[str, Any]) -> Optional[Dict[str, List[str]]]:
+    """继续 job_queue.unfinished_jobs 返回的任务，任务已被其他进程认领时返回None"""
+    if not job_queue.claim_job(settings["folder"], job["job_id"]):
+        log("WARNING", f"任务 {job['job_id']} 正在其他进程中运行或已结束")
+        return None
+    log("INFO", f"继续任务 {job['job_id']}: {job['title']} (已完成 {job['done']}/{job['total']})")
+    return run_job(job["job_id"], settings, job["title"])
 
+def _run_job(job: Optional[Tuple[str, int]], tracks: List[Tuple[int, str]], total: int,
+             settings: Dict[str, Any], title: str) -> Dict[str, List[str]]:
+    """下载 tracks [(序号, 歌曲ID)]，total 为任务中歌曲总数（用于显示序号）"""
+    import asyncio
+    
+    workers = max(1, min(settings.get("concurrency", 1), len(tracks)))
+    outcomes: Dict[str, bool] = {}
+    
+    use_async = settings.get("use_async", False)
+    if use_async:
+        try:
+            import API_async
+        except ImportError as e:
+            log("WARNING", f"异步引擎不可用 ({e})，改用线程模式")
+            use_async = False
+    
+    def on_done(index: int, music_id: str, ok: bool):
+        outcomes[music_id] = ok
+        if job:
+            try:
+                job_queue.set_state(*job, music_id, "done" if ok else "failed")
+            except Exception as e:
+                log("WARNING", f"更新任务状态失败: {e}")
+        done = len(outcomes)
+        failed = sum(1 for success in outcomes.values() if not success)
+        log("INFO", f"{title}进度: {done}/{len(tracks)} (成功 {done - failed}, 失败 {failed})")
+    
+    log("INFO", f"开始{title} {len(tracks)} 首歌曲 (并发数: {workers}, {'异步' if use_async else '线程'}模式)")
+    
+    if use_async:
+        asyncio.run(_run_tracks_async(tracks, total, settings, workers, job, on_done))
+    else:
+        _run_tracks_threaded(tracks, total, settings, workers, job, on_done)
+    
+    result = {"success": [], "failed": []}
+    for _, music_id in tracks:
+        result["success" if outcomes.get(music_id) else "failed"].append(music_id)
+    
+    log("SUCCESS", f"{title}完成: 成功 {len(result['success'])}/{len(tracks)} 首")
+    if result["failed"]:
+        log("WARNING", f"失败的歌曲ID: {' '.join(result['failed'])}")
+    
+    export_metrics()
+    return result
+
+# ============= 歌单/专辑同步 =============
+COLLECTION_NAMES = {"playlist": "歌单", "album": "专辑"}
+
+def fetch_collection(kind: str, collection_id: str, settings: Dict[str, Any]) -> Optional[List[str]]:
+    """获取歌单/专辑的歌曲ID列表，当前接口失败时自动切换"""
+    import API_1
+    import API_2
+    
+    interfaces = route(settings, kind)
+    for interface in interfaces:
+        with router.attempt() as attempt:
+            if interface != 3:
+                fetch = API_1.get_playlist_info if kind == "playlist" else API_1.get_album_info
+                music_ids = fetch(collection_id, interface, **api_options(settings))
+            else:
+                fetch = API_2.get_playlist_info if kind == "playlist" else API_2.get_album_info
+                music_ids = fetch(collection_id, **api_options(settings))
+        if music_ids is not None:
+            return music_ids
+        if not should_failover(interfaces, interface, f"获取{COLLECTION_NAMES[kind]}", attempt):
+            break
+    return None
+
+def search_music(key: str, page: int, settings: Dict[str, Any]) -> Optional[List]:
+    """搜索音乐，当前接口失败时自动切换（格式见 API_1.search_music）"""
+    import API_1
+    
+    interfaces = route(settings, "search")
+    for interface in interfaces:
+        with router.attempt() as attempt:
+            music_id_list = API_1.search_music(key, page, interface, **api_options(settings))
+        if music_id_list is not None:
+            return music_id_list
+        if not should_failover(interfaces, interface, "搜索", attempt):
+            break
+    return None
+
+def prune_tracks(music_ids: List[str], kind: str, collection_id: str, settings: Dict[str, Any]):
+    """按设置归档或删除已从歌单/专辑移除的歌曲"""
+    mode = settings["sync_removed"]
+    if mode == "keep":
+        return
+    
+    folder = settings["folder"]
+    for music_id in music_ids:
+        # 仍属于其他已同步歌单/专辑的歌曲不处理
+        if library.is_referenced(folder, music_id, kind, collection_id):
+            continue
+        try:
+            if library.remove_track(folder, music_id, archive=(mode == "archive")):
+                log("INFO", f"{'归档' if mode == 'archive' else '删除'}已移除的歌曲: {music_id}")
+        except OSError as e:
+            log("WARNING", f"处理已移除的歌曲失败: {music_id}: {e}")
+
+def sync_collection(kind: str, collection_id: str, settings: Dict[str, Any]) -> Optional[Dict[str, List[str]]]:
+    """增量同步歌单/专辑：只下载上次同步后新增的歌曲"""
+    name = COLLECTION_NAMES[kind]
+    folder = settings["folder"]
+    
+    current = fetch_collection(kind, collection_id, settings)
+    if current is None:
+        log("ERROR", f"获取{name}信息失败: {collection_id}")
+        return None
+    
+    previous = library.get_snapshot(folder, kind, collection_id)
+    if not current and previous:
+        # 接口偶尔返回空列表，不能据此删除全部歌曲
+        log("WARNING", f"{name} {collection_id} 返回空列表，跳过本次同步")
+        return None
+    
+    seen = set(previous or [])
+    current_set = set(current)
+    added = [music_id for music_id in current if music_id not in seen]
+    removed = [music_id for music_id in (previous or []) if music_id not in current_set]
+    
+    if previous is None:
+        log("INFO", f"首次同步{name} {collection_id}: {len(current)} 首歌曲")
+    else:
+        log("INFO", f"{name} {collection_id}: 新增 {len(added)} 首, 移除 {len(removed)} 首")
+    
+    failed: List[str] = []
+    if added:
+        failed = run_tracks(added, settings, f"{name}同步", f"sync:{kind}:{collection_id}")["failed"]
+    
+    # 下载失败的歌曲不记入快照，下次同步时重试
+    failed_set = set(failed)
+    library.save_snapshot(folder, kind, collection_id, [music_id for music_id in current if music_id not in failed_set])
+    
+    if removed:
+        prune_tracks(removed, kind, collection_id, settings)
+    
+    return {"added": added, "removed": removed, "failed": failed}
+
+# ============= 交互菜单 =============
 def edit_settings(current_settings: Dict[str, Any]) -> Dict[str, Any]:
     """修改设置"""
     print_header("修改设置")
@@ -622,7 +1209,7 @@ def edit_settings(current_settings: Dict[str, Any]) -> Dict[str, Any]:
         for i, key in enumerate(VALID_SETTINGS.keys(), 1):
             print(f" {i}. {key}")
         
-        choice = input(f"{LOG_COLORS['INFO']}输入选择: {LOG_COLORS['END']}").strip()
+        choice = prompt(f"{LOG_COLORS['INFO']}输入选择: {LOG_COLORS['END']}").strip()
         
         if choice == "0":
             return save_settings(current_settings)
@@ -640,7 +1227,7 @@ def edit_settings(current_settings: Dict[str, Any]) -> Dict[str, Any]:
                 if "range" in validator:
                     print(f"有效范围: {validator['range']}")
                 
-                new_value = input(f"{LOG_COLORS['INFO']}输入新值: {LOG_COLORS['END']}").strip()
+                new_value = prompt(f"{LOG_COLORS['INFO']}输入新值: {LOG_COLORS['END']}").strip()
                 
                 # 验证和转换值
                 try:
@@ -651,10 +1238,15 @@ def edit_settings(current_settings: Dict[str, Any]) -> Dict[str, Any]:
                     else:
                         converted_value = new_value
                     
-                    # 范围检查
+                    # 范围检查（两个元素为连续范围，否则为离散值列表）
                     if "range" in validator:
-                        if converted_value not in validator["range"]:
-                            log("ERROR", f"值 {converted_value} 超出范围 {validator['range']}")
+                        range_list = validator["range"]
+                        if len(range_list) == 2:
+                            in_range = range_list[0] <= converted_value <= range_list[1]
+                        else:
+                            in_range = converted_value in range_list
+                        if not in_range:
+                            log("ERROR", f"值 {converted_value} 超出范围 {range_list}")
                             continue
                     
                     current_settings[key] = converted_value
@@ -674,7 +1266,7 @@ def single_download(settings: Dict[str, Any]):
     print_header("单曲下载")
     
     while True:
-        music_id = input(f"{LOG_COLORS['INFO']}请输入歌曲ID或URL (输入0返回):{LOG_COLORS['END']} ").strip()
+        music_id = prompt(f"{LOG_COLORS['INFO']}请输入歌曲ID或URL (输入0返回):{LOG_COLORS['END']} ").strip()
         
         if music_id == "0":
             break
@@ -691,13 +1283,7 @@ def single_download(settings: Dict[str, Any]):
                 log("DEBUG", f"从URL提取ID: {music_id}")
         
         # 下载歌曲
-        success = False
-        if settings["interface"] != 3:
-            success = API_1_download(music_id, settings)
-        else:
-            success = API_2_download(music_id, settings)
-        
-        if success:
+        if download_track(music_id, settings):
             log("SUCCESS", "单曲下载完成")
         else:
             log("ERROR", "单曲下载失败")
@@ -709,7 +1295,7 @@ def batch_download(settings: Dict[str, Any]):
     print_header("批量下载")
     
     while True:
-        music_id_list = input(f"{LOG_COLORS['INFO']}请输入歌曲ID，用空格分隔 (输入0返回):{LOG_COLORS['END']} ").strip()
+        music_id_list = prompt(f"{LOG_COLORS['INFO']}请输入歌曲ID，用空格分隔 (输入0返回):{LOG_COLORS['END']} ").strip()
         
         if music_id_list == "0":
             break
@@ -724,20 +1310,7 @@ def batch_download(settings: Dict[str, Any]):
             log("WARNING", "未检测到有效的歌曲ID")
             continue
         
-        log("INFO", f"开始批量下载 {len(music_ids)} 首歌曲")
-        
-        success_count = 0
-        for i, music_id in enumerate(music_ids, 1):
-            log("INFO", f"处理第 {i}/{len(music_ids)} 首歌曲: {music_id}")
-            
-            if settings["interface"] != 3:
-                if API_1_download(music_id, settings):
-                    success_count += 1
-            else:
-                if API_2_download(music_id, settings):
-                    success_count += 1
-        
-        log("SUCCESS", f"批量下载完成: 成功 {success_count}/{len(music_ids)} 首")
+        run_tracks(music_ids, settings, "批量下载", "batch:" + ",".join(music_ids))
         print_divider()
 
 def playlist_download(settings: Dict[str, Any]):
@@ -745,7 +1318,7 @@ def playlist_download(settings: Dict[str, Any]):
     print_header("歌单下载")
     
     while True:
-        playlist_id = input(f"{LOG_COLORS['INFO']}请输入歌单ID或链接 (输入0返回):{LOG_COLORS['END']} ").strip()
+        playlist_id = prompt(f"{LOG_COLORS['INFO']}请输入歌单ID或链接 (输入0返回):{LOG_COLORS['END']} ").strip()
         
         if playlist_id == "0":
             break
@@ -762,22 +1335,7 @@ def playlist_download(settings: Dict[str, Any]):
                 log("DEBUG", f"从URL提取歌单ID: {playlist_id}")
         
         # 获取歌单信息
-        music_id_list = []
-        if settings["interface"] != 3:
-            music_id_list = API_1.get_playlist_info(
-                playlist_id, 
-                settings["interface"],
-                max_retries=settings["max_retries"],
-                timeout=settings["timeout"],
-                verify_ssl=settings["verify_ssl"]
-            )
-        else:
-            music_id_list = API_2.get_playlist_info(
-                playlist_id,
-                max_retries=settings["max_retries"],
-                timeout=settings["timeout"],
-                verify_ssl=settings["verify_ssl"]
-            )
+        music_id_list = fetch_collection("playlist", playlist_id, settings)
         
         if not music_id_list:
             log("ERROR", "获取歌单信息失败")
@@ -786,25 +1344,14 @@ def playlist_download(settings: Dict[str, Any]):
         log("INFO", f"歌单包含 {len(music_id_list)} 首歌曲")
         
         # 询问用户是否下载
-        confirm = input(f"{LOG_COLORS['WARNING']}是否下载这 {len(music_id_list)} 首歌曲? (y/n): {LOG_COLORS['END']}").strip().lower()
+        confirm = prompt(f"{LOG_COLORS['WARNING']}是否下载这 {len(music_id_list)} 首歌曲? (y/n): {LOG_COLORS['END']}").strip().lower()
         
         if confirm not in ['y', 'yes', '是']:
             log("INFO", "已取消下载")
             continue
         
         # 下载歌曲
-        success_count = 0
-        for i, music_id in enumerate(music_id_list, 1):
-            log("INFO", f"处理第 {i}/{len(music_id_list)} 首歌曲")
-            
-            if settings["interface"] != 3:
-                if API_1_download(music_id, settings):
-                    success_count += 1
-            else:
-                if API_2_download(music_id, settings):
-                    success_count += 1
-        
-        log("SUCCESS", f"歌单下载完成: 成功 {success_count}/{len(music_id_list)} 首")
+        run_tracks(music_id_list, settings, "歌单下载", f"playlist:{playlist_id}")
         print_divider()
 
 def album_download(settings: Dict[str, Any]):
@@ -812,7 +1359,7 @@ def album_download(settings: Dict[str, Any]):
     print_header("专辑下载")
     
     while True:
-        album_id = input(f"{LOG_COLORS['INFO']}请输入专辑ID或链接 (输入0返回):{LOG_COLORS['END']} ").strip()
+        album_id = prompt(f"{LOG_COLORS['INFO']}请输入专辑ID或链接 (输入0返回):{LOG_COLORS['END']} ").strip()
         
         if album_id == "0":
             break
@@ -829,22 +1376,7 @@ def album_download(settings: Dict[str, Any]):
                 log("DEBUG", f"从URL提取专辑ID: {album_id}")
         
         # 获取专辑信息
-        music_id_list = []
-        if settings["interface"] != 3:
-            music_id_list = API_1.get_album_info(
-                album_id, 
-                settings["interface"],
-                max_retries=settings["max_retries"],
-                timeout=settings["timeout"],
-                verify_ssl=settings["verify_ssl"]
-            )
-        else:
-            music_id_list = API_2.get_album_info(
-                album_id,
-                max_retries=settings["max_retries"],
-                timeout=settings["timeout"],
-                verify_ssl=settings["verify_ssl"]
-            )
+        music_id_list = fetch_collection("album", album_id, settings)
         
         if not music_id_list:
             log("ERROR", "获取专辑信息失败")
@@ -853,32 +1385,21 @@ def album_download(settings: Dict[str, Any]):
         log("INFO", f"专辑包含 {len(music_id_list)} 首歌曲")
         
         # 询问用户是否下载
-        confirm = input(f"{LOG_COLORS['WARNING']}是否下载这 {len(music_id_list)} 首歌曲? (y/n): {LOG_COLORS['END']}").strip().lower()
+        confirm = prompt(f"{LOG_COLORS['WARNING']}是否下载这 {len(music_id_list)} 首歌曲? (y/n): {LOG_COLORS['END']}").strip().lower()
         
         if confirm not in ['y', 'yes', '是']:
             log("INFO", "已取消下载")
             continue
         
         # 下载歌曲
-        success_count = 0
-        for i, music_id in enumerate(music_id_list, 1):
-            log("INFO", f"处理第 {i}/{len(music_id_list)} 首歌曲")
-            
-            if settings["interface"] != 3:
-                if API_1_download(music_id, settings):
-                    success_count += 1
-            else:
-                if API_2_download(music_id, settings):
-                    success_count += 1
-        
-        log("SUCCESS", f"专辑下载完成: 成功 {success_count}/{len(music_id_list)} 首")
+        run_tracks(music_id_list, settings, "专辑下载", f"album:{album_id}")
         print_divider()
 
 def search_download(settings: Dict[str, Any]):
     """搜索下载"""
     print_header("搜索下载")
     
-    key = input(f"{LOG_COLORS['INFO']}请输入搜索关键词:{LOG_COLORS['END']} ").strip()
+    key = prompt(f"{LOG_COLORS['INFO']}请输入搜索关键词:{LOG_COLORS['END']} ").strip()
     
     if not key:
         log("WARNING", "搜索关键词不能为空")
@@ -889,14 +1410,7 @@ def search_download(settings: Dict[str, Any]):
     while True:
         log("INFO", f"搜索: '{key}' (第 {page} 页)")
         
-        music_id_list = API_1.search_music(
-            key, 
-            page, 
-            settings["interface"],
-            max_retries=settings["max_retries"],
-            timeout=settings["timeout"],
-            verify_ssl=settings["verify_ssl"]
-        )
+        music_id_list = search_music(key, page, settings)
         
         if not music_id_list:
             log("WARNING", "搜索结果为空")
@@ -909,7 +1423,7 @@ def search_download(settings: Dict[str, Any]):
         print(f"           r=下一页, l=上一页, 0=返回{LOG_COLORS['END']}")
         print_divider()
         
-        user_input = input(f"{LOG_COLORS['INFO']}请输入操作:{LOG_COLORS['END']} ").strip()
+        user_input = prompt(f"{LOG_COLORS['INFO']}请输入操作:{LOG_COLORS['END']} ").strip()
         
         if user_input.lower() == "r":
             if len(music_id_list) > 0 and music_id_list[0]:
@@ -924,18 +1438,45 @@ def search_download(settings: Dict[str, Any]):
         elif user_input == "0":
             break
         elif user_input:
-            id_list = user_input.split()
-            success_count = 0
-            
-            for music_id in id_list:
-                if music_id.strip():
-                    if API_1_download(music_id.strip(), settings):
-                        success_count += 1
-            
-            log("SUCCESS", f"搜索下载完成: 成功 {success_count}/{len(id_list)} 首")
+            id_list = [music_id.strip() for music_id in user_input.split() if music_id.strip()]
+            run_tracks(id_list, settings, "搜索下载")
         else:
             log("WARNING", "请输入有效的指令或序号")
 
+def sync_download(settings: Dict[str, Any]):
+    """歌单/专辑同步"""
+    print_header("歌单/专辑同步")
+    
+    while True:
+        kind_choice = prompt(f"{LOG_COLORS['INFO']}请选择同步类型 1=歌单, 2=专辑 (输入0返回):{LOG_COLORS['END']} ").strip()
+        
+        if kind_choice == "0":
+            break
+        
+        if kind_choice not in ("1", "2"):
+            log("WARNING", "请输入 1 或 2")
+            continue
+        
+        kind = "playlist" if kind_choice == "1" else "album"
+        name = COLLECTION_NAMES[kind]
+        
+        id_text = prompt(f"{LOG_COLORS['INFO']}请输入{name}ID或链接，多个用空格分隔:{LOG_COLORS['END']} ").strip()
+        collection_ids = [item.split("=")[-1] for item in id_text.split() if item.strip()]
+        
+        if not collection_ids:
+            log("WARNING", "输入不能为空")
+            continue
+        
+        failed_collections = []
+        for collection_id in collection_ids:
+            if sync_collection(kind, collection_id, settings) is None:
+                failed_collections.append(collection_id)
+        
+        log("SUCCESS", f"{name}同步完成: 成功 {len(collection_ids) - len(failed_collections)}/{len(collection_ids)} 个")
+        if failed_collections:
+            log("WARNING", f"同步失败的{name}ID: {' '.join(failed_collections)}")
+        print_divider()
+
 def view_logs():
     """查看日志"""
     print_header("查看日志")
@@ -969,14 +1510,14 @@ def view_logs():
         print(" 2. 清空日志")
         print(" 0. 返回")
         
-        choice = input(f"{LOG_COLORS['INFO']}输入选择: {LOG_COLORS['END']}").strip()
+        choice = prompt(f"{LOG_COLORS['INFO']}输入选择: {LOG_COLORS['END']}").strip()
         
         if choice == "1":
             print_header("完整日志")
             for line in lines:
                 print(line.strip())
         elif choice == "2":
-            confirm = input(f"{LOG_COLORS['WARNING']}确认清空日志? (y/n): {LOG_COLORS['END']}").strip().lower()
+            confirm = prompt(f"{LOG_COLORS['WARNING']}确认清空日志? (y/n): {LOG_COLORS['END']}").strip().lower()
             if confirm in ['y', 'yes', '是']:
                 with open(LOG_CONFIG['log_file'], 'w', encoding='utf-8') as f:
                     pass
@@ -985,44 +1526,62 @@ def view_logs():
     except Exception as e:
         log("ERROR", f"读取日志文件失败: {e}")
 
-try:
-    settings = load_settings()
+def offer_resume(settings: Dict[str, Any]):
+    """启动时提示继续上次中断的下载任务"""
+    try:
+        jobs = job_queue.unfinished_jobs(settings["folder"])
+    except Exception as e:
+        log("WARNING", f"读取任务队列失败: {e}")
+        return
+    if not jobs:
+        return
     
+    log("WARNING", f"发现 {len(jobs)} 个未完成的下载任务:")
+    for job in jobs:
+        created = datetime.fromtimestamp(job["created"]).strftime("%Y-%m-%d %H:%M")
+        print(f"  任务 {job['job_id']}: {job['title']} (已完成 {job['done']}/{job['total']}, 创建于 {created})")
+    
+    choice = prompt(f"{LOG_COLORS['INFO']}是否继续? (y=继续, n=下次再说, d=放弃这些任务):{LOG_COLORS['END']} ").strip().lower()
+    if choice == "y":
+        for job in jobs:
+            resume_job(job, settings)
+    elif choice == "d":
+        for job in jobs:
+            job_queue.cancel_job(settings["folder"], job["job_id"])
+        log("INFO", f"已放弃 {len(jobs)} 个任务")
+
+def run_menu(settings: Dict[str, Any]):
+    """交互式主菜单"""
     # 显示欢迎信息
     log("INFO", f"接口: {settings['interface']}, 音质: {level_name[settings['level_name']-1]}, 文件夹: {settings['folder']}")
     log("INFO", f"最大重试: {settings['max_retries']}, 超时: {settings['timeout']}秒")
     
+    offer_resume(settings)
+    
     # 主循环
     while True:
         print_header("主菜单")
         
-        # 根据接口显示不同菜单
-        if settings["interface"] != 3:
-            menu_text = f"{LOG_COLORS['INFO']}请选择模式:{LOG_COLORS['END']}\n" \
-                       " 0. 修改设置\n" \
-                       " 1. 单曲下载\n" \
-                       " 2. 批量下载\n" \
-                       " 3. 歌单下载\n" \
-                       " 4. 专辑下载\n" \
-                       " 5. 搜索下载\n" \
-                       " 6. 查看日志\n" \
-                       f"{LOG_COLORS['INFO']}exit. 退出程序{LOG_COLORS['END']}\n" \
-                       f"{LOG_COLORS['INFO']}输入选择: {LOG_COLORS['END']}"
-        else:
-            menu_text = f"{LOG_COLORS['INFO']}请选择模式:{LOG_COLORS['END']}\n" \
-                       " 0. 修改设置\n" \
-                       " 1. 单曲下载\n" \
-                       " 2. 批量下载\n" \
-                       " 3. 歌单下载\n" \
-                       " 4. 专辑下载\n" \
-                       " 5. 查看日志\n" \
-                       f"{LOG_COLORS['INFO']}exit. 退出程序{LOG_COLORS['END']}\n" \
-                       f"{LOG_COLORS['INFO']}输入选择: {LOG_COLORS['END']}"
+        # 菜单编号固定，当前接口不支持的操作显示为不可用（接口3不支持搜索）
+        has_search = bool(route(settings, "search"))
+        search_text = "搜索下载" if has_search else "搜索下载（当前接口不支持）"
+        menu_text = f"{LOG_COLORS['INFO']}请选择模式:{LOG_COLORS['END']}\n" \
+                   " 0. 修改设置\n" \
+                   " 1. 单曲下载\n" \
+                   " 2. 批量下载\n" \
+                   " 3. 歌单下载\n" \
+                   " 4. 专辑下载\n" \
+                   f" 5. {search_text}\n" \
+                   " 6. 查看日志\n" \
+                   " 7. 歌单/专辑同步\n" \
+                   f"{LOG_COLORS['INFO']}exit. 退出程序{LOG_COLORS['END']}\n" \
+                   f"{LOG_COLORS['INFO']}输入选择: {LOG_COLORS['END']}"
         
-        mode = input(menu_text).strip()
+        mode = prompt(menu_text).strip()
         
         if mode == "0":
             settings = edit_settings(settings)
+            apply_settings(settings)
         elif mode == "1":
             single_download(settings)
         elif mode == "2":
@@ -1031,20 +1590,319 @@ try:
             playlist_download(settings)
         elif mode == "4":
             album_download(settings)
-        elif mode == "5" and settings["interface"] != 3:
+        elif mode == "5" and has_search:
             search_download(settings)
-        elif mode == "5" and settings["interface"] == 3:
-            view_logs()
-        elif mode == "6" and settings["interface"] != 3:
+        elif mode == "5":
+            log("WARNING", "当前接口不支持搜索，请在设置中更换接口或开启自动路由")
+        elif mode == "6":
             view_logs()
+        elif mode == "7":
+            sync_download(settings)
         elif mode.lower() == "exit":
             log("INFO", "感谢使用，再见！")
             break
         else:
-            log("ERROR", "无效的选择，请重新输入")()
-except KeyboardInterrupt:
-    log("INFO", "\n程序被用户中断")
-except Exception as e:
-    log("ERROR", f"程序运行错误: {e}")
-    import traceback
-    traceback.print_exc()
\ No newline at end of file
+            log("ERROR", "无效的选择，请重新输入")
+
+# ============= 命令行 =============
+# 退出码
+EXIT_OK = 0            # 全部成功
+EXIT_FAILED = 1        # 有歌曲下载失败，或歌单/专辑/搜索结果获取失败
+EXIT_USAGE = 2         # 参数错误（与 argparse 一致）
+EXIT_INTERRUPTED = 130 # 被用户中断
+
+def extract_id(text: str) -> str:
+    """从ID或链接中提取ID（链接取最后一个 = 之后的部分）"""
+    return text.strip().split("=")[-1]
+
+def read_id_file(path: str) -> List[str]:
+    """读取歌曲ID文件：每行一个或多个ID/链接，# 开头的行为注释，- 表示标准输入"""
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    
+    music_ids = []
+    for line in lines:
+        if line.strip().startswith("#"):
+            continue
+        music_ids.extend(extract_id(item) for item in line.split())
+    return music_ids
+
+def search_ids(key: str, limit: int, settings: Dict[str, Any]) -> Optional[List[str]]:
+    """按顺序取前 limit 条搜索结果的歌曲ID，搜索失败返回None"""
+    music_ids: List[str] = []
+    page = 1
+    while len(music_ids) < limit:
+        result = search_music(key, page, settings)
+        if result is None:
+            return music_ids[:limit] if music_ids else None
+        # 结果格式: [是否有下一页, 总数, 歌曲ID...]
+        music_ids.extend(result[2:])
+        if not result[0]:
+            break
+        page += 1
+    return music_ids[:limit]
+
+def build_parser() -> argparse.ArgumentParser:
+    """命令行参数"""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--settings", default="settings.json", metavar="FILE", help="设置文件 (默认 settings.json)")
+    common.add_argument("--set", action="append", default=[], dest="overrides", metavar="KEY=VALUE",
+                        help="临时修改设置项（不写入设置文件），可重复使用")
+    
+    parser = argparse.ArgumentParser(
+        prog="main.py",
+        description="音乐下载器。不带参数运行时进入交互菜单；执行命令时日志输出到标准错误，"
+                    "结束后向标准输出打印一行 JSON 汇总。"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    download = subparsers.add_parser("download", parents=[common], help="下载歌曲、歌单、专辑或搜索结果")
+    download.add_argument("--ids", nargs="+", default=[], metavar="ID", help="歌曲ID或链接")
+    download.add_argument("--playlist", nargs="+", default=[], metavar="ID", help="歌单ID或链接")
+    download.add_argument("--album", nargs="+", default=[], metavar="ID", help="专辑ID或链接")
+    download.add_argument("--search", metavar="KEYWORD", help="搜索关键词，下载前 --limit 条结果")
+    download.add_argument("--limit", type=int, default=1, help="下载的搜索结果数 (默认 1)")
+    download.add_argument("--from-file", metavar="FILE", help="从文件读取歌曲ID，每行一个 (- 表示标准输入)")
+    
+    sync = subparsers.add_parser("sync", parents=[common], help="增量同步歌单/专辑（只下载新增的歌曲）")
+    sync.add_argument("--playlist", nargs="+", default=[], metavar="ID", help="歌单ID或链接")
+    sync.add_argument("--album", nargs="+", default=[], metavar="ID", help="专辑ID或链接")
+    
+    subparsers.add_parser("jobs", parents=[common], help="列出中断后未完成的下载任务")
+    
+    resume = subparsers.add_parser("resume", parents=[common], help="继续中断的下载任务（默认全部）")
+    resume.add_argument("--job", nargs="+", type=int, default=[], metavar="ID", help="任务ID（见 jobs 命令）")
+    resume.add_argument("--discard", action="store_true", help="放弃这些任务而不是继续")
+    
+    manifest = subparsers.add_parser("library", parents=[common], help="维护下载清单（记录已下载的歌曲）")
+    manifest.add_argument("action", choices=["rebuild"],
+                          help="rebuild: 清空清单并按文件夹中的文件重新登记（平时每次运行时会自动对照文件夹）")
+    
+    serve = subparsers.add_parser("serve", parents=[common], help="作为常驻服务运行，通过本地 HTTP 接口提交下载任务")
+    serve.add_argument("--host", default="127.0.0.1", help="监听地址 (默认 127.0.0.1)")
+    serve.add_argument("--port", type=int, default=8765, help="监听端口 (默认 8765，0 表示随机端口)")
+    return parser
+
+def parse_overrides(parser: argparse.ArgumentParser, overrides: List[str]) -> Dict[str, str]:
+    """解析 --set KEY=VALUE，未知设置项按参数错误处理"""
+    changes = {}
+    for item in overrides:
+        key, sep, value = item.partition("=")
+        key = key.strip()
+        if not sep or key not in VALID_SETTINGS:
+            parser.error(f"无效的设置项: {item} (可用: {', '.join(VALID_SETTINGS)})")
+        changes[key] = value.strip()
+    return changes
+
+def cli_download(args: argparse.Namespace, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """download 命令：汇总全部来源的歌曲ID后一起下载"""
+    music_ids = [extract_id(item) for item in args.ids]
+    unresolved: List[str] = []
+    
+    if args.from_file:
+        try:
+            music_ids.extend(read_id_file(args.from_file))
+        except OSError as e:
+            log("ERROR", f"读取ID文件失败: {e}")
+            unresolved.append(f"file:{args.from_file}")
+    
+    for kind in ("playlist", "album"):
+        for collection_id in map(extract_id, getattr(args, kind)):
+            collection = fetch_collection(kind, collection_id, settings)
+            if collection is None:
+                log("ERROR", f"获取{COLLECTION_NAMES[kind]}信息失败: {collection_id}")
+                unresolved.append(f"{kind}:{collection_id}")
+            else:
+                log("INFO", f"{COLLECTION_NAMES[kind]} {collection_id} 包含 {len(collection)} 首歌曲")
+                music_ids.extend(collection)
+    
+    if args.search:
+        found = search_ids(args.search, args.limit, settings)
+        if found is None:
+            log("ERROR", f"搜索失败: {args.search}")
+            unresolved.append(f"search:{args.search}")
+        else:
+            music_ids.extend(found)
+    
+    # 多个来源可能包含同一首歌曲
+    music_ids = list(dict.fromkeys(music_id for music_id in music_ids if music_id))
+    # 以相同参数再次运行时继续上次中断的任务
+    source = "cli:" + json.dumps({
+        "ids": args.ids, "playlist": args.playlist, "album": args.album,
+        "search": args.search, "limit": args.limit, "from_file": args.from_file
+    }, ensure_ascii=False, sort_keys=True)
+    result = run_tracks(music_ids, settings, "下载", source) if music_ids else {"success": [], "failed": []}
+    return {
+        "total": len(music_ids),
+        "success": result["success"],
+        "failed": result["failed"],
+        "unresolved": unresolved
+    }
+
+def cli_sync(args: argparse.Namespace, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """sync 命令：依次同步各歌单/专辑"""
+    collections = []
+    unresolved: List[str] = []
+    failed: List[str] = []
+    for kind in ("playlist", "album"):
+        for collection_id in map(extract_id, getattr(args, kind)):
+            result = sync_collection(kind, collection_id, settings)
+            if result is None:
+                unresolved.append(f"{kind}:{collection_id}")
+                continue
+            collections.append({"kind": kind, "id": collection_id, **result})
+            failed.extend(result["failed"])
+    return {"collections": collections, "failed": failed, "unresolved": unresolved}
+
+def cli_resume(args: argparse.Namespace, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """resume 命令：继续（或 --discard 放弃）未完成的任务"""
+    jobs = job_queue.unfinished_jobs(settings["folder"])
+    unresolved: List[str] = []
+    if args.job:
+        found = {job["job_id"]: job for job in jobs}
+        unresolved = [f"job:{job_id}" for job_id in args.job if job_id not in found]
+        for item in unresolved:
+            log("ERROR", f"没有可继续的任务: {item}")
+        jobs = [found[job_id] for job_id in args.job if job_id in found]
+    
+    success: List[str] = []
+    failed: List[str] = []
+    for job in jobs:
+        if args.discard:
+            job_queue.cancel_job(settings["folder"], job["job_id"])
+            log("INFO", f"已放弃任务 {job['job_id']}: {job['title']}")
+            continue
+        result = resume_job(job, settings)
+        if result is None:
+            unresolved.append(f"job:{job['job_id']}")
+            continue
+        success.extend(result["success"])
+        failed.extend(result["failed"])
+    return {"jobs": [job["job_id"] for job in jobs], "success": success, "failed": failed, "unresolved": unresolved}
+
+def cli_library(args: argparse.Namespace, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """library 命令：重建下载清单"""
+    tracks = library.rebuild(settings["folder"])
+    log("SUCCESS", f"下载清单已重建: 登记 {tracks} 首歌曲")
+    return {"action": args.action, "tracks": tracks}
+
+def cli_serve(args: argparse.Namespace, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """serve 命令：运行下载服务直到按 Ctrl+C，连接池和缓存在任务之间保留"""
+    import service
+    
+    if settings.get("use_async"):
+        log("WARNING", "服务模式使用线程池下载，忽略 use_async 设置")
+    workers = max(1, settings["concurrency"])
+    configure_pool(settings, workers)
+    
+    unfinished = job_queue.unfinished_jobs(settings["folder"])
+    if unfinished:
+        log("WARNING", f"有 {len(unfinished)} 个未完成的下载任务，可使用 resume 命令继续")
+    
+    def resolve(kind: str, source: Any) -> Optional[List[str]]:
+        if kind == "tracks":
+            return [extract_id(item) for item in source]
+        music_ids = fetch_collection(kind, extract_id(source), settings)
+        if music_ids is None:
+            log("ERROR", f"获取{COLLECTION_NAMES[kind]}信息失败: {source}")
+        return music_ids
+    
+    def process(job: Optional[Tuple[str, int]], index: int, total: int, music_id: str) -> bool:
+        return process_track(job, index, total, music_id, settings)
+    
+    jobs = service.JobService(settings["folder"], workers, resolve, process, lambda job: export_metrics())
+    if not service.serve(jobs, args.host, args.port):
+        return {"unresolved": [f"{args.host}:{args.port}"]}
+    snapshots = jobs.snapshots()
+    return {
+        "jobs": len(snapshots),
+        "success": sum(job["done"] for job in snapshots),
+        "failed": sum(job["failed"] for job in snapshots)
+    }
+
+def run_cli(argv: List[str]) -> int:
+    """执行命令行命令（不提示输入），返回退出码"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "download" and not (args.ids or args.playlist or args.album or args.search or args.from_file):
+        parser.error("download 需要 --ids、--playlist、--album、--search 或 --from-file 中的至少一项")
+    if args.command == "sync" and not (args.playlist or args.album):
+        parser.error("sync 需要 --playlist 或 --album")
+    if args.command == "download" and args.limit < 1:
+        parser.error("--limit 必须大于0")
+    changes = parse_overrides(parser, args.overrides)
+    
+    summary: Dict[str, Any] = {"command": args.command}
+    exit_code = EXIT_OK
+    started = time.monotonic()
+    output = sys.stdout
+    try:
+        # 日志、进度和搜索结果都输出到标准错误，标准输出只留给 JSON 汇总
+        with contextlib.redirect_stdout(sys.stderr):
+            try:
+                settings = load_settings(args.settings)
+                if changes:
+                    settings = validate_settings({**settings, **changes})
+                apply_settings(settings)
+                
+                if args.command == "download":
+                    summary.update(cli_download(args, settings))
+                elif args.command == "sync":
+                    summary.update(cli_sync(args, settings))
+                elif args.command == "resume":
+                    summary.update(cli_resume(args, settings))
+                elif args.command == "library":
+                    summary.update(cli_library(args, settings))
+                elif args.command == "serve":
+                    summary.update(cli_serve(args, settings))
+                else:
+                    summary["jobs"] = job_queue.unfinished_jobs(settings["folder"])
+                if summary.get("failed") or summary.get("unresolved"):
+                    exit_code = EXIT_FAILED
+            finally:
+                export_metrics()
+                log_system.flush()
+    except KeyboardInterrupt:
+        log_system.flush()
+        summary["interrupted"] = True
+        exit_code = EXIT_INTERRUPTED
+    
+    summary["exit_code"] = exit_code
+    summary["elapsed"] = round(time.monotonic() - started, 1)
+    output.write(json.dumps(summary, ensure_ascii=False) + "\n")
+    output.flush()
+    return exit_code
+
+# ============= 主程序 =============
+def main(argv: Optional[List[str]] = None) -> int:
+    """程序入口：带参数时执行命令（见 build_parser），否则进入交互菜单"""
+    if argv is None:
+        argv = sys.argv[1:]
+    setup_logger()
+    if argv:
+        return run_cli(argv)
+    
+    print_header("音乐下载器 v1.0")
+    try:
+        settings = load_settings()
+        apply_settings(settings)
+        run_menu(settings)
+    except KeyboardInterrupt:
+        log("INFO", "\n程序被用户中断")
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        log("ERROR", f"程序运行错误: {e}")
+        import traceback
+        traceback.print_exc()
+        return EXIT_FAILED
+    finally:
+        export_metrics()
+    return EXIT_OK
+
+if __name__ == "__main__":
+    # 打包为可执行文件（PyInstaller）时，写标签进程启动后要在这里接管，不能再次运行主程序
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional
+
+# ============= 缓存配置 =============
+# 各接口数据的有效期（秒），未列出的接口不缓存
+ENDPOINT_TTLS = {
+    "url": 10 * 60,                 # 下载链接很快失效
+    "detail": 30 * 24 * 3600,       # 歌曲信息基本不变
+    "lyric": 30 * 24 * 3600,
+    "album": 7 * 24 * 3600,
+    "playlist": 10 * 60,            # 歌单可能随时被修改
+    "song_url": 10 * 60,            # 接口3的下载链接
+    "song_info": 30 * 24 * 3600,    # 接口3的歌曲信息（含歌词）
+}
+
+CACHE_CONFIG = {
+    "enabled": False,
+    "path": "metadata_cache.db",
+    "max_bytes": 64 * 1024 * 1024,  # 超出后按最近最少使用淘汰
+}
+
+# 每写入多少条检查一次容量
+EVICT_INTERVAL = 100
+
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+_puts_since_evict = 0
+
+def configure(enabled: Optional[bool] = None, path: Optional[str] = None, max_bytes: Optional[int] = None):
+    """修改缓存配置，修改路径后重新打开数据库"""
+    global _conn
+    with _lock:
+        if enabled is not None:
+            CACHE_CONFIG["enabled"] = bool(enabled)
+        if max_bytes is not None:
+            CACHE_CONFIG["max_bytes"] = int(max_bytes)
+        if path is not None and path != CACHE_CONFIG["path"]:
+            CACHE_CONFIG["path"] = path
+            if _conn is not None:
+                _conn.close()
+                _conn = None
+
+def _connect() -> sqlite3.Connection:
+    """打开缓存数据库（调用方需持有锁）"""
+    global _conn
+    if _conn is None:
+        folder = os.path.dirname(CACHE_CONFIG["path"])
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        _conn = sqlite3.connect(CACHE_CONFIG["path"], check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " endpoint TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " expires REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed)")
+        _conn.commit()
+    return _conn
+
+def make_key(endpoint: str, interface: int, params: Dict[str, Any]) -> str:
+    """缓存键：接口名 + 接口编号 + 请求参数"""
+    return f"{endpoint}|{interface}|{json.dumps(params, sort_keys=True, ensure_ascii=False)}"
+
+def get(endpoint: str, interface: int, params: Dict[str, Any]) -> Optional[Any]:
+    """读取缓存，未命中或已过期返回None"""
+    if not CACHE_CONFIG["enabled"] or endpoint not in ENDPOINT_TTLS:
+        return None
+
+    key = make_key(endpoint, interface, params)
+    now = time.time()
+    try:
+        with _lock:
+            conn = _connect()
+            row = conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            conn.commit()
+        return json.loads(row[0])
+    except (sqlite3.Error, ValueError):
+        return None
+
+def put(endpoint: str, interface: int, params: Dict[str, Any], value: Any):
+    """写入缓存"""
+    global _puts_since_evict
+    ttl = ENDPOINT_TTLS.get(endpoint)
+    if not CACHE_CONFIG["enabled"] or ttl is None or value is None:
+        return
+
+    key = make_key(endpoint, interface, params)
+    text = json.dumps(value, ensure_ascii=False)
+    now = time.time()
+    try:
+        with _lock:
+            conn = _connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, endpoint, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, text, len(text), now + ttl, now)
+            )
+            _puts_since_evict += 1
+            if _puts_since_evict >= EVICT_INTERVAL:
+                _puts_since_evict = 0
+                _evict(conn, now)
+            conn.commit()
+    except sqlite3.Error:
+        pass
+
+def invalidate(endpoint: str, interface: int, params: Dict[str, Any]):
+    """删除一条缓存（例如下载链接已失效）"""
+    if not CACHE_CONFIG["enabled"]:
+        return
+    try:
+        with _lock:
+            conn = _connect()
+            conn.execute("DELETE FROM cache WHERE key = ?", (make_key(endpoint, interface, params),))
+            conn.commit()
+    except sqlite3.Error:
+        pass
+
+def _evict(conn: sqlite3.Connection, now: float):
+    """清理过期条目，并按最近最少使用淘汰到容量以内"""
+    conn.execute("DELETE FROM cache WHERE expires < ?", (now,))
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+    if total <= CACHE_CONFIG["max_bytes"]:
+        return
+
+    excess = total - CACHE_CONFIG["max_bytes"]
+    freed = 0
+    victims = []
+    for key, size in conn.execute("SELECT key, size FROM cache ORDER BY accessed"):
+        victims.append((key,))
+        freed += size
+        if freed >= excess:
+            break
+    conn.executemany("DELETE FROM cache WHERE key = ?", victims)
+
+def clear():
+    """清空缓存"""
+    try:
+        with _lock:
+            conn = _connect()
+            conn.execute("DELETE FROM cache")
+            conn.commit()
+    except sqlite3.Error:
+        pass
+
+def close():
+    """关闭缓存数据库"""
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
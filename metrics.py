@@ -0,0 +1,221 @@
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+# 各处理阶段的耗时和次数，按接口和结果（success/failed/cached/error）分类，另有重试次数和传输字节数。
+# 统计始终进行（只是内存中的计数），开启导出后写入 Prometheus 文本格式文件和 JSON 汇总文件，
+# 便于对比不同版本的性能。
+#
+# 阶段: music_url, music_info, lyric, collection, search（接口请求）, cover, audio,
+#       metadata（下载完成后写标签，含等待写标签进程的时间；边下载边写标签时没有这一阶段）
+
+METRICS_CONFIG = {
+    "enabled": False,
+    "prometheus_file": "metrics.prom",
+    "json_file": "metrics.json"
+}
+
+PREFIX = "music_downloader"
+
+# 直方图的桶上限（秒）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# 接口名（API_1 的 endpoint、API_2 的缓存名）对应的阶段
+ENDPOINT_STAGES = {
+    "url": "music_url",
+    "song_url": "music_url",
+    "detail": "music_info",
+    "song_info": "music_info",
+    "lyric": "lyric",
+    "album": "collection",
+    "playlist": "collection",
+    "search": "search"
+}
+
+COUNTER_HELP = {
+    "retries_total": "重试次数",
+    "bytes_total": "下载的字节数"
+}
+
+class Histogram:
+    """单个阶段的耗时分布"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """按桶线性插值估算分位数（同 Prometheus histogram_quantile），不超过最大值"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            if bucket and seen + bucket >= rank:
+                lower = BUCKETS[index - 1] if index > 0 else 0.0
+                if index == len(BUCKETS):
+                    return self.max
+                return min(self.max, lower + (BUCKETS[index] - lower) * (rank - seen) / bucket)
+            seen += bucket
+        return self.max
+
+class Span:
+    """measure 中的一次计时，调用方可修改 outcome"""
+
+    def __init__(self):
+        self.outcome = "success"
+
+# 键: (阶段, 接口, 结果)
+_stages: Dict[Tuple[str, str, str], Histogram] = {}
+# 键: (名称, ((标签, 值), ...))
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+_lock = threading.Lock()
+
+def configure(enabled: Optional[bool] = None, prometheus_file: Optional[str] = None, json_file: Optional[str] = None):
+    """修改导出设置"""
+    if enabled is not None:
+        METRICS_CONFIG["enabled"] = bool(enabled)
+    if prometheus_file is not None:
+        METRICS_CONFIG["prometheus_file"] = prometheus_file
+    if json_file is not None:
+        METRICS_CONFIG["json_file"] = json_file
+
+def stage_of(endpoint: str) -> str:
+    """接口名对应的阶段"""
+    return ENDPOINT_STAGES.get(endpoint, endpoint)
+
+def observe(stage: str, seconds: float, interface: Any = None, outcome: str = "success"):
+    """记录一次阶段耗时"""
+    key = (stage, "" if interface is None else str(interface), outcome)
+    with _lock:
+        histogram = _stages.get(key)
+        if histogram is None:
+            histogram = _stages[key] = Histogram()
+        histogram.observe(seconds)
+
+def count(name: str, amount: float = 1, **labels: Any):
+    """累加计数器"""
+    if not amount:
+        return
+    key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+@contextlib.contextmanager
+def measure(stage: str, interface: Any = None) -> Iterator[Span]:
+    """记录代码块的耗时，抛出异常时结果为 error"""
+    span = Span()
+    started = time.perf_counter()
+    try:
+        yield span
+    except BaseException:
+        span.outcome = "error"
+        raise
+    finally:
+        observe(stage, time.perf_counter() - started, interface, span.outcome)
+
+def call(stage: str, interface: Any, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """调用 fn 并记录耗时，返回值为空（None、False）时结果为 failed"""
+    with measure(stage, interface) as span:
+        result = fn(*args, **kwargs)
+        span.outcome = "success" if result else "failed"
+    return result
+
+async def call_async(stage: str, interface: Any, awaitable: Awaitable[Any]) -> Any:
+    """call 的异步版本"""
+    with measure(stage, interface) as span:
+        result = await awaitable
+        span.outcome = "success" if result else "failed"
+    return result
+
+def reset():
+    """清空统计"""
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+# ============= 导出 =============
+def summary() -> Dict[str, Any]:
+    """统计汇总（耗时单位为秒）"""
+    with _lock:
+        stages = [
+            {
+                "stage": stage, "interface": interface, "outcome": outcome,
+                "count": histogram.count,
+                "seconds": round(histogram.sum, 3),
+                "mean": round(histogram.sum / histogram.count, 3),
+                "p50": round(histogram.quantile(0.5), 3),
+                "p95": round(histogram.quantile(0.95), 3),
+                "p99": round(histogram.quantile(0.99), 3),
+                "max": round(histogram.max, 3)
+            }
+            for (stage, interface, outcome), histogram in sorted(_stages.items())
+        ]
+        counters = [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(_counters.items())
+        ]
+    return {"generated": round(time.time(), 3), "stages": stages, "counters": counters}
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(pairs: List[Tuple[str, str]]) -> str:
+    return "{" + ",".join(f'{label}="{_escape(value)}"' for label, value in pairs) + "}"
+
+def prometheus_text() -> str:
+    """Prometheus 文本格式"""
+    name = f"{PREFIX}_stage_seconds"
+    lines = [f"# HELP {name} 各处理阶段的耗时（秒）", f"# TYPE {name} histogram"]
+    with _lock:
+        for (stage, interface, outcome), histogram in sorted(_stages.items()):
+            base = [("stage", stage), ("interface", interface), ("outcome", outcome)]
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS + (float("inf"),), histogram.buckets):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_labels(base + [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(base)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{_labels(base)} {histogram.count}")
+
+        written = set()
+        for (counter, labels), value in sorted(_counters.items()):
+            metric = f"{PREFIX}_{counter}"
+            if counter not in written:
+                written.add(counter)
+                lines.append(f"# HELP {metric} {COUNTER_HELP.get(counter, counter)}")
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_labels(list(labels))} {value:.15g}")
+    return "\n".join(lines) + "\n"
+
+def _write_atomic(path: str, text: str):
+    # 先写临时文件再替换，读取方不会读到写了一半的文件
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    temp = f"{path}.tmp"
+    with open(temp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp, path)
+
+def export() -> bool:
+    """开启导出时写入 Prometheus 文本文件和 JSON 汇总，返回是否写入"""
+    if not METRICS_CONFIG["enabled"]:
+        return False
+    if METRICS_CONFIG["prometheus_file"]:
+        _write_atomic(METRICS_CONFIG["prometheus_file"], prometheus_text())
+    if METRICS_CONFIG["json_file"]:
+        _write_atomic(METRICS_CONFIG["json_file"], json.dumps(summary(), ensure_ascii=False, indent=2))
+    return True
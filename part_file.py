@@ -0,0 +1,221 @@
+import json
+import os
+import re
+import threading
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+# 未完成的下载写入 {文件名}.part，下载进度和校验信息写入 {文件名}.part.json
+PART_SUFFIX = ".part"
+STATE_SUFFIX = ".part.json"
+
+# 分段下载时每写入多少字节保存一次进度
+STATE_SAVE_INTERVAL = 4 * 1024 * 1024
+
+CONTENT_RANGE_PATTERN = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+# 异步引擎中同一文件的各段可能在不同线程中同时保存状态，共用一个临时文件
+_state_lock = threading.Lock()
+
+def part_path(filepath: str) -> str:
+    """未完成文件的路径"""
+    return filepath + PART_SUFFIX
+
+def state_path(filepath: str) -> str:
+    """下载状态文件的路径"""
+    return filepath + STATE_SUFFIX
+
+def load_state(filepath: str) -> Optional[Dict[str, Any]]:
+    """读取未完成下载的状态，缺少 .part 或状态文件时清理残留并返回None"""
+    try:
+        with open(state_path(filepath), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if os.path.exists(part_path(filepath)) and state.get("size"):
+            return state
+    except (OSError, ValueError):
+        pass
+
+    clear(filepath)
+    return None
+
+def save_state(filepath: str, state: Dict[str, Any]):
+    """保存下载状态（先写临时文件再替换，避免中断时留下损坏的状态）"""
+    path = state_path(filepath)
+    tmp_path = path + ".tmp"
+    # 先在内存中序列化，写文件期间状态被修改也不会写出不一致的内容
+    text = json.dumps(state)
+    with _state_lock:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+def clear(filepath: str):
+    """删除未完成的文件和状态"""
+    for path in (part_path(filepath), state_path(filepath)):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def finalize(filepath: str):
+    """下载完成，将 .part 原子重命名为最终文件"""
+    os.replace(part_path(filepath), filepath)
+    try:
+        os.remove(state_path(filepath))
+    except OSError:
+        pass
+
+def new_state(headers: Any, total_size: int) -> Dict[str, Any]:
+    """根据完整响应的响应头创建下载状态"""
+    etag = headers.get("ETag") or ""
+    return {
+        # 弱ETag不能用于 If-Range
+        "etag": etag if etag and not etag.startswith("W/") else None,
+        "last_modified": headers.get("Last-Modified"),
+        "size": total_size
+    }
+
+def range_headers(state: Dict[str, Any], start: int, end: Optional[int] = None) -> Dict[str, str]:
+    """续传请求头：Range 加上 If-Range 校验，文件已变化时服务器会返回完整内容"""
+    headers = {"Range": f"bytes={start}-{'' if end is None else end}"}
+    validator = state.get("etag") or state.get("last_modified")
+    if validator:
+        headers["If-Range"] = validator
+    return headers
+
+def content_range(headers: Any) -> Optional[Tuple[int, int, Optional[int]]]:
+    """解析 Content-Range 响应头，返回 (起始, 结束, 总大小)"""
+    match = CONTENT_RANGE_PATTERN.match(headers.get("Content-Range") or "")
+    if not match:
+        return None
+    total = match.group(3)
+    return int(match.group(1)), int(match.group(2)), None if total == "*" else int(total)
+
+def accepts_range(status: int, headers: Any, state: Dict[str, Any], start: int) -> bool:
+    """判断响应是否为从 start 开始、且与记录的文件大小一致的分段内容"""
+    if status != 206:
+        return False
+    parsed = content_range(headers)
+    return parsed is not None and parsed[0] == start and parsed[2] in (None, state["size"])
+
+def preallocate(f: BinaryIO, size: int, allocate: bool = True):
+    """将文件扩展到 size 字节；allocate 为True时尽量实际分配磁盘空间，减少碎片"""
+    if allocate and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+            return
+        except OSError:
+            pass
+    f.truncate(size)
+
+class PartWriter:
+    """将下载内容写入 .part 文件
+
+    小块数据合并后再写入；边下载边写标签时先交给 tagger 处理文件头。
+    preallocate 为True时按总大小预分配文件，并在状态中记录已写入的位置（written），
+    续传时从该位置继续（此时文件大小不再代表已下载的字节数）。
+    """
+
+    def __init__(self, filepath: str, state: Optional[Dict[str, Any]], tagger: Any, offset: int,
+                 buffer_size: int, preallocate: bool = False):
+        self.filepath = filepath
+        self.state = state
+        self.tagger = tagger
+        self.buffer_size = buffer_size
+        self.preallocate = preallocate and state is not None
+        # 预分配过的文件（包括之前的下载）需要继续记录写入位置
+        self.track_position = state is not None and (preallocate or "written" in state)
+        # 已写入文件的下载内容字节数（不含缓冲区中和 tagger 暂存的数据）
+        self.written = offset
+        self._buffer = bytearray()
+        self._held = 0
+        self._unsaved = 0
+
+        path = part_path(filepath)
+        self._file = open(path, 'r+b' if offset and os.path.exists(path) else 'wb')
+        self._file.seek(offset + self._delta())
+        if self.track_position:
+            # 先记录位置再预分配，中断后不会把预分配的空白当作已下载的内容
+            self._save_position()
+        if self.preallocate and (not tagger or tagger.resolved):
+            self._allocate()
+
+    def _delta(self) -> int:
+        return self.state.get("delta", 0) if self.state else 0
+
+    def _allocate(self):
+        preallocate(self._file, self.state["size"] + self._delta())
+
+    def write(self, data: Any):
+        """写入一段下载内容（bytes 或 memoryview）"""
+        tagger = self.tagger
+        if tagger and not tagger.resolved:
+            self._held += len(data)
+            data = tagger.feed(bytes(data))
+            if not tagger.resolved:
+                return
+            if self.state:
+                # 先记录新旧文件头的长度差再写入，中断后才能算出正确的续传位置
+                tagger.save_to(self.state)
+                save_state(self.filepath, self.state)
+            if self.preallocate:
+                self._allocate()
+            # 新的文件头和暂存的数据一起写入
+            self._file.write(data)
+            self._advance(self._held)
+            self._held = 0
+            return
+
+        if not self._buffer and len(data) >= self.buffer_size:
+            # 整块数据直接写入，不经过缓冲区
+            self._file.write(data)
+            self._advance(len(data))
+            return
+        self._buffer += data
+        if len(self._buffer) >= self.buffer_size:
+            self._flush_buffer()
+
+    def _flush_buffer(self):
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._advance(len(self._buffer))
+            self._buffer.clear()
+
+    def _advance(self, size: int):
+        """记录已写入的字节数，预分配时定期保存位置"""
+        self.written += size
+        self._unsaved += size
+        if self.track_position and self._unsaved >= STATE_SAVE_INTERVAL:
+            self._file.flush()
+            self._save_position()
+
+    def _save_position(self):
+        self.state["written"] = self.written
+        save_state(self.filepath, self.state)
+        self._unsaved = 0
+
+    def close(self):
+        """写入剩余数据并关闭文件（连接中断时也要调用，保留已下载的部分）"""
+        try:
+            self._flush_buffer()
+            # 文件比文件头还短，原样写入
+            if self.tagger and not self.tagger.resolved:
+                self._file.write(self.tagger.flush())
+                self._advance(self._held)
+                self._held = 0
+            self._file.flush()
+            if self.track_position:
+                self._save_position()
+        finally:
+            self._file.close()
+
+    def __enter__(self) -> "PartWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def resume_offset(filepath: str, state: Dict[str, Any]) -> int:
+    """续传位置（下载内容中的字节数）"""
+    if "written" in state:
+        return state["written"]
+    return os.path.getsize(part_path(filepath)) - state.get("delta", 0)
@@ -0,0 +1,170 @@
+import sys
+import threading
+import time
+from typing import List, Optional
+
+# 进度显示：下载循环只累加字节数，由后台线程按固定频率采样并统一绘制
+# 终端中每个下载一行进度条，最后一行为总速度和预计剩余时间
+
+# 刷新间隔（秒）
+REFRESH_INTERVAL = 0.2
+# 非终端输出（重定向到文件等）时只定期打印一行汇总
+PLAIN_INTERVAL = 5.0
+# 最多同时显示的进度条数量
+MAX_BARS = 8
+# 速度平滑系数（指数加权移动平均）
+SPEED_SMOOTHING = 0.3
+
+BAR_LENGTH = 24
+COLOR = "\033[94m"
+END = "\033[0m"
+
+# 控制台输出锁，日志和进度条共用，避免输出交错
+print_lock = threading.RLock()
+
+class Task:
+    """单个下载的进度，advance 可在多个线程中调用"""
+
+    def __init__(self, name: str, total: int = 0):
+        self.name = name
+        self.total = total
+        self.downloaded = 0
+        # 本次实际接收的字节数（不含续传前已有的部分）
+        self.transferred = 0
+        self._lock = threading.Lock()
+        # 以下由绘制线程维护
+        self.speed = 0.0
+        self._last_bytes = 0
+
+    def advance(self, size: int):
+        """累加已下载字节数"""
+        with self._lock:
+            self.downloaded += size
+            self.transferred += size
+
+    def update(self, downloaded: Optional[int] = None, total: Optional[int] = None):
+        """设置已下载字节数或总大小（续传、重新开始时使用）"""
+        with self._lock:
+            if downloaded is not None:
+                self.downloaded = downloaded
+                self._last_bytes = min(self._last_bytes, downloaded)
+            if total is not None:
+                self.total = total
+
+_tasks: List[Task] = []
+_tasks_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+_drawn_lines = 0
+_total_speed = 0.0
+
+def start(name: str, total: int = 0) -> Task:
+    """开始显示一个下载的进度"""
+    global _thread
+    task = Task(name, total)
+    with _tasks_lock:
+        _tasks.append(task)
+        if _thread is None:
+            _thread = threading.Thread(target=_render_loop, name="progress", daemon=True)
+            _thread.start()
+    return task
+
+def finish(task: Task):
+    """停止显示下载进度"""
+    with _tasks_lock:
+        if task in _tasks:
+            _tasks.remove(task)
+
+def clear():
+    """擦除已绘制的进度条（调用方需持有 print_lock），下次刷新时重新绘制"""
+    global _drawn_lines
+    if _drawn_lines:
+        sys.stdout.write(f"\033[{_drawn_lines}F\033[J")
+        sys.stdout.flush()
+        _drawn_lines = 0
+
+def format_size(size: float) -> str:
+    """字节数转为 MB 文本"""
+    return f"{size / 1024 / 1024:.1f}MB"
+
+def format_eta(seconds: float) -> str:
+    """剩余秒数转为 时:分:秒 文本"""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+def _sample(tasks: List[Task], elapsed: float):
+    """采样各下载的字节数，更新速度"""
+    global _total_speed
+    total_delta = 0
+    for task in tasks:
+        with task._lock:
+            downloaded = task.downloaded
+        delta = max(0, downloaded - task._last_bytes)
+        task._last_bytes = downloaded
+        total_delta += delta
+        task.speed += SPEED_SMOOTHING * (delta / elapsed - task.speed)
+    _total_speed += SPEED_SMOOTHING * (total_delta / elapsed - _total_speed)
+
+def _bar_line(task: Task) -> str:
+    """单个下载的进度条"""
+    name = task.name if len(task.name) <= 28 else task.name[:27] + "…"
+    if task.total > 0:
+        ratio = min(1.0, task.downloaded / task.total)
+        filled = int(BAR_LENGTH * ratio)
+        bar = '█' * filled + '▒' * (BAR_LENGTH - filled)
+        return (f"{name:28} [{bar}] {ratio * 100:5.1f}% "
+                f"({format_size(task.downloaded)}/{format_size(task.total)}) @ {task.speed / 1024:.1f}KB/s")
+    return f"{name:28} {format_size(task.downloaded)} @ {task.speed / 1024:.1f}KB/s"
+
+def _summary_line(tasks: List[Task]) -> str:
+    """总速度和预计剩余时间"""
+    remaining = sum(max(0, task.total - task.downloaded) for task in tasks if task.total > 0)
+    eta = format_eta(remaining / _total_speed) if _total_speed > 1 and remaining else "--:--"
+    return f"[下载] {len(tasks)} 个进行中 @ {_total_speed / 1024:.1f}KB/s, 剩余 {format_size(remaining)}, 预计 {eta}"
+
+def _draw(tasks: List[Task]):
+    """在终端中重绘进度条（调用方需持有 print_lock）"""
+    global _drawn_lines
+    lines = [_bar_line(task) for task in tasks[:MAX_BARS]]
+    if len(tasks) > MAX_BARS:
+        lines.append(f"... 另外 {len(tasks) - MAX_BARS} 个下载")
+    lines.append(_summary_line(tasks))
+
+    output = []
+    if _drawn_lines:
+        output.append(f"\033[{_drawn_lines}F\033[J")
+    output.extend(f"{COLOR}{line}{END}\n" for line in lines)
+    sys.stdout.write("".join(output))
+    sys.stdout.flush()
+    _drawn_lines = len(lines)
+
+def _render_loop():
+    """绘制线程：没有进行中的下载时退出"""
+    global _thread, _total_speed
+    is_tty = sys.stdout.isatty()
+    interval = REFRESH_INTERVAL if is_tty else PLAIN_INTERVAL
+    last = time.monotonic()
+    while True:
+        time.sleep(interval)
+        now = time.monotonic()
+        with _tasks_lock:
+            tasks = list(_tasks)
+            if not tasks:
+                # 之后开始的下载会启动新的绘制线程
+                _thread = None
+                _total_speed = 0.0
+        if not tasks:
+            with print_lock:
+                clear()
+            return
+
+        _sample(tasks, max(now - last, 1e-3))
+        last = now
+        with print_lock:
+            if is_tty:
+                _draw(tasks)
+            else:
+                print(_summary_line(tasks))
@@ -0,0 +1,109 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# 按主机限制接口请求速率（令牌桶）：平均每秒最多 rate 次，空闲后最多连续发出 burst 次。
+# 后端返回限流响应（429）时该主机的速率减半，之后每次成功的请求逐步恢复到设置的速率，
+# 从而以后端能承受的最高速率运行，不需要反复调整并发数。
+
+# 默认速率和令牌桶容量（main 的默认设置也使用这两个值）
+DEFAULT_RATE = 10
+DEFAULT_BURST = 20
+
+LIMIT_CONFIG = {
+    "rate": float(DEFAULT_RATE),  # 每秒请求数，0 表示不限制
+    "burst": DEFAULT_BURST        # 令牌桶容量
+}
+
+# 限流时速率乘以 BACKOFF_FACTOR，但不低于 MIN_RATE（次/秒）
+BACKOFF_FACTOR = 0.5
+MIN_RATE = 0.2
+# 每次成功的请求恢复设置速率的 RECOVERY_RATIO
+RECOVERY_RATIO = 0.05
+# 后端要求等待（Retry-After）的最长时间（秒）
+MAX_RETRY_AFTER = 60.0
+
+THROTTLED_STATUS = 429
+
+class Bucket:
+    """单个主机的令牌桶"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self, burst: int) -> float:
+        """取一个令牌，返回需要等待的秒数（令牌不足时预支，等待到令牌补足）"""
+        now = time.monotonic()
+        self.tokens = min(float(burst), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+_buckets: Dict[str, Bucket] = {}
+_lock = threading.Lock()
+
+def configure(rate: Optional[float] = None, burst: Optional[int] = None):
+    """修改速率限制（已降低的速率重新从设置值开始）"""
+    with _lock:
+        if rate is not None:
+            LIMIT_CONFIG["rate"] = max(0.0, float(rate))
+        if burst is not None:
+            LIMIT_CONFIG["burst"] = max(1, int(burst))
+        _buckets.clear()
+
+def _reserve(host: str) -> float:
+    rate = LIMIT_CONFIG["rate"]
+    if rate <= 0:
+        return 0.0
+    with _lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            bucket = _buckets[host] = Bucket(rate, LIMIT_CONFIG["burst"])
+        return bucket.reserve(LIMIT_CONFIG["burst"])
+
+def acquire(host: str):
+    """发出请求前调用，超过速率时等待"""
+    wait = _reserve(host)
+    if wait > 0:
+        time.sleep(wait)
+
+async def acquire_async(host: str):
+    """acquire 的异步版本"""
+    import asyncio
+
+    wait = _reserve(host)
+    if wait > 0:
+        await asyncio.sleep(wait)
+
+def _retry_after(value: Any) -> float:
+    """解析 Retry-After（只支持秒数）"""
+    try:
+        return min(max(float(value), 0.0), MAX_RETRY_AFTER)
+    except (TypeError, ValueError):
+        return 0.0
+
+def observe(host: str, status: Any, retry_after: Any = None) -> Optional[float]:
+    """记录响应状态（HTTP 状态码或接口返回的 code），限流时降低该主机的速率并返回新的速率"""
+    if status != THROTTLED_STATUS or LIMIT_CONFIG["rate"] <= 0:
+        return None
+    with _lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            return None
+        bucket.rate = max(MIN_RATE, bucket.rate * BACKOFF_FACTOR)
+        bucket.tokens = min(bucket.tokens, 0.0)
+        delay = _retry_after(retry_after)
+        if delay:
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + delay)
+        return bucket.rate
+
+def record_success(host: str):
+    """请求成功，逐步恢复到设置的速率"""
+    with _lock:
+        bucket = _buckets.get(host)
+        if bucket is not None and bucket.rate < LIMIT_CONFIG["rate"]:
+            bucket.rate = min(LIMIT_CONFIG["rate"], bucket.rate + LIMIT_CONFIG["rate"] * RECOVERY_RATIO)
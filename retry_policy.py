@@ -0,0 +1,187 @@
+import metrics
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Union
+from urllib.parse import urlsplit
+
+# 统一的重试策略：
+# - 区分临时错误（超时、连接断开、5xx、429）和永久错误（其他4xx、接口返回“不可用”），永久错误不重试
+# - 重试间隔按指数增长并加入随机抖动，避免大量请求同时重试
+# - 每个主机有重试预算，重试次数只能占正常请求的一小部分
+# - 每个主机有熔断器，连续失败后暂停请求一段时间，之后只放行一个探测请求
+
+# 第一次重试的最大等待时间（秒），之后每次翻倍，不超过 MAX_DELAY
+BASE_DELAY = 0.5
+MAX_DELAY = 30.0
+
+# 视为临时错误的状态码（HTTP 状态码或接口返回的 code），以及除 NOT_RETRYABLE_5XX 外的全部 5xx
+TRANSIENT_STATUSES = {408, 425, 429}
+NOT_RETRYABLE_5XX = {501, 505}
+
+# 重试预算：初始 BUDGET_RESERVE 次，每次成功的请求存入 BUDGET_RATIO 次（最多存到 BUDGET_RESERVE 的10倍）
+BUDGET_RATIO = 0.2
+BUDGET_RESERVE = 10.0
+
+# 熔断：连续失败 FAILURE_THRESHOLD 次后暂停 OPEN_SECONDS 秒，探测仍失败时暂停时间翻倍
+FAILURE_THRESHOLD = 5
+OPEN_SECONDS = 30.0
+MAX_OPEN_SECONDS = 300.0
+
+class TransientError(Exception):
+    """可以重试的错误（如接口返回 5xx 或 429）"""
+
+class PermanentError(Exception):
+    """重试也不会成功的错误（如 404、403）"""
+
+class Probe:
+    """熔断结束后放行的探测请求（allow 返回该对象，真值为True）"""
+
+class HostState:
+    """单个主机的重试预算和熔断状态"""
+
+    def __init__(self):
+        self.budget = BUDGET_RESERVE
+        self.failures = 0
+        self.open_until = 0.0
+        self.open_seconds = OPEN_SECONDS
+        # 正在进行的探测请求，结果记录之前不再放行其他请求
+        self.probing: Optional[Probe] = None
+
+_hosts: Dict[str, HostState] = {}
+_lock = threading.Lock()
+
+def host_of(url: str) -> str:
+    """URL 对应的主机名"""
+    return urlsplit(url).hostname or ""
+
+def _state(host: str) -> HostState:
+    """调用方需持有锁"""
+    state = _hosts.get(host)
+    if state is None:
+        state = _hosts[host] = HostState()
+    return state
+
+def is_transient_status(status: Any) -> bool:
+    """状态码是否为临时错误"""
+    if not isinstance(status, int):
+        return False
+    return status in TRANSIENT_STATUSES or (status >= 500 and status not in NOT_RETRYABLE_5XX)
+
+def is_permanent_status(status: Any) -> bool:
+    """HTTP 状态码是否为重试也不会成功的错误"""
+    return isinstance(status, int) and status >= 400 and not is_transient_status(status)
+
+def raise_for_status(status: int):
+    """HTTP 状态码为错误时抛出 TransientError 或 PermanentError"""
+    if status < 400:
+        return
+    if is_transient_status(status):
+        raise TransientError(f"HTTP {status}")
+    raise PermanentError(f"HTTP {status}")
+
+def raise_for_code(code: Any):
+    """接口返回的 code 为临时错误时抛出 TransientError（其他错误由调用方按“不可用”处理）"""
+    if is_transient_status(code):
+        raise TransientError(f"接口返回 {code}")
+
+def backoff(attempt: int) -> float:
+    """第 attempt 次失败（从0开始）后的等待时间：指数增长的上限内随机取值"""
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * (2 ** attempt)))
+
+def allow(host: str) -> Union[bool, Probe]:
+    """熔断器是否放行请求（熔断结束后只放行一个探测请求，返回 Probe）
+
+    请求结束时需要调用 release_probe，探测请求没有记录结果时熔断器才能重新放行。
+    """
+    with _lock:
+        state = _state(host)
+        if state.failures < FAILURE_THRESHOLD:
+            return True
+        if time.monotonic() < state.open_until or state.probing:
+            return False
+        state.probing = Probe()
+        return state.probing
+
+def record_success(host: str):
+    """请求成功：关闭熔断器，存入重试预算"""
+    with _lock:
+        state = _state(host)
+        state.failures = 0
+        state.probing = None
+        state.open_seconds = OPEN_SECONDS
+        state.budget = min(state.budget + BUDGET_RATIO, BUDGET_RESERVE * 10)
+
+def record_failure(host: str):
+    """请求出现临时错误：累计连续失败次数，达到阈值或探测失败时熔断"""
+    with _lock:
+        _fail(_state(host))
+
+def _fail(state: HostState):
+    """调用方需持有锁"""
+    state.failures += 1
+    if state.probing:
+        state.probing = None
+        state.open_seconds = min(state.open_seconds * 2, MAX_OPEN_SECONDS)
+        state.open_until = time.monotonic() + state.open_seconds
+    elif state.failures == FAILURE_THRESHOLD:
+        state.open_until = time.monotonic() + state.open_seconds
+
+def release_probe(host: str, permit: Union[bool, Probe], failed: bool = True):
+    """请求结束（permit 为 allow 的返回值）：探测请求没有记录成功或失败就结束时按探测失败处理
+
+    未知错误、放弃下载等出口不会记录结果，不释放的话熔断器会一直拒绝该主机的请求。
+    failed 为False时不计入失败，只交还探测名额（用于没有发出请求、交给其他请求探测的情况）。
+    """
+    if not isinstance(permit, Probe):
+        return
+    with _lock:
+        state = _state(host)
+        if state.probing is permit:
+            if failed:
+                _fail(state)
+            else:
+                state.probing = None
+
+def _take_retry(host: str, attempt: int, max_retries: int, progressed: bool) -> bool:
+    """是否还能重试（次数未用完、预算充足且未熔断），可以时扣除一次预算"""
+    if attempt >= max_retries - 1:
+        return False
+    if progressed:
+        return True
+    with _lock:
+        state = _state(host)
+        if state.failures >= FAILURE_THRESHOLD or state.budget < 1:
+            return False
+        state.budget -= 1
+        return True
+
+def _record_attempt(host: str, progressed: bool):
+    # 已收到部分数据说明主机正常（只是连接中断），不计入连续失败
+    if progressed:
+        record_success(host)
+    else:
+        record_failure(host)
+
+def retry_after_failure(host: str, attempt: int, max_retries: int, progressed: bool = False) -> bool:
+    """记录一次临时错误；还可以重试时按退避时间等待后返回True
+
+    progressed 为True表示失败前已收到部分下载内容，续传不计入熔断和重试预算
+    """
+    _record_attempt(host, progressed)
+    if not _take_retry(host, attempt, max_retries, progressed):
+        return False
+    metrics.count("retries_total", host=host)
+    time.sleep(backoff(attempt))
+    return True
+
+async def retry_after_failure_async(host: str, attempt: int, max_retries: int, progressed: bool = False) -> bool:
+    """retry_after_failure 的异步版本"""
+    import asyncio
+
+    _record_attempt(host, progressed)
+    if not _take_retry(host, attempt, max_retries, progressed):
+        return False
+    metrics.count("retries_total", host=host)
+    await asyncio.sleep(backoff(attempt))
+    return True
@@ -0,0 +1,96 @@
+import contextlib
+import contextvars
+import threading
+from typing import Dict, Iterator, List
+
+# 接口路由：记录各接口最近的延迟和错误率，按健康程度排序，
+# 每次调用优先使用最健康的接口，失败时由调用方依次切换到下一个
+# （只在超时、连接失败等传输层错误时切换，接口正常返回“不可用”时不切换）
+
+# 各接口支持的操作（接口3不支持搜索）
+OPERATIONS = {
+    1: {"track", "search", "playlist", "album"},
+    2: {"track", "search", "playlist", "album"},
+    3: {"track", "playlist", "album"},
+}
+
+# 延迟和错误率的平滑系数（指数加权移动平均）
+SMOOTHING = 0.2
+# 尚未请求过的接口按该延迟估计（秒）
+DEFAULT_LATENCY = 1.0
+# 设置中选择的接口得分乘以该系数，只有明显变慢或频繁出错时才改用其他接口
+PREFERRED_WEIGHT = 0.5
+
+class Backend:
+    """单个接口的健康状态"""
+
+    def __init__(self):
+        self.latency = DEFAULT_LATENCY
+        self.error_rate = 0.0
+        self.samples = 0
+
+    def score(self) -> float:
+        """得分越低越健康：延迟按成功率放大"""
+        return self.latency / max(0.05, 1.0 - self.error_rate)
+
+_backends: Dict[int, Backend] = {interface: Backend() for interface in OPERATIONS}
+_lock = threading.Lock()
+
+def record(interface: int, ok: bool, latency: float):
+    """记录一次请求的结果（ok 表示接口正常响应，与业务结果无关）"""
+    with _lock:
+        backend = _backends.get(interface)
+        if backend is None:
+            return
+        if backend.samples == 0:
+            backend.latency = latency
+        else:
+            backend.latency += SMOOTHING * (latency - backend.latency)
+        backend.error_rate += SMOOTHING * ((0.0 if ok else 1.0) - backend.error_rate)
+        backend.samples += 1
+
+def ranked(operation: str, preferred: int, auto: bool = True) -> List[int]:
+    """支持该操作的接口，按健康程度排序；auto 为False时只使用设置中选择的接口"""
+    supported = [interface for interface, operations in OPERATIONS.items() if operation in operations]
+    if not auto:
+        return [preferred] if preferred in supported else []
+
+    with _lock:
+        scores = {
+            interface: _backends[interface].score() * (PREFERRED_WEIGHT if interface == preferred else 1.0)
+            for interface in supported
+        }
+    return sorted(supported, key=lambda interface: scores[interface])
+
+def snapshot() -> Dict[int, Dict[str, float]]:
+    """各接口当前的延迟、错误率和请求次数"""
+    with _lock:
+        return {
+            interface: {"latency": backend.latency, "error_rate": backend.error_rate, "samples": backend.samples}
+            for interface, backend in _backends.items()
+        }
+
+class Attempt:
+    """在一个接口上的一次调用（并发发出的各个请求共用同一个对象）"""
+
+    def __init__(self):
+        # 是否有请求因传输层错误失败（超时、连接失败、服务器错误、熔断等）
+        self.transport_error = False
+
+_attempt: contextvars.ContextVar = contextvars.ContextVar("router_attempt", default=None)
+
+@contextlib.contextmanager
+def attempt() -> Iterator[Attempt]:
+    """记录范围内发出的请求是否出现传输层错误，供调用方判断是否切换接口"""
+    current = Attempt()
+    token = _attempt.set(current)
+    try:
+        yield current
+    finally:
+        _attempt.reset(token)
+
+def transport_failed():
+    """请求因传输层错误失败（不在 attempt 范围内时忽略）"""
+    current = _attempt.get()
+    if current is not None:
+        current.transport_error = True
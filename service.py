@@ -0,0 +1,437 @@
+import ipaddress
+import json
+import signal
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import job_queue
+import log_system
+
+# 服务模式：常驻进程通过本地 HTTP 接口接收下载任务。连接池、缓存和下载线程池在进程内一直保留，
+# 提交大量小任务时不需要每次启动进程、加载设置和重新建立连接。
+#
+# 接口（请求和响应都是 JSON）:
+#   POST   /jobs               提交任务，请求体为 {"tracks": [ID, ...]}、{"playlist": ID} 或 {"album": ID}
+#   GET    /jobs               全部任务的状态
+#   GET    /jobs/<id>          任务状态和每首歌曲的状态
+#   GET    /jobs/<id>/events   以 Server-Sent Events 推送进度，任务结束后关闭连接
+#   DELETE /jobs/<id>          取消任务（尚未开始的歌曲不再下载，正在下载的歌曲会下载完）
+#   GET    /health             服务状态
+#
+# POST 请求需带 Content-Type: application/json；带 Origin 请求头（浏览器中的网页发出）的提交和取消请求会被拒绝。
+#
+# 歌曲状态同时写入任务队列（见 job_queue），服务中断后可以用 resume 命令继续。
+
+JOB_KINDS = ("tracks", "playlist", "album")
+
+# 任务状态: 等待 -> 获取歌曲列表 -> 下载中 -> 完成 / 失败（获取歌曲列表失败） / 已取消
+FINAL_STATUSES = ("done", "failed", "cancelled")
+
+# 内存中最多保留的已结束任务数
+MAX_FINISHED_JOBS = 1000
+# 进度推送的检查间隔（秒）
+EVENT_INTERVAL = 0.5
+# 请求体的最大字节数
+MAX_BODY = 1024 * 1024
+
+def log(level: str, message: str, module: str = "SERVE"):
+    """服务模式日志函数"""
+    log_system.log(level, message, module)
+
+class Job:
+    """服务中的一个下载任务"""
+
+    def __init__(self, job_id: int, kind: str, source: Any):
+        self.job_id = job_id
+        self.kind = kind
+        self.source = source
+        self.status = "queued"
+        self.error = ""
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        # 任务队列中的 (文件夹, 任务ID)，获取到歌曲列表后才有
+        self.queue_ref: Optional[Tuple[str, int]] = None
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.cancelled = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        """任务状态（不含每首歌曲）"""
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "source": self.source,
+            "status": self.status,
+            "error": self.error,
+            "created": round(self.created, 3),
+            "finished": round(self.finished, 3) if self.finished else None,
+            "total": self.total,
+            "done": self.done,
+            "failed": self.failed,
+            "pending": self.total - self.done - self.failed - self.skipped
+        }
+
+class JobService:
+    """任务调度：全部任务的歌曲共用一个下载线程池
+
+    resolve(kind, source) 返回歌曲ID列表（失败返回None），
+    process(queue_ref, index, total, music_id) 下载一首歌曲并返回是否成功，
+    on_finish(job) 在任务结束后调用。
+    """
+
+    def __init__(self, folder: str, workers: int,
+                 resolve: Callable[[str, Any], Optional[List[str]]],
+                 process: Callable[[Optional[Tuple[str, int]], int, int, str], bool],
+                 on_finish: Optional[Callable[[Job], None]] = None):
+        self.folder = folder
+        self.workers = workers
+        self.resolve = resolve
+        self.process = process
+        self.on_finish = on_finish
+        self.started = time.time()
+        self.jobs: "OrderedDict[int, Job]" = OrderedDict()
+        self._next_id = 1
+        self._lock = threading.Lock()
+        # 正在下载的歌曲 {歌曲ID: [锁, 引用数]}，不同任务中的同一首歌曲依次处理，避免同时写同一个文件
+        self._tracks: Dict[str, list] = {}
+        # 获取歌曲列表使用单独的线程，不占用下载线程
+        self._resolver = ThreadPoolExecutor(max_workers=4, thread_name_prefix="serve-resolve")
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="serve-track")
+
+    def shutdown(self):
+        """停止接收新歌曲，等待正在下载的歌曲结束"""
+        # 先等待正在获取的歌曲列表提交完，再取消尚未开始的歌曲
+        self._resolver.shutdown(wait=True, cancel_futures=True)
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            unfinished = [job for job in self.jobs.values() if job.status not in FINAL_STATUSES]
+        for job in unfinished:
+            if job.queue_ref:
+                # 保留为未完成状态，之后可以用 resume 命令继续
+                job_queue.release_job(*job.queue_ref, finished=False)
+
+    # ============= 任务 =============
+    def submit(self, kind: str, source: Any) -> Job:
+        with self._lock:
+            job = Job(self._next_id, kind, source)
+            self._next_id += 1
+            self.jobs[job.job_id] = job
+            self._trim()
+        self._resolver.submit(self._start, job)
+        log("INFO", f"收到任务 {job.job_id}: {kind} {source if kind != 'tracks' else len(source)}")
+        return job
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job: Job):
+        with self._lock:
+            if job.status in FINAL_STATUSES:
+                return
+            job.cancelled = True
+            # 还没有开始获取歌曲列表的任务直接结束，其余任务在正在下载的歌曲结束后结束
+            finish_now = job.status == "queued"
+        log("INFO", f"取消任务 {job.job_id}")
+        if finish_now:
+            self._finish(job)
+
+    def snapshots(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [job.snapshot() for job in self.jobs.values()]
+
+    def active_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self.jobs.values() if job.status not in FINAL_STATUSES)
+
+    def tracks(self, job: Job) -> List[Dict[str, str]]:
+        """每首歌曲的状态（见 job_queue.STATES）"""
+        if not job.queue_ref:
+            return []
+        return [{"music_id": music_id, "state": state} for music_id, state in job_queue.job_tracks(*job.queue_ref)]
+
+    def _trim(self):
+        # 调用方需持有锁
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in FINAL_STATUSES]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def _start(self, job: Job):
+        """获取歌曲列表，登记到任务队列后把每首歌曲交给下载线程池"""
+        if job.cancelled:
+            return
+        with self._lock:
+            job.status = "resolving"
+        music_ids = self.resolve(job.kind, job.source)
+        if job.cancelled:
+            self._finish(job)
+            return
+        if music_ids is None:
+            with self._lock:
+                job.status = "failed"
+                job.error = "获取歌曲列表失败"
+                job.finished = time.time()
+            return
+        music_ids = list(dict.fromkeys(music_ids))
+
+        try:
+            queue_id, _ = job_queue.open_job(self.folder, f"服务任务 {job.job_id}", music_ids)
+            job.queue_ref = (self.folder, queue_id)
+        except Exception as e:
+            log("WARNING", f"任务队列不可用，任务 {job.job_id} 中断后无法继续: {e}")
+
+        with self._lock:
+            job.total = len(music_ids)
+            job.status = "running"
+        if not music_ids:
+            self._finish(job)
+            return
+        for index, music_id in enumerate(music_ids, 1):
+            self._executor.submit(self._run_track, job, index, music_id)
+
+    def _run_track(self, job: Job, index: int, music_id: str):
+        if job.cancelled:
+            ok = None
+        else:
+            with self._lock:
+                entry = self._tracks.setdefault(music_id, [threading.Lock(), 0])
+                entry[1] += 1
+            try:
+                with entry[0]:
+                    ok = self.process(job.queue_ref, index, job.total, music_id)
+            finally:
+                with self._lock:
+                    entry[1] -= 1
+                    if entry[1] == 0:
+                        del self._tracks[music_id]
+            if job.queue_ref:
+                try:
+                    job_queue.set_state(*job.queue_ref, music_id, "done" if ok else "failed")
+                except Exception as e:
+                    log("WARNING", f"更新任务状态失败: {e}")
+
+        with self._lock:
+            if ok is None:
+                job.skipped += 1
+            elif ok:
+                job.done += 1
+            else:
+                job.failed += 1
+            complete = job.done + job.failed + job.skipped == job.total
+        if complete:
+            self._finish(job)
+
+    def _finish(self, job: Job):
+        with self._lock:
+            if job.status in FINAL_STATUSES:
+                return
+            job.status = "cancelled" if job.cancelled else "done"
+            job.finished = time.time()
+        if job.queue_ref:
+            try:
+                job_queue.release_job(*job.queue_ref, finished=not job.cancelled)
+                if job.cancelled:
+                    job_queue.cancel_job(*job.queue_ref)
+            except Exception as e:
+                log("WARNING", f"更新任务状态失败: {e}")
+        log("SUCCESS" if job.status == "done" else "INFO",
+            f"任务 {job.job_id} {'完成' if job.status == 'done' else '已取消'}: 成功 {job.done}/{job.total} 首")
+        if self.on_finish:
+            self.on_finish(job)
+
+def parse_job(body: Any) -> Tuple[str, Any]:
+    """解析提交的任务，返回 (类型, 来源)，格式错误时抛出 ValueError"""
+    if not isinstance(body, dict):
+        raise ValueError("请求体必须是 JSON 对象")
+    kinds = [kind for kind in JOB_KINDS if kind in body]
+    if len(kinds) != 1:
+        raise ValueError(f"需要且只能有 {', '.join(JOB_KINDS)} 中的一项")
+    kind = kinds[0]
+    source = body[kind]
+    if kind == "tracks":
+        if isinstance(source, (str, int)):
+            source = [source]
+        if not isinstance(source, list) or not source or not all(isinstance(item, (str, int)) for item in source):
+            raise ValueError("tracks 必须是非空的歌曲ID列表")
+        return kind, [str(item).strip() for item in source]
+    if not isinstance(source, (str, int)) or not str(source).strip():
+        raise ValueError(f"{kind} 必须是ID或链接")
+    return kind, str(source).strip()
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "ServiceServer"
+
+    def log_message(self, format: str, *args: Any):
+        log("DEBUG", f"{self.address_string()} {format % args}")
+
+    def send_json(self, status: int, obj: Any):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status: int, message: str):
+        self.send_json(status, {"error": message})
+
+    def reject(self, status: int, message: str):
+        """不读取请求体直接拒绝（关闭连接，未读取的请求体不会被当作下一个请求）"""
+        self.close_connection = True
+        self.send_error_json(status, message)
+
+    def from_browser(self) -> bool:
+        """请求是否来自浏览器中的网页：本地客户端不会发送 Origin，
+        拒绝这类请求，避免任意网页通过跨站请求向本地服务提交或取消任务"""
+        if self.headers.get("Origin") is None:
+            return False
+        self.reject(403, "不接受浏览器跨站请求")
+        return True
+
+    def route_job(self) -> Tuple[Optional[Job], str]:
+        """解析 /jobs/<id>[/<操作>]，任务不存在时返回 (None, "")"""
+        parts = self.path.split("?", 1)[0].strip("/").split("/")
+        if len(parts) not in (2, 3) or parts[0] != "jobs" or not parts[1].isdigit():
+            return None, ""
+        job = self.server.service.get(int(parts[1]))
+        return job, parts[2] if len(parts) == 3 else ""
+
+    def do_GET(self):
+        service = self.server.service
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == "/health":
+            self.send_json(200, {"status": "ok", "uptime": round(time.time() - service.started, 1),
+                                 "workers": service.workers, "active_jobs": service.active_count()})
+            return
+        if path == "/jobs":
+            self.send_json(200, {"jobs": service.snapshots()})
+            return
+
+        job, action = self.route_job()
+        if job is None:
+            self.send_error_json(404, "任务不存在")
+        elif action == "":
+            self.send_json(200, {**job.snapshot(), "tracks": service.tracks(job)})
+        elif action == "events":
+            self.stream_events(job)
+        else:
+            self.send_error_json(404, "未知的接口")
+
+    def do_POST(self):
+        if self.path.split("?", 1)[0].rstrip("/") != "/jobs":
+            self.send_error_json(404, "未知的接口")
+            return
+        if self.from_browser():
+            return
+        content_type = (self.headers.get("Content-Type") or "").split(";", 1)[0].strip().lower()
+        if content_type != "application/json":
+            self.reject(415, "Content-Type 必须是 application/json")
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.reject(400, "Content-Length 无效")
+            return
+        if length > MAX_BODY:
+            self.reject(413, "请求体过大")
+            return
+        try:
+            kind, source = parse_job(json.loads(self.rfile.read(length) or b"null"))
+        except json.JSONDecodeError as e:
+            self.send_error_json(400, f"JSON解析失败: {e}")
+            return
+        except ValueError as e:
+            self.send_error_json(400, str(e))
+            return
+        job = self.server.service.submit(kind, source)
+        self.send_json(202, {**job.snapshot(), "url": f"/jobs/{job.job_id}"})
+
+    def do_DELETE(self):
+        if self.from_browser():
+            return
+        job, action = self.route_job()
+        if job is None or action:
+            self.send_error_json(404, "任务不存在")
+            return
+        self.server.service.cancel(job)
+        self.send_json(200, job.snapshot())
+
+    def stream_events(self, job: Job):
+        """Server-Sent Events：状态变化时推送 progress 事件，任务结束时推送 end 事件后关闭连接"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        last = None
+        try:
+            while True:
+                snapshot = job.snapshot()
+                final = snapshot["status"] in FINAL_STATUSES
+                if snapshot != last or final:
+                    event = "end" if final else "progress"
+                    data = json.dumps(snapshot, ensure_ascii=False)
+                    self.wfile.write(f"event: {event}\ndata: {data}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    last = snapshot
+                if final:
+                    return
+                time.sleep(EVENT_INTERVAL)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+class ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], service: JobService):
+        super().__init__(address, ServiceHandler)
+        self.service = service
+
+def is_loopback(host: str) -> bool:
+    """是否只监听本机地址"""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def _interrupt(signum: int, frame: Any):
+    raise KeyboardInterrupt
+
+def serve(service: JobService, host: str, port: int) -> bool:
+    """运行 HTTP 服务直到被中断（Ctrl+C），无法监听端口时返回False"""
+    if not is_loopback(host):
+        log("WARNING", f"服务监听 {host}，接口没有身份验证，其他机器也可以提交任务")
+    try:
+        server = ServiceServer((host, port), service)
+    except OSError as e:
+        log("ERROR", f"无法监听 {host}:{port}: {e}")
+        service.shutdown()
+        return False
+    # 收到 SIGTERM（如 systemd、docker stop）时与 Ctrl+C 一样正常停止
+    previous = None
+    if threading.current_thread() is threading.main_thread():
+        previous = signal.signal(signal.SIGTERM, _interrupt)
+    url = f"http://{host}:{server.server_address[1]}"
+    log("SUCCESS", f"服务已启动: {url} (下载线程: {service.workers})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log("INFO", "正在停止服务，等待正在下载的歌曲结束...")
+    finally:
+        if previous is not None:
+            signal.signal(signal.SIGTERM, previous)
+        server.server_close()
+        service.shutdown()
+    return True
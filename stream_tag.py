@@ -0,0 +1,205 @@
+import io
+from typing import Dict, Any, Optional
+
+from mutagen.id3 import ID3, ID3NoHeaderError, TIT2, TPE1, TALB, APIC
+from mutagen.flac import Picture, VCFLACDict
+
+# 写入标签时预留的填充，之后修改标签不必重写整个文件
+PADDING = 16 * 1024
+
+# FLAC 元数据块类型
+FLAC_PADDING = 1
+FLAC_VORBIS_COMMENT = 4
+FLAC_PICTURE = 6
+
+def cover_mime(data: bytes) -> str:
+    """根据文件头判断封面图片格式"""
+    if data.startswith(b"\xff\xd8"):
+        return 'image/jpeg'
+    return 'image/png'
+
+def _id3_length(head: bytes, pos: int = 0) -> Optional[int]:
+    """从 pos 开始的 ID3v2 标签长度，没有标签返回0，数据不足返回None"""
+    if len(head) < pos + 3:
+        return None
+    if head[pos:pos + 3] != b"ID3":
+        return 0
+    if len(head) < pos + 10:
+        return None
+    size = 0
+    for byte in head[pos + 6:pos + 10]:
+        size = (size << 7) | (byte & 0x7F)
+    # 标志位 0x10 表示带有10字节的尾部
+    return size + (20 if head[pos + 5] & 0x10 else 10)
+
+def _flac_blocks(data: bytes, pos: int):
+    """遍历 FLAC 元数据块，依次返回 (类型, 起始位置, 块内容长度, 是否最后一块)"""
+    while pos + 4 <= len(data):
+        block_type = data[pos] & 0x7F
+        is_last = bool(data[pos] & 0x80)
+        length = int.from_bytes(data[pos + 1:pos + 4], "big")
+        yield block_type, pos + 4, length, is_last
+        pos += 4 + length
+        if is_last:
+            return
+
+class StreamTagger:
+    """边下载边写标签：先写入新的文件头（标签和填充），之后的音频数据直接追加
+
+    下载到的原始文件头（MP3 的 ID3v2 标签、FLAC 的元数据块）被替换为新的文件头，
+    原有的其他标签和元数据块会保留。
+    cover 可以是封面数据，也可以是封面下载的 Future：生成文件头时才等待封面下载完成，
+    音频不必等封面下载完再开始下载（生成文件头可能阻塞，需在线程中调用 feed）。
+    """
+
+    def __init__(self, filetype: str, music_info: Dict[str, Any], cover: Any):
+        self.filetype = filetype.lower()
+        self.music_info = music_info
+        self._cover = cover
+        # 是否已写入新的文件头，未写入时需要下载完成后再写标签
+        self.applied = False
+        # 原始文件头是否已处理完，之后的数据原样写入
+        self.resolved = False
+        # 新文件头与原始文件头的长度差，即 .part 中的位置减去下载内容中的位置
+        self.delta = 0
+        self._buffer = b""
+
+    @property
+    def cover(self) -> Optional[bytes]:
+        """封面数据（传入 Future 时等待下载完成，下载失败为None）"""
+        if hasattr(self._cover, "result"):
+            try:
+                self._cover = self._cover.result()
+            except Exception:
+                self._cover = None
+        return self._cover
+
+    def reset(self):
+        """重新开始下载时清空状态"""
+        self.applied = False
+        self.resolved = False
+        self.delta = 0
+        self._buffer = b""
+
+    def resume(self, state: Dict[str, Any]):
+        """从下载状态恢复（续传时文件头已经写入 .part）"""
+        self.resolved = True
+        self.applied = bool(state.get("tagged"))
+        self.delta = state.get("delta", 0)
+
+    def feed(self, chunk: bytes) -> bytes:
+        """输入下载到的数据，返回应写入 .part 的数据（原始文件头接收完整前返回空）"""
+        if self.resolved:
+            return chunk
+
+        self._buffer += chunk
+        length = self.header_length(self._buffer)
+        if length is None or len(self._buffer) < length:
+            return b""
+
+        header = None
+        try:
+            header = self.render(self._buffer[:length])
+        except Exception:
+            pass
+
+        data, self._buffer = self._buffer, b""
+        self.resolved = True
+        if header is None:
+            # 格式无法识别，原样写入，下载完成后再写标签
+            return data
+        self.applied = True
+        self.delta = len(header) - length
+        return header + data[length:]
+
+    def flush(self) -> bytes:
+        """下载结束时仍未接收完整的文件头，原样返回已缓存的数据"""
+        data, self._buffer = self._buffer, b""
+        self.resolved = True
+        return data
+
+    def save_to(self, state: Dict[str, Any]):
+        """记录到下载状态，供续传时恢复"""
+        state["tagged"] = self.applied
+        state["delta"] = self.delta
+
+    def header_length(self, head: bytes) -> Optional[int]:
+        """原始文件头的长度，数据不足以判断时返回None"""
+        if self.filetype == "mp3":
+            return _id3_length(head)
+
+        # 部分 FLAC 文件开头带有 ID3 标签
+        pos = _id3_length(head)
+        if pos is None or len(head) < pos + 4:
+            return None
+        if head[pos:pos + 4] != b"fLaC":
+            return 0
+        for _, start, length, is_last in _flac_blocks(head, pos + 4):
+            if is_last:
+                return start + length
+        return None
+
+    def render(self, source_header: bytes) -> Optional[bytes]:
+        """根据原始文件头生成新的文件头，格式不支持时返回None"""
+        if self.filetype == "mp3":
+            return self._render_id3(source_header)
+        if self.filetype == "flac":
+            return self._render_flac(source_header)
+        return None
+
+    def _render_id3(self, source_header: bytes) -> bytes:
+        """生成 ID3v2 标签"""
+        try:
+            tags = ID3(io.BytesIO(source_header)) if source_header else ID3()
+        except ID3NoHeaderError:
+            tags = ID3()
+
+        tags.add(TIT2(encoding=3, text=self.music_info.get('name', '未知歌曲')))
+        tags.add(TPE1(encoding=3, text=self.music_info.get('singer', '未知歌手')))
+        tags.add(TALB(encoding=3, text=self.music_info.get('album', '未知专辑')))
+        if self.cover:
+            tags.add(APIC(encoding=3, mime=cover_mime(self.cover), type=3, desc='Cover', data=self.cover))
+
+        output = io.BytesIO()
+        tags.save(output, padding=lambda info: PADDING)
+        return output.getvalue()
+
+    def _render_flac(self, source_header: bytes) -> Optional[bytes]:
+        """生成 fLaC 标记和元数据块"""
+        pos = _id3_length(source_header) or 0
+        if source_header[pos:pos + 4] != b"fLaC":
+            return None
+
+        # 保留 STREAMINFO 等原有元数据块，替换标签和填充（有新封面时替换原有图片）
+        blocks = []
+        comment = VCFLACDict()
+        for block_type, start, length, _ in _flac_blocks(source_header, pos + 4):
+            body = source_header[start:start + length]
+            if block_type == FLAC_VORBIS_COMMENT:
+                comment = VCFLACDict(body, framing=False)
+            elif block_type == FLAC_PADDING or (block_type == FLAC_PICTURE and self.cover):
+                continue
+            else:
+                blocks.append((block_type, body))
+
+        comment['title'] = [self.music_info.get('name', '未知歌曲')]
+        comment['artist'] = [self.music_info.get('singer', '未知歌手')]
+        comment['album'] = [self.music_info.get('album', '未知专辑')]
+        blocks.append((FLAC_VORBIS_COMMENT, comment.write(framing=False)))
+
+        if self.cover:
+            picture = Picture()
+            picture.type = 3
+            picture.mime = cover_mime(self.cover)
+            picture.data = self.cover
+            blocks.append((FLAC_PICTURE, picture.write()))
+
+        blocks.append((FLAC_PADDING, bytes(PADDING)))
+
+        output = io.BytesIO()
+        output.write(b"fLaC")
+        for i, (block_type, body) in enumerate(blocks):
+            flag = 0x80 if i == len(blocks) - 1 else 0
+            output.write(bytes([flag | block_type]) + len(body).to_bytes(3, "big"))
+            output.write(body)
+        return output.getvalue()
@@ -0,0 +1,233 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import log_system
+
+# 写标签阶段：下载完成后写入标签和封面（mutagen 解析和 audio.save()）。
+# 开启进程池时交给独立的写标签进程，不占用下载线程的 GIL，写标签与其他歌曲的下载同时进行，
+# 处理速度随 CPU 核心数增加；等待写标签的文件数有上限，写标签跟不上时下载线程在提交处等待。
+# 边下载边写标签（stream_tag）成功的歌曲不经过这一阶段。
+
+TAG_CONFIG = {
+    # 写标签进程数，0 表示在下载线程中直接写
+    "workers": 2,
+    # 正在写和等待写标签的文件数上限
+    "queue_size": 8
+}
+
+# 传给写标签进程的歌曲信息字段（封面单独传递）
+INFO_FIELDS = ("name", "singer", "album")
+
+_executor = None
+_slots: Optional[threading.BoundedSemaphore] = None
+_lock = threading.Lock()
+_exit_registered = False
+
+def log(level: str, message: str, module: str = "TAG"):
+    """写标签模块日志函数"""
+    log_system.log(level, message, module)
+
+# ============= 进程池 =============
+def configure(workers: Optional[int] = None, queue_size: Optional[int] = None):
+    """修改进程数和队列上限（已启动的进程池在正在处理的文件完成后关闭）"""
+    global _executor, _slots
+    with _lock:
+        previous = dict(TAG_CONFIG)
+        if workers is not None:
+            TAG_CONFIG["workers"] = max(0, int(workers))
+        if queue_size is not None:
+            TAG_CONFIG["queue_size"] = max(1, int(queue_size))
+        if TAG_CONFIG == previous:
+            return
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = None
+        _slots = None
+
+def _init_worker():
+    """写标签进程初始化：日志收集起来随结果返回，由主进程按自己的日志级别输出"""
+    log_system.configure(level="DEBUG", to_file=False, json_file="")
+    log_system.start_capture()
+
+def _tag_file(filetype: str, filepath: str, cover: Optional[bytes], music_info: Dict[str, Any]) -> Tuple[bool, List[tuple]]:
+    """在写标签进程中执行，返回 (是否成功, 日志)"""
+    try:
+        return write_metadata(filetype, filepath, cover, music_info), log_system.take_captured()
+    except BaseException:
+        log_system.take_captured()
+        raise
+
+def _pool():
+    """当前配置的进程池（未开启或无法创建时返回None）"""
+    global _executor, _slots
+    with _lock:
+        workers = TAG_CONFIG["workers"]
+        if _executor is None and workers > 0:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # 下载线程运行中 fork 不安全，使用 forkserver（不支持时用 spawn）启动写标签进程
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            try:
+                _executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context(method),
+                    initializer=_init_worker
+                )
+            except (OSError, ValueError, NotImplementedError) as e:
+                log("WARNING", f"无法启动写标签进程 ({e})，改为在下载线程中写标签")
+                TAG_CONFIG["workers"] = 0
+                return None
+            _slots = threading.BoundedSemaphore(max(TAG_CONFIG["queue_size"], workers))
+            _register_exit()
+        if _executor is None:
+            return None
+        return _executor, _slots
+
+def shutdown():
+    """关闭进程池，等待正在写的标签完成"""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+def _register_exit():
+    # 在解释器清理模块之前关闭进程池，否则退出时进程池的回收回调可能报错
+    global _exit_registered
+    if not _exit_registered:
+        import atexit
+
+        atexit.register(shutdown)
+        _exit_registered = True
+
+def _disable(executor: Any):
+    """写标签进程异常退出后进程池不可再用，之后改为在下载线程中写标签"""
+    global _executor
+    with _lock:
+        if _executor is executor:
+            log("WARNING", "写标签进程异常退出，改为在下载线程中写标签")
+            TAG_CONFIG["workers"] = 0
+            _executor = None
+
+def tag(filetype: str, filepath: str, cover: Optional[bytes], music_info: Dict[str, Any]) -> bool:
+    """写入标签：开启进程池时交给写标签进程并等待完成，否则在当前线程写"""
+    pool = _pool()
+    if pool is None:
+        return write_metadata(filetype, filepath, cover, music_info)
+    executor, slots = pool
+
+    info = {key: music_info[key] for key in INFO_FIELDS if key in music_info}
+    # 队列已满时等待，避免已下载的文件在内存中（封面）和磁盘上无限堆积
+    slots.acquire()
+    try:
+        future = executor.submit(_tag_file, filetype, filepath, cover, info)
+    except Exception as e:
+        slots.release()
+        log("WARNING", f"提交写标签任务失败 ({e})，在下载线程中写标签")
+        return write_metadata(filetype, filepath, cover, music_info)
+    future.add_done_callback(lambda _: slots.release())
+
+    try:
+        ok, records = future.result()
+    except Exception as e:
+        from concurrent.futures.process import BrokenProcessPool
+
+        if isinstance(e, BrokenProcessPool):
+            _disable(executor)
+            return write_metadata(filetype, filepath, cover, music_info)
+        log("ERROR", f"写标签进程出错: {os.path.basename(filepath)}: {e}")
+        return False
+    log_system.replay(records)
+    return ok
+
+# ============= 写标签 =============
+def write_metadata(filetype: str, filepath: str, cover: Optional[bytes], music_info: Dict[str, Any]) -> bool:
+    """写入音频文件元数据"""
+    import stream_tag
+    from mutagen.mp3 import MP3
+    from mutagen.id3 import ID3, TIT2, TPE1, TALB, APIC
+    from mutagen.flac import FLAC, Picture
+
+    try:
+        if not os.path.exists(filepath):
+            log("ERROR", f"音频文件不存在: {filepath}")
+            return False
+
+        log("INFO", f"写入元数据: {os.path.basename(filepath)}")
+
+        if filetype.lower() == 'mp3':
+            try:
+                audio = MP3(filepath, ID3=ID3)
+
+                if audio.tags is None:
+                    audio.tags = ID3()
+                    log("DEBUG", "创建新的ID3标签")
+
+                # 写入文本标签
+                audio.tags.add(TIT2(encoding=3, text=music_info.get('name', '未知歌曲')))
+                audio.tags.add(TPE1(encoding=3, text=music_info.get('singer', '未知歌手')))
+                audio.tags.add(TALB(encoding=3, text=music_info.get('album', '未知专辑')))
+                log("DEBUG", f"添加文本标签: {music_info.get('name', '未知歌曲')}")
+
+                # 写入封面图片
+                if cover:
+                    try:
+                        audio.tags.add(APIC(
+                            encoding=3,
+                            mime=stream_tag.cover_mime(cover),
+                            type=3,
+                            desc='Cover',
+                            data=cover
+                        ))
+                        log("DEBUG", "添加封面图片")
+                    except Exception as img_error:
+                        log("WARNING", f"添加封面图片失败: {img_error}")
+
+                audio.save()
+                log("SUCCESS", "MP3元数据写入成功")
+
+            except Exception as mp3_error:
+                log("ERROR", f"处理MP3文件失败: {mp3_error}")
+                return False
+
+        elif filetype.lower() == 'flac':
+            try:
+                audio = FLAC(filepath)
+
+                # 写入文本标签
+                audio['title'] = [music_info.get('name', '未知歌曲')]
+                audio['artist'] = [music_info.get('singer', '未知歌手')]
+                audio['album'] = [music_info.get('album', '未知专辑')]
+                log("DEBUG", f"添加文本标签: {music_info.get('name', '未知歌曲')}")
+
+                # 写入封面图片
+                if cover:
+                    try:
+                        picture = Picture()
+                        picture.type = 3
+                        picture.mime = stream_tag.cover_mime(cover)
+                        picture.data = cover
+
+                        audio.clear_pictures()
+                        audio.add_picture(picture)
+                        log("DEBUG", "添加封面图片")
+                    except Exception as img_error:
+                        log("WARNING", f"添加封面图片失败: {img_error}")
+
+                audio.save()
+                log("SUCCESS", "FLAC元数据写入成功")
+
+            except Exception as flac_error:
+                log("ERROR", f"处理FLAC文件失败: {flac_error}")
+                return False
+        else:
+            log("WARNING", f"不支持的文件类型: {filetype}")
+            return False
+
+        return True
+
+    except Exception as e:
+        log("ERROR", f"写入元数据时出错: {e}")
+        return False
@@ -0,0 +1,20 @@
+import pytest
+
+import http_pool
+
+@pytest.mark.parametrize("total_size, segments", [(100, 4), (101, 4), (7, 3), (3, 8), (1, 1), (4 * 1024 * 1024 + 1, 4)])
+def test_split_ranges_covers_file(total_size, segments):
+    """各段首尾相接、覆盖整个文件，段数不超过设置"""
+    ranges = http_pool.split_ranges(total_size, segments)
+    assert 0 < len(ranges) <= segments
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == total_size - 1
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert start == end + 1
+    assert all(start <= end for start, end in ranges)
+
+def test_split_ranges_even():
+    assert http_pool.split_ranges(100, 4) == [(0, 24), (25, 49), (50, 74), (75, 99)]
+
+def test_split_ranges_last_segment_shorter():
+    assert http_pool.split_ranges(10, 3) == [(0, 3), (4, 7), (8, 9)]
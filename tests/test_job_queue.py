@@ -0,0 +1,88 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+import job_queue
+
+@pytest.fixture
+def folder(tmp_path):
+    path = str(tmp_path)
+    yield path
+    with job_queue._lock:
+        job_queue._owned.clear()
+        conn = job_queue._conns.pop(os.path.abspath(path), None)
+    if conn is not None:
+        conn.close()
+
+def set_owner(folder: str, job_id: int, owner: str, heartbeat: float):
+    """模拟其他进程认领了任务"""
+    with job_queue._lock:
+        conn = job_queue._connect(folder)
+        conn.execute("UPDATE jobs SET owner = ?, heartbeat = ? WHERE job_id = ?", (owner, heartbeat, job_id))
+        conn.commit()
+        job_queue._owned.discard((folder, job_id))
+
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+def test_open_job_resumes_same_source(folder):
+    job_id, resumed = job_queue.open_job(folder, "歌单", ["1", "2"], "playlist:1")
+    assert not resumed
+    job_queue.release_job(folder, job_id, finished=False)
+
+    again, resumed = job_queue.open_job(folder, "歌单", ["2", "3"], "playlist:1")
+    assert (again, resumed) == (job_id, True)
+    assert [music_id for _, music_id in job_queue.pending_tracks(folder, job_id)] == ["1", "2", "3"]
+
+def test_live_owner_keeps_job(folder):
+    job_id, _ = job_queue.open_job(folder, "歌单", ["1"], "playlist:1")
+    # 同一台机器上仍在运行的进程
+    set_owner(folder, job_id, f"{socket.gethostname()}:{os.getppid()}", time.time())
+    assert not job_queue.claim_job(folder, job_id)
+    assert job_queue.open_job(folder, "歌单", ["1"], "playlist:1") == (None, False)
+    assert job_queue.unfinished_jobs(folder) == []
+
+def test_dead_owner_on_same_host_is_claimed(folder):
+    """进程已退出时不必等心跳过期"""
+    job_id, _ = job_queue.open_job(folder, "歌单", ["1"], "playlist:1")
+    set_owner(folder, job_id, f"{socket.gethostname()}:{dead_pid()}", time.time())
+    assert [job["job_id"] for job in job_queue.unfinished_jobs(folder)] == [job_id]
+    assert job_queue.claim_job(folder, job_id)
+
+def test_remote_owner_until_heartbeat_stale(folder):
+    """其他机器上的进程只能根据心跳判断"""
+    job_id, _ = job_queue.open_job(folder, "歌单", ["1"], "playlist:1")
+    set_owner(folder, job_id, "other-host:1", time.time())
+    assert not job_queue.claim_job(folder, job_id)
+
+    set_owner(folder, job_id, "other-host:1", time.time() - job_queue.STALE_SECONDS - 1)
+    assert job_queue.claim_job(folder, job_id)
+
+def test_finished_and_cancelled_jobs_not_claimed(folder):
+    finished, _ = job_queue.open_job(folder, "批量", ["1"])
+    job_queue.release_job(folder, finished, finished=True)
+    cancelled, _ = job_queue.open_job(folder, "批量", ["2"])
+    job_queue.release_job(folder, cancelled, finished=False)
+    job_queue.cancel_job(folder, cancelled)
+    assert not job_queue.claim_job(folder, finished)
+    assert not job_queue.claim_job(folder, cancelled)
+    assert job_queue.unfinished_jobs(folder) == []
+
+def test_failed_tracks_retried_until_max_attempts(folder):
+    job_id, _ = job_queue.open_job(folder, "批量", ["1", "2"])
+    job_queue.start_track(folder, job_id, "1")
+    job_queue.set_state(folder, job_id, "1", "done")
+    for _ in range(job_queue.MAX_ATTEMPTS - 1):
+        job_queue.start_track(folder, job_id, "2")
+        job_queue.set_state(folder, job_id, "2", "failed")
+    assert job_queue.pending_tracks(folder, job_id) == [(2, "2")]
+
+    job_queue.start_track(folder, job_id, "2")
+    job_queue.set_state(folder, job_id, "2", "failed")
+    assert job_queue.pending_tracks(folder, job_id) == []
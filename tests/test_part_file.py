@@ -0,0 +1,38 @@
+import os
+
+import part_file
+
+def test_resume_offset_from_part_size(tmp_path):
+    filepath = str(tmp_path / "song.mp3")
+    state = {"size": 100000}
+    with part_file.PartWriter(filepath, state, None, 0, 4096) as writer:
+        writer.write(os.urandom(10000))
+    assert part_file.resume_offset(filepath, state) == 10000
+
+def test_resume_offset_from_written_when_preallocated(tmp_path):
+    """预分配后文件大小不再代表已下载的字节数"""
+    filepath = str(tmp_path / "song.mp3")
+    state = {"size": 100000}
+    with part_file.PartWriter(filepath, state, None, 0, 4096, preallocate=True) as writer:
+        writer.write(os.urandom(10000))
+    assert os.path.getsize(part_file.part_path(filepath)) == 100000
+    assert part_file.resume_offset(filepath, part_file.load_state(filepath)) == 10000
+
+def test_load_state_clears_orphans(tmp_path):
+    filepath = str(tmp_path / "song.mp3")
+    part_file.save_state(filepath, {"size": 10})
+    assert part_file.load_state(filepath) is None
+    assert not os.path.exists(part_file.state_path(filepath))
+
+def test_range_headers_use_strong_validator():
+    state = part_file.new_state({"ETag": 'W/"weak"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}, 100)
+    assert part_file.range_headers(state, 10) == {"Range": "bytes=10-", "If-Range": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    state = part_file.new_state({"ETag": '"strong"'}, 100)
+    assert part_file.range_headers(state, 10, 19) == {"Range": "bytes=10-19", "If-Range": '"strong"'}
+
+def test_accepts_range_checks_start_and_size():
+    state = {"size": 100}
+    assert part_file.accepts_range(206, {"Content-Range": "bytes 10-99/100"}, state, 10)
+    assert not part_file.accepts_range(206, {"Content-Range": "bytes 0-99/100"}, state, 10)
+    assert not part_file.accepts_range(206, {"Content-Range": "bytes 10-99/200"}, state, 10)
+    assert not part_file.accepts_range(200, {}, state, 10)
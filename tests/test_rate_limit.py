@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+import rate_limit
+
+HOST = "api.example.com"
+
+@pytest.fixture(autouse=True)
+def limits():
+    rate_limit.configure(rate=10, burst=20)
+    yield
+    rate_limit.configure(rate=rate_limit.DEFAULT_RATE, burst=rate_limit.DEFAULT_BURST)
+
+def bucket() -> rate_limit.Bucket:
+    return rate_limit._buckets[HOST]
+
+def test_burst_then_wait():
+    """令牌用完之后按速率等待"""
+    waits = [rate_limit._reserve(HOST) for _ in range(21)]
+    assert waits[:20] == [0.0] * 20
+    assert waits[20] == pytest.approx(0.1, abs=0.01)
+
+def test_throttled_halves_rate():
+    rate_limit._reserve(HOST)
+    assert rate_limit.observe(HOST, 429) == 5.0
+    assert rate_limit.observe(HOST, 429) == 2.5
+    assert bucket().tokens <= 0
+
+def test_rate_not_below_minimum():
+    rate_limit._reserve(HOST)
+    for _ in range(20):
+        rate_limit.observe(HOST, 429)
+    assert bucket().rate == rate_limit.MIN_RATE
+
+def test_success_recovers_to_configured_rate():
+    rate_limit._reserve(HOST)
+    rate_limit.observe(HOST, 429)
+    rate_limit.record_success(HOST)
+    assert bucket().rate == pytest.approx(5.0 + 10 * rate_limit.RECOVERY_RATIO)
+    for _ in range(100):
+        rate_limit.record_success(HOST)
+    assert bucket().rate == 10
+
+def test_retry_after_blocks_host():
+    rate_limit._reserve(HOST)
+    rate_limit.observe(HOST, 429, "2")
+    assert bucket().blocked_until > time.monotonic() + 1.5
+    assert rate_limit._reserve(HOST) >= 1.5
+
+def test_other_statuses_ignored():
+    rate_limit._reserve(HOST)
+    assert rate_limit.observe(HOST, 200) is None
+    assert rate_limit.observe(HOST, 503) is None
+    assert rate_limit.observe("unseen.example.com", 429) is None
+    assert bucket().rate == 10
+
+def test_zero_rate_disables_limit():
+    rate_limit.configure(rate=0)
+    assert all(rate_limit._reserve(HOST) == 0.0 for _ in range(100))
+    assert rate_limit.observe(HOST, 429) is None
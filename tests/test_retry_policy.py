@@ -0,0 +1,87 @@
+import pytest
+
+import retry_policy
+
+HOST = "api.example.com"
+
+@pytest.fixture(autouse=True)
+def fresh_hosts(monkeypatch):
+    monkeypatch.setattr(retry_policy, "_hosts", {})
+
+def trip():
+    """连续失败直到熔断"""
+    for _ in range(retry_policy.FAILURE_THRESHOLD):
+        assert retry_policy.allow(HOST)
+        retry_policy.record_failure(HOST)
+
+def half_open():
+    """熔断时间已过"""
+    retry_policy._hosts[HOST].open_until = 0.0
+
+def test_breaker_opens_after_threshold():
+    trip()
+    assert not retry_policy.allow(HOST)
+
+def test_half_open_allows_single_probe():
+    trip()
+    half_open()
+    probe = retry_policy.allow(HOST)
+    assert isinstance(probe, retry_policy.Probe)
+    assert not retry_policy.allow(HOST)
+
+def test_probe_success_closes_breaker():
+    trip()
+    half_open()
+    probe = retry_policy.allow(HOST)
+    retry_policy.record_success(HOST)
+    retry_policy.release_probe(HOST, probe)
+    assert retry_policy.allow(HOST) is True
+
+def test_probe_failure_doubles_open_time():
+    trip()
+    half_open()
+    retry_policy.allow(HOST)
+    retry_policy.record_failure(HOST)
+    state = retry_policy._hosts[HOST]
+    assert state.open_seconds == retry_policy.OPEN_SECONDS * 2
+    assert not retry_policy.allow(HOST)
+
+def test_probe_without_outcome_is_released():
+    """探测请求没有记录结果就结束（如未知错误）时，熔断器不能一直拒绝该主机"""
+    trip()
+    half_open()
+    probe = retry_policy.allow(HOST)
+    retry_policy.release_probe(HOST, probe)
+    state = retry_policy._hosts[HOST]
+    assert state.probing is None
+    # 按探测失败处理：重新熔断，时间过后再次放行探测
+    assert not retry_policy.allow(HOST)
+    half_open()
+    assert isinstance(retry_policy.allow(HOST), retry_policy.Probe)
+
+def test_probe_handed_back_unused():
+    trip()
+    half_open()
+    probe = retry_policy.allow(HOST)
+    retry_policy.release_probe(HOST, probe, failed=False)
+    assert retry_policy._hosts[HOST].open_seconds == retry_policy.OPEN_SECONDS
+    assert isinstance(retry_policy.allow(HOST), retry_policy.Probe)
+
+def test_release_ignores_other_requests():
+    """熔断前放行的普通请求结束时，不影响正在进行的探测"""
+    trip()
+    half_open()
+    probe = retry_policy.allow(HOST)
+    retry_policy.release_probe(HOST, True)
+    assert retry_policy._hosts[HOST].probing is probe
+
+@pytest.mark.parametrize("status, transient", [(429, True), (500, True), (503, True), (501, False), (404, False), (200, False)])
+def test_transient_statuses(status, transient):
+    assert retry_policy.is_transient_status(status) is transient
+
+def test_raise_for_status():
+    retry_policy.raise_for_status(206)
+    with pytest.raises(retry_policy.TransientError):
+        retry_policy.raise_for_status(502)
+    with pytest.raises(retry_policy.PermanentError):
+        retry_policy.raise_for_status(403)
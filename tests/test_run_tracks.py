@@ -0,0 +1,58 @@
+import os
+import threading
+import time
+
+import pytest
+
+import job_queue
+import main
+
+FAILING = {"2", "5"}
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    """替换单首歌曲的下载：FAILING 中的歌曲返回失败，"6" 抛出异常"""
+    active = {"now": 0, "max": 0}
+    lock = threading.Lock()
+
+    def download_track(music_id, settings):
+        with lock:
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+        time.sleep(0.02)
+        with lock:
+            active["now"] -= 1
+        if music_id == "6":
+            raise RuntimeError("下载出错")
+        return music_id not in FAILING
+
+    async def download_track_async(music_id, settings):
+        return download_track(music_id, settings)
+
+    monkeypatch.setattr(main, "download_track", download_track)
+    monkeypatch.setattr(main, "download_track_async", download_track_async)
+    folder = str(tmp_path)
+    yield {**main.DEFAULT_SETTINGS, "folder": folder, "concurrency": 3, "active": active}
+    with job_queue._lock:
+        job_queue._owned.clear()
+        conn = job_queue._conns.pop(os.path.abspath(folder), None)
+    if conn is not None:
+        conn.close()
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_failures_are_counted_per_track(settings, use_async):
+    settings["use_async"] = use_async
+    music_ids = [str(i) for i in range(1, 9)]
+    result = main.run_tracks(music_ids, settings, "批量下载")
+    assert result == {"success": ["1", "3", "4", "7", "8"], "failed": ["2", "5", "6"]}
+
+def test_pool_size_limited_by_concurrency(settings):
+    main.run_tracks([str(i) for i in range(1, 13)], settings, "批量下载")
+    assert 1 < settings["active"]["max"] <= settings["concurrency"]
+
+def test_track_states_recorded_in_job(settings):
+    """每首歌曲的结果写入任务队列，中断后可据此继续"""
+    main.run_tracks(["1", "2", "3"], settings, "歌单下载", "playlist:1")
+    with job_queue._lock:
+        (job_id,) = job_queue._connect(settings["folder"]).execute("SELECT job_id FROM jobs").fetchone()
+    assert job_queue.job_tracks(settings["folder"], job_id) == [("1", "done"), ("2", "failed"), ("3", "done")]
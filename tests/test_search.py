@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+import API_1
+import API_async
+
+@pytest.fixture
+def pages(monkeypatch):
+    """替换接口请求：返回不带总数的搜索结果页，第3页为空；记录请求的页码"""
+    requested = []
+    monkeypatch.setattr(API_1, "_search_pages", {})
+    monkeypatch.setattr(API_1, "_search_prefetch", {})
+
+    def page_data(payload):
+        requested.append(payload["page"])
+        songs = [{"id": payload["page"] * 10 + i} for i in range(2)] if payload["page"] < 3 else []
+        return {"songs": songs}
+
+    monkeypatch.setattr(API_1, "request_data", lambda endpoint, payload, *args, **kwargs: page_data(payload))
+
+    async def api1_data(endpoint, payload, *args, **kwargs):
+        return page_data(payload)
+
+    monkeypatch.setattr(API_async, "_api1_data", api1_data)
+    return requested
+
+def search(page: int, use_async: bool):
+    if use_async:
+        return asyncio.run(API_async.search_music("歌", page, 1))
+    return API_1.search_music("歌", page, 1)
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_next_page_checked_through_request_path(pages, use_async):
+    """接口没有返回总数时请求下一页判断，下一页存入分页缓存"""
+    result = search(1, use_async)
+    assert result[0] is True
+    assert sorted(pages) == [1, 2]
+    assert API_1.cached_search_page("歌", 2, 1) == {"songs": [{"id": 20}, {"id": 21}]}
+
+    # 翻页时使用缓存，只请求再下一页
+    assert search(2, use_async)[0] is False
+    assert sorted(pages) == [1, 2, 3]
@@ -0,0 +1,72 @@
+import os
+from concurrent.futures import Future
+
+import pytest
+
+import part_file
+import stream_tag
+
+def id3_header(body_size: int) -> bytes:
+    """只有填充的 ID3v2.3 标签"""
+    size = bytes((body_size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    return b"ID3\x03\x00\x00" + size + bytes(body_size)
+
+HEADER = id3_header(200)
+SOURCE = HEADER + b"\xff\xfb" + os.urandom(64 * 1024)
+INFO = {"name": "歌曲", "singer": "歌手", "album": "专辑"}
+
+def write_part(filepath: str, state: dict, data: bytes, tagger, offset: int = 0, preallocate: bool = False):
+    """分块写入，模拟下载到一半中断"""
+    with part_file.PartWriter(filepath, state, tagger, offset, 4096, preallocate) as writer:
+        for start in range(0, len(data), 1000):
+            writer.write(data[start:start + 1000])
+
+@pytest.mark.parametrize("preallocate", [False, True])
+def test_resume_offset_with_new_header(tmp_path, preallocate):
+    """.part 中多出新旧文件头的长度差，续传位置仍是下载内容中的字节数"""
+    filepath = str(tmp_path / "song.mp3")
+    state = {"size": len(SOURCE)}
+    tagger = stream_tag.StreamTagger("mp3", INFO, None)
+    write_part(filepath, state, SOURCE[:30000], tagger, preallocate=preallocate)
+
+    assert tagger.applied and state["delta"] == tagger.delta > 0
+    saved = part_file.load_state(filepath)
+    assert part_file.resume_offset(filepath, saved) == 30000
+
+    # 从续传位置写完剩余部分，结果应为新文件头加上原始音频
+    resumed = stream_tag.StreamTagger("mp3", INFO, None)
+    resumed.resume(saved)
+    write_part(filepath, saved, SOURCE[30000:], resumed, offset=30000, preallocate=preallocate)
+    with open(part_file.part_path(filepath), "rb") as f:
+        data = f.read()
+    assert len(data) == len(SOURCE) + saved["delta"]
+    assert data.endswith(SOURCE[len(HEADER):])
+
+def test_header_waits_for_complete_source_header():
+    tagger = stream_tag.StreamTagger("mp3", INFO, None)
+    assert tagger.feed(SOURCE[:100]) == b""
+    assert not tagger.resolved
+    data = tagger.feed(SOURCE[100:1000])
+    assert tagger.resolved and data.endswith(SOURCE[len(HEADER):1000])
+
+def test_short_file_written_unchanged():
+    tagger = stream_tag.StreamTagger("mp3", INFO, None)
+    assert tagger.feed(SOURCE[:100]) == b""
+    assert tagger.flush() == SOURCE[:100]
+    assert not tagger.applied
+
+def test_cover_future_resolved_at_render():
+    """传入封面下载的 Future 时，收到原始文件头后才取结果"""
+    future = Future()
+    tagger = stream_tag.StreamTagger("mp3", INFO, future)
+    assert tagger.feed(SOURCE[:100]) == b""
+    future.set_result(b"\xff\xd8cover")
+    tagger.feed(SOURCE[100:1000])
+    assert tagger.applied and tagger.cover == b"\xff\xd8cover"
+
+def test_failed_cover_future_renders_without_cover():
+    future = Future()
+    future.set_exception(OSError("封面下载失败"))
+    tagger = stream_tag.StreamTagger("mp3", INFO, future)
+    tagger.feed(SOURCE[:1000])
+    assert tagger.applied and tagger.cover is None
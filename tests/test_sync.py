@@ -0,0 +1,56 @@
+import pytest
+
+import main
+
+@pytest.fixture
+def sync(tmp_path, monkeypatch):
+    """替换获取歌单和下载，返回每次同步调用的记录"""
+    calls = {"collection": [], "downloaded": [], "failed": set(), "pruned": []}
+    settings = {**main.DEFAULT_SETTINGS, "folder": str(tmp_path)}
+
+    def fetch_collection(kind, collection_id, settings):
+        return calls["collection"]
+
+    def run_tracks(music_ids, settings, title, source):
+        calls["downloaded"].append(list(music_ids))
+        return {"failed": [music_id for music_id in music_ids if music_id in calls["failed"]]}
+
+    monkeypatch.setattr(main, "fetch_collection", fetch_collection)
+    monkeypatch.setattr(main, "run_tracks", run_tracks)
+    monkeypatch.setattr(main, "prune_tracks", lambda removed, *args: calls["pruned"].append(list(removed)))
+
+    def run(current):
+        calls["collection"] = current
+        return main.sync_collection("playlist", "42", settings)
+
+    run.calls = calls
+    return run
+
+def test_first_sync_downloads_everything(sync):
+    assert sync(["1", "2", "3"]) == {"added": ["1", "2", "3"], "removed": [], "failed": []}
+    assert sync.calls["downloaded"] == [["1", "2", "3"]]
+
+def test_only_changes_are_synced(sync):
+    sync(["1", "2", "3"])
+    result = sync(["2", "3", "4", "5"])
+    assert result == {"added": ["4", "5"], "removed": ["1"], "failed": []}
+    assert sync.calls["downloaded"][-1] == ["4", "5"]
+    assert sync.calls["pruned"] == [["1"]]
+
+def test_unchanged_collection_downloads_nothing(sync):
+    sync(["1", "2"])
+    assert sync(["2", "1"]) == {"added": [], "removed": [], "failed": []}
+    assert len(sync.calls["downloaded"]) == 1
+
+def test_failed_tracks_retried_next_time(sync):
+    """下载失败的歌曲不记入快照"""
+    sync.calls["failed"] = {"2"}
+    assert sync(["1", "2"])["failed"] == ["2"]
+    sync.calls["failed"] = set()
+    assert sync(["1", "2"])["added"] == ["2"]
+
+def test_empty_list_does_not_remove_everything(sync):
+    sync(["1", "2"])
+    assert sync([]) is None
+    assert sync.calls["pruned"] == []
+    assert sync(["1", "2"])["added"] == []